@@ -3,6 +3,7 @@ import os
 
 import aws_cdk as cdk
 
+from components.config_rules import load_config_rules
 from stacks.config_stack import ControlBrokerConsumerExampleConfigStack
 
 app = cdk.App()
@@ -12,6 +13,37 @@ expecting_control_broker_version = "0.10.0"
 ControlBrokerConsumerExampleConfigStack(app, "CBConsumerConfig",
     env=cdk.Environment(account=os.getenv('CDK_DEFAULT_ACCOUNT'), region=os.getenv('CDK_DEFAULT_REGION')),
     control_broker_apigw_url=app.node.try_get_context("control-broker/apigw-url"),
+    batch_evaluation=app.node.try_get_context("control-broker/batch-evaluation/enabled") or False,
+    batch_size=app.node.try_get_context("control-broker/batch-evaluation/batch-size") or 100,
+    batch_max_batching_window_seconds=app.node.try_get_context("control-broker/batch-evaluation/max-batching-window-seconds") or 30,
+    batch_max_concurrency=app.node.try_get_context("control-broker/batch-evaluation/max-concurrency") or 10,
+    state_machine_type=app.node.try_get_context("control-broker/state-machine-type") or "STANDARD",
+    evaluation_topology=app.node.try_get_context("control-broker/evaluation-topology") or "StepFunctions",
+    results_report_readiness=app.node.try_get_context("control-broker/results-report-readiness") or "Poll",
+    results_bucket_name=app.node.try_get_context("control-broker/results-bucket-name"),
+    results_report_wait_timeout_seconds=app.node.try_get_context("control-broker/results-report-wait-timeout-seconds") or 60,
+    compliance_cache=app.node.try_get_context("control-broker/compliance-cache/enabled") is not False,
+    compliance_cache_ttl_seconds=app.node.try_get_context("control-broker/compliance-cache/ttl-seconds") or 300,
+    compliance_cache_max_entries=app.node.try_get_context("control-broker/compliance-cache/max-entries") or 1024,
+    compliance_cache_table=app.node.try_get_context("control-broker/compliance-cache/dynamodb-table") or False,
+    claim_check=app.node.try_get_context("control-broker/claim-check/enabled") or False,
+    claim_check_retention_days=app.node.try_get_context("control-broker/claim-check/retention-days") or 7,
+    evaluation_dedup=app.node.try_get_context("control-broker/evaluation-dedup/enabled") or False,
+    evaluation_dedup_ttl_seconds=app.node.try_get_context("control-broker/evaluation-dedup/ttl-seconds") or 86400,
+    policy_version=app.node.try_get_context("control-broker/policy-version") or expecting_control_broker_version,
+    verdict_store=app.node.try_get_context("control-broker/verdict-store/enabled") or False,
+    evaluation_order_guard=app.node.try_get_context("control-broker/evaluation-order-guard/enabled") or False,
+    control_broker_concurrency=app.node.try_get_context("control-broker/control-broker-concurrency") or 16,
+    control_broker_endpoints=app.node.try_get_context("control-broker/fan-out/endpoints"),
+    verdict_combiner=app.node.try_get_context("control-broker/fan-out/verdict-combiner") or "AllMustPass",
+    fan_out_max_concurrency=app.node.try_get_context("control-broker/fan-out/max-concurrency") or 0,
+    config_rules=load_config_rules(app.node.try_get_context("control-broker/config-rules-file") or "config_rules.json"),
+    performance_profile=app.node.try_get_context("control-broker/performance-profile") or "dev",
+    log_level=app.node.try_get_context("control-broker/logging/level") or "INFO",
+    log_sample_rate=app.node.try_get_context("control-broker/logging/sample-rate") or 0.0,
+    log_payload_max_bytes=app.node.try_get_context("control-broker/logging/max-payload-bytes") or 2048,
+    state_machine_log_level=app.node.try_get_context("control-broker/state-machine-logging/level") or "ERROR",
+    state_machine_include_execution_data=app.node.try_get_context("control-broker/state-machine-logging/include-execution-data") or False,
 )
 
 app.synth()
@@ -0,0 +1,98 @@
+"""Import time and cold start of each deployed handler module, each measured in a fresh interpreter.
+
+import:  loading lambda_function.py, the INIT phase Lambda runs before the first invocation
+clients: creating, on top of the import, every client the module declares, which is what the import
+         itself used to do before clients were created lazily by cb_runtime.clients
+
+The interpreter start and the boto3 import are paid by every handler alike and are reported once.
+
+    python -m benchmarks.bench_cold_start --trials 10
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from utils import paths
+from utils.stats import percentile
+
+HANDLERS = [
+    "invoked_by_config",
+    "sign_apigw_request",
+    "get_resource_config_compliance",
+    "put_evaluations",
+    "requests_get",
+    "wait_for_results_report",
+    "results_report_written",
+    "evaluation_pipeline",
+]
+
+# runs in the fresh interpreter, printing one JSON line
+PROBE = """
+import importlib.util, json, sys, time
+sys.path.append({layer!r})
+start = time.perf_counter()
+import boto3
+from cb_runtime import clients
+runtime = time.perf_counter() - start
+modules = len(sys.modules)
+start = time.perf_counter()
+spec = importlib.util.spec_from_file_location("lambda_function", {path!r})
+module = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(module)
+imported = time.perf_counter() - start
+created_by_import = clients.client.cache_info().currsize
+requests_imported = "requests" in sys.modules
+for c in vars(module).values():
+    if isinstance(c, clients.LazyClient):
+        c.meta
+created = time.perf_counter() - start
+print(json.dumps({{
+    "runtime": runtime,
+    "import": imported,
+    "clients": created,
+    "modules": len(sys.modules) - modules,
+    "requests": requests_imported,
+    "created": created_by_import,
+}}))
+"""
+
+
+def probe(name):
+    code = PROBE.format(
+        layer=str(paths.LAMBDA_LAYERS / "cb_runtime"),
+        path=str(paths.LAMBDA_FUNCTIONS / name / "lambda_function.py"),
+    )
+    env = {**os.environ, "AWS_DEFAULT_REGION": os.environ.get("AWS_DEFAULT_REGION", "us-east-1")}
+    r = subprocess.run([sys.executable, "-c", code], env=env, capture_output=True, text=True, check=True)
+    return json.loads(r.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--trials", type=int, default=10)
+    parser.add_argument("--handlers", nargs="+", default=HANDLERS)
+    args = parser.parse_args()
+
+    runtime = []
+    print(f"cold start per handler module, median of {args.trials} fresh interpreters")
+    for name in args.handlers:
+        trials = [probe(name) for _ in range(args.trials)]
+        runtime += [t["runtime"] * 1000 for t in trials]
+        imported = [t["import"] * 1000 for t in trials]
+        created = [t["clients"] * 1000 for t in trials]
+        print(
+            f"{name:<32}"
+            f"import {statistics.median(imported):7.1f} ms  "
+            f"clients {statistics.median(created):7.1f} ms  "
+            f"modules {trials[0]['modules']:4d}  "
+            f"requests imported {'yes' if trials[0]['requests'] else 'no ':<3}  "
+            f"clients created {trials[0]['created']}"
+        )
+    print(f"{'boto3 and cb_runtime':<32}import {percentile(runtime, 50):7.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,271 @@
+"""End-to-end latency of the ConfigEventProcessing state machine, run offline.
+
+The definition synthesized by config_event_processing_sfn is interpreted in process by utils.asl. Its Task states
+run the real handlers: sign_apigw_request, get_resource_config_compliance, requests_get and put_evaluations.
+Config, Control Broker and the presigned results report are local stubs. Config events, recorded ones from
+--events-file or copies of tests/fixtures/config_event.json, are started at --rate per second, and per-state and
+end-to-end latency percentiles are reported.
+
+--report-delay is how many GETs of each results report find it not yet written, so GetIsCompliant retries.
+Retry intervals are multiplied by --time-scale to keep the run short.
+
+--save writes the percentiles to a JSON file, and --baseline compares the run with one. The command exits 1 when
+any p50 is more than --tolerance slower than the baseline, so it can gate a deploy:
+
+    python -m benchmarks.bench_config_event_processing --events 200 --rate 50 --save baseline.json
+    python -m benchmarks.bench_config_event_processing --events 200 --rate 50 --baseline baseline.json
+"""
+import argparse
+import collections
+import contextlib
+import io
+import itertools
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.bench_evaluation_dedup import config_events as distinct_config_events
+from benchmarks.stubs import StubServer
+from utils import asl, paths
+from utils.stats import percentile
+
+TOGGLED_BOOLEAN_PATH = paths.REPO_ROOT / "dev/tracked_by_config/toggled_boolean.json"
+
+REPORT = {"EvalEngineLambdalith": {"Evaluation": {"IsCompliant": True}}}
+
+HANDLERS = {
+    "lambda_sign_apigw_request": "sign_apigw_request",
+    "lambda_get_resource_config_compliance": "get_resource_config_compliance",
+    "lambda_requests_get": "requests_get",
+    "lambda_put_evaluations": "put_evaluations",
+}
+
+
+class Config:
+    """PutEvaluations and GetComplianceDetailsByResource over the evaluations put so far."""
+
+    def __init__(self, latency):
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.compliance = {}
+
+    def respond(self, path, body):
+        time.sleep(self.latency)
+        request = json.loads(body)
+        if "Evaluations" in request:
+            with self.lock:
+                for evaluation in request["Evaluations"]:
+                    self.compliance[evaluation["ComplianceResourceId"]] = evaluation["ComplianceType"]
+            return 200, {"FailedEvaluations": []}
+        with self.lock:
+            compliance_type = self.compliance.get(request["ResourceId"])
+        if not compliance_type:
+            return 200, {"EvaluationResults": []}
+        return 200, {"EvaluationResults": [{
+            "EvaluationResultIdentifier": {"EvaluationResultQualifier": {"ConfigRuleName": self.config_rule_name}},
+            "ComplianceType": compliance_type,
+        }]}
+
+
+class ControlBroker:
+    """Each evaluation gets its own results report, not written until it has been polled report_delay times."""
+
+    def __init__(self, latency, report_delay):
+        self.latency = latency
+        self.report_delay = report_delay
+        self.lock = threading.Lock()
+        self.ids = itertools.count()
+        self.polls = collections.Counter()
+
+    def respond(self, path, body):
+        if path.startswith("/reports/"):
+            report = path.split("?")[0]
+            with self.lock:
+                self.polls[report] += 1
+                polls = self.polls[report]
+            if polls <= self.report_delay:
+                return 404, {"Error": "NoSuchKey"}
+            return 200, REPORT
+        time.sleep(self.latency)
+        url = f"{self.url}/reports/{next(self.ids)}.json?X-Amz-Signature=abc"
+        return 200, {"Response": {"ControlBrokerEvaluation": {"OutputHandlers": {"OPA": {"PresignedUrl": url}}}}}
+
+
+def synth_state_machine(**kwargs):
+    """The ConfigEventProcessing definition, and the handler each of its FunctionName tokens stands for."""
+    import aws_cdk as core
+
+    from stacks.config_stack import ControlBrokerConsumerExampleConfigStack
+
+    # synthesizing flips the demo's toggled boolean, which is only meant to change on deploy
+    toggled_boolean = TOGGLED_BOOLEAN_PATH.read_text()
+    try:
+        app = core.App(context={"aws:cdk:bundling-stacks": []})
+        stack = ControlBrokerConsumerExampleConfigStack(app, "CBConsumerConfig",
+            control_broker_apigw_url="https://MY_API_ID.execute-api.us-east-1.amazonaws.com/ConfigEvent",
+            **kwargs
+        )
+    finally:
+        TOGGLED_BOOLEAN_PATH.write_text(toggled_boolean)
+
+    functions = {getattr(stack, attribute).function_name: name for attribute, name in HANDLERS.items()}
+    return stack.config_event_processing_definition, functions
+
+
+def load_events(args):
+    if args.events_file:
+        with open(args.events_file) as f:
+            recorded = [json.loads(line) for line in f if line.strip()]
+        return [recorded[i % len(recorded)] for i in range(args.events)]
+    with open(paths.REPO_ROOT / "tests/fixtures/config_event.json") as f:
+        template = json.load(f)
+    return distinct_config_events(template, args.events)
+
+
+def run(definition, tasks, inputs, *, rate, workers, time_scale):
+    """Start one execution per input at rate per second, returning the finished executions."""
+
+    def execute(input):
+        return asl.Execution(definition, tasks=tasks, time_scale=time_scale).run(input)
+
+    start = time.perf_counter()
+    futures = []
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for i, input in enumerate(inputs):
+            delay = start + i / rate - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            futures.append(pool.submit(execute, input))
+        executions = [f.result() for f in futures]
+    return executions, time.perf_counter() - start
+
+
+def summarize(executions):
+    by_state = collections.defaultdict(list)
+    for execution in executions:
+        for entry in execution.history:
+            by_state[entry["State"]].append(entry["Seconds"] * 1000)
+    by_state["EndToEnd"] = [e.seconds * 1000 for e in executions]
+    return {
+        name: {
+            "count": len(latencies),
+            "p50": percentile(latencies, 50),
+            "p90": percentile(latencies, 90),
+            "p99": percentile(latencies, 99),
+            "mean": statistics.mean(latencies),
+        }
+        for name, latencies in by_state.items()
+    }
+
+
+def compare(summary, baseline, tolerance):
+    regressions = []
+    for name, stats in summary.items():
+        before = baseline.get(name)
+        if before and stats["p50"] > before["p50"] * (1 + tolerance):
+            regressions.append(f'{name} p50 {before["p50"]:.2f} -> {stats["p50"]:.2f} ms')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=100)
+    parser.add_argument("--events-file", help="recorded Config events, one JSON document per line")
+    parser.add_argument("--rate", type=float, default=20, help="executions started per second")
+    parser.add_argument("--workers", type=int, default=32, help="executions in flight at once")
+    parser.add_argument("--batch-size", type=int, default=0, help="run the batch definition with this many events per execution")
+    parser.add_argument("--control-broker-latency", type=float, default=0.05)
+    parser.add_argument("--config-latency", type=float, default=0.01)
+    parser.add_argument("--report-delay", type=int, default=1, help="GETs of each report before it is written")
+    parser.add_argument("--time-scale", type=float, default=0.001, help="multiplier of Retry intervals")
+    parser.add_argument("--save", help="write the percentiles to this JSON file")
+    parser.add_argument("--baseline", help="compare the percentiles with this JSON file")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="p50 slowdown over the baseline that fails the run")
+    args = parser.parse_args()
+
+    for k, v in {
+        "AWS_DEFAULT_REGION": "us-east-1",
+        "AWS_ACCESS_KEY_ID": "benchmark",
+        "AWS_SECRET_ACCESS_KEY": "benchmark",
+        "LogLevel": "WARNING",
+    }.items():
+        os.environ.setdefault(k, v)
+
+    batch_evaluation = args.batch_size > 0
+    definition, functions = synth_state_machine(batch_evaluation=batch_evaluation)
+    events = load_events(args)
+
+    config = Config(args.config_latency)
+    config.config_rule_name = events[0]["configRuleName"]
+    control_broker = ControlBroker(args.control_broker_latency, args.report_delay)
+
+    with contextlib.ExitStack() as stack:
+        os.environ["AWS_ENDPOINT_URL_CONFIG_SERVICE"] = stack.enter_context(StubServer(config.respond)).url
+        control_broker.url = stack.enter_context(StubServer(control_broker.respond)).url
+        os.environ["ControlBrokerInvokeUrl"] = f"{control_broker.url}/ConfigEvent"
+
+        from tests.lambdas import load_lambda
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            handlers = {function_name: load_lambda(name) for function_name, name in functions.items()}
+            tasks = {function_name: handler.lambda_handler for function_name, handler in handlers.items()}
+
+            # created before the timer, rather than by the first executions racing through the default boto3 session
+            from cb_runtime import clients
+
+            for handler in handlers.values():
+                for value in vars(handler).values():
+                    if isinstance(value, clients.LazyClient):
+                        clients.client(value.service_name)
+
+            if batch_evaluation:
+                inputs = [
+                    {"ConfigEvents": events[i:i + args.batch_size]}
+                    for i in range(0, len(events), args.batch_size)
+                ]
+            else:
+                inputs = events
+
+            executions, seconds = run(
+                definition,
+                tasks,
+                inputs,
+                rate=args.rate,
+                workers=args.workers,
+                time_scale=args.time_scale,
+            )
+
+    summary = summarize(executions)
+    failed = [e for e in executions if e.status != "SUCCEEDED"]
+
+    print(
+        f"ConfigEventProcessing, {len(events)} events in {len(executions)} executions, "
+        f"{len(events) / seconds:.1f} events/s, failed executions {len(failed)}"
+    )
+    for name, stats in summary.items():
+        print(
+            f"{name:<38}n {stats['count']:5d}  p50 {stats['p50']:8.2f} ms  "
+            f"p90 {stats['p90']:8.2f} ms  p99 {stats['p99']:8.2f} ms"
+        )
+    for execution in failed[:3]:
+        print(f"failed: {execution.error} {execution.cause}")
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(summary, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(summary, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"regression: {regression}")
+        if regressions or failed:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""Throughput of signed Control Broker POSTs: the blocking client one at a time vs the asyncio client.
+
+blocking: sign_apigw_request.post_config_event over its keep-alive session, one event after another
+async:    cb_runtime.control_broker_async at each --concurrency level
+
+--latency stands in for the time Control Broker takes to answer each request.
+
+    python -m benchmarks.bench_control_broker_async --events 500 --latency 0.05 --concurrency 8 32 128
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import time
+
+from benchmarks.stubs import StubServer
+from utils import paths
+
+CONTROL_BROKER_RESPONSE = {
+    "Response": {
+        "ControlBrokerEvaluation": {
+            "OutputHandlers": {
+                "OPA": {"PresignedUrl": "https://results.s3.amazonaws.com/report.json"}
+            }
+        }
+    }
+}
+
+
+def report(name, events, seconds, failed):
+    print(f"{name:<14}{events / seconds:9.1f} events/s  {seconds:7.2f} s  failed {failed}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=500)
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds per Control Broker response")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[8, 32, 128])
+    parser.add_argument("--blocking-events", type=int, default=50, help="events for the slower blocking run")
+    args = parser.parse_args()
+
+    for k, v in {
+        "AWS_DEFAULT_REGION": "us-east-1",
+        "AWS_ACCESS_KEY_ID": "benchmark",
+        "AWS_SECRET_ACCESS_KEY": "benchmark",
+    }.items():
+        os.environ.setdefault(k, v)
+
+    with open(paths.REPO_ROOT / "tests/fixtures/config_event.json") as f:
+        config_event = json.load(f)
+
+    def respond(path, body):
+        time.sleep(args.latency)
+        return 200, CONTROL_BROKER_RESPONSE
+
+    with StubServer(respond) as server:
+        full_invoke_url = f"{server.url}/ConfigEvent"
+        os.environ["ControlBrokerInvokeUrl"] = full_invoke_url
+
+        from tests.lambdas import load_lambda
+        from cb_runtime import control_broker_async
+
+        print(f"Control Broker POSTs, latency {args.latency}s")
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            sign_apigw_request = load_lambda("sign_apigw_request")
+            start = time.perf_counter()
+            failed = sum(
+                not sign_apigw_request.post_config_event(config_event=config_event)
+                for _ in range(args.blocking_events)
+            )
+            seconds = time.perf_counter() - start
+        report("blocking", args.blocking_events, seconds, failed)
+
+        for concurrency in args.concurrency:
+            with contextlib.redirect_stdout(io.StringIO()):
+                start = time.perf_counter()
+                responses = control_broker_async.post_config_events(
+                    [config_event] * args.events,
+                    full_invoke_url=full_invoke_url,
+                    concurrency=concurrency,
+                )
+                seconds = time.perf_counter() - start
+            report(f"async x{concurrency}", args.events, seconds, responses.count(False))
+
+
+if __name__ == "__main__":
+    main()
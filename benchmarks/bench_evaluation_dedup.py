@@ -0,0 +1,156 @@
+"""Per-event latency of invoked_by_config with evaluation dedup, first delivery vs re-delivery.
+
+cold: every configuration item is new, so the Lambdalith pipeline signs, posts to Control Broker, fetches the
+      report, puts the evaluation and verifies it, recording the verdict by content hash
+warm: the same configuration items are delivered again, so their verdicts are replayed straight to PutEvaluations
+
+DynamoDB, Config, Control Broker and the results bucket are local stubs; --control-broker-latency stands in for
+the time Control Broker takes to evaluate the policy.
+
+    python -m benchmarks.bench_evaluation_dedup --events 200
+"""
+import argparse
+import contextlib
+import copy
+import io
+import json
+import os
+import statistics
+import time
+
+from benchmarks.stubs import StubServer
+from utils import paths
+from utils.stats import percentile
+
+REPORT = {"EvalEngineLambdalith": {"Evaluation": {"IsCompliant": True}}}
+
+
+class DynamoDB:
+    """GetItem and PutItem on one in-memory table."""
+
+    def __init__(self):
+        self.items = {}
+        self.hits = 0
+
+    def respond(self, path, body):
+        request = json.loads(body)
+        if "Item" in request:
+            self.items[request["Item"]["ContentHash"]["S"]] = request["Item"]
+            return 200, {}
+        item = self.items.get(request["Key"]["ContentHash"]["S"])
+        self.hits += bool(item)
+        return 200, {"Item": item} if item else {}
+
+
+class Config:
+    """PutEvaluations and GetComplianceDetailsByResource, always COMPLIANT."""
+
+    def __init__(self, config_rule_name):
+        self.config_rule_name = config_rule_name
+
+    def respond(self, path, body):
+        request = json.loads(body)
+        if "Evaluations" in request:
+            return 200, {"FailedEvaluations": []}
+        return 200, {"EvaluationResults": [{
+            "EvaluationResultIdentifier": {"EvaluationResultQualifier": {"ConfigRuleName": self.config_rule_name}},
+            "ComplianceType": "COMPLIANT",
+        }]}
+
+
+class ControlBroker:
+
+    def __init__(self, latency):
+        self.latency = latency
+        self.calls = 0
+
+    def respond(self, path, body):
+        if path.startswith("/report"):
+            return 200, REPORT
+        self.calls += 1
+        time.sleep(self.latency)
+        return 200, {"Response": {"ControlBrokerEvaluation": {"OutputHandlers": {"OPA": {"PresignedUrl": f"{self.url}/report"}}}}}
+
+
+def config_events(template, count):
+    # one distinct configuration item per resource
+    events = []
+    for i in range(count):
+        invoking_event = json.loads(template["invokingEvent"])
+        configuration_item = invoking_event["configurationItem"]
+        configuration_item["resourceId"] = f"{configuration_item['resourceId']}-{i}"
+        configuration_item["configuration"]["VisibilityTimeout"] = i
+        events.append({**copy.deepcopy(template), "invokingEvent": json.dumps(invoking_event)})
+    return events
+
+
+def timed(handler, events):
+    latencies = []
+    for event in events:
+        start = time.perf_counter()
+        handler(event, None)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+def report(name, latencies, control_broker_calls, hits):
+    print(
+        f"{name:<6}"
+        f"p50 {percentile(latencies, 50):8.2f} ms  "
+        f"p99 {percentile(latencies, 99):8.2f} ms  "
+        f"mean {statistics.mean(latencies):8.2f} ms  "
+        f"Control Broker calls {control_broker_calls:5d}  "
+        f"hit rate {hits / len(latencies):5.2f}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=200)
+    parser.add_argument("--control-broker-latency", type=float, default=0.05, help="seconds per evaluation")
+    args = parser.parse_args()
+
+    for k, v in {
+        "AWS_DEFAULT_REGION": "us-east-1",
+        "AWS_ACCESS_KEY_ID": "benchmark",
+        "AWS_SECRET_ACCESS_KEY": "benchmark",
+    }.items():
+        os.environ.setdefault(k, v)
+
+    with open(paths.REPO_ROOT / "tests/fixtures/config_event.json") as f:
+        template = json.load(f)
+
+    events = config_events(template, args.events)
+
+    dynamodb = DynamoDB()
+    config = Config(template["configRuleName"])
+    control_broker = ControlBroker(args.control_broker_latency)
+
+    with contextlib.ExitStack() as stack:
+        for name, stub in [("DYNAMODB", dynamodb), ("CONFIG_SERVICE", config)]:
+            server = stack.enter_context(StubServer(stub.respond))
+            os.environ[f"AWS_ENDPOINT_URL_{name}"] = server.url
+        control_broker.url = stack.enter_context(StubServer(control_broker.respond)).url
+        os.environ["ControlBrokerInvokeUrl"] = f"{control_broker.url}/ConfigEvent"
+        os.environ["EvaluationDedupTableName"] = "EvaluationDedup"
+        os.environ["ControlBrokerPolicyVersion"] = "0.10.0"
+
+        from tests.lambdas import load_lambda
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            invoked_by_config = load_lambda("invoked_by_config")
+            evaluation_pipeline = load_lambda("evaluation_pipeline")
+            # the Lambdalith pipeline in process, instead of an asynchronous invoke
+            invoked_by_config.start_evaluation = lambda input: evaluation_pipeline.lambda_handler(input, None)
+
+            cold = timed(invoked_by_config.lambda_handler, events)
+            cold_calls, cold_hits = control_broker.calls, dynamodb.hits
+            warm = timed(invoked_by_config.lambda_handler, events)
+
+    print(f"evaluation dedup, {args.events} configuration items, Control Broker latency {args.control_broker_latency}s")
+    report("cold", cold, cold_calls, cold_hits)
+    report("warm", warm, control_broker.calls - cold_calls, dynamodb.hits - cold_hits)
+
+
+if __name__ == "__main__":
+    main()
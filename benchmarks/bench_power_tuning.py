@@ -0,0 +1,194 @@
+"""Memory size recommendations per handler, in the manner of AWS Lambda Power Tuning, run offline.
+
+Each handler runs in process against local Config, Step Functions and Control Broker stubs: one cold invocation,
+including the import of lambda_function.py, then --invocations warm ones, each with a distinct Config event.
+Every invocation is split into the CPU time of the handler's thread and the rest, spent waiting on the stubs.
+Modules already imported by an earlier handler, boto3 among them, are not imported again by a later cold one.
+
+Lambda allocates CPU in proportion to memory, a full vCPU at 1769 MB, and the handlers are single threaded, so at
+each memory size M of --memory-sizes an invocation is modeled as
+
+    duration(M) = wait + cpu * 1769 / min(M, 1769)
+
+where wait is the measured wait plus --latency, the round trip to the real services the stubs stand in for.
+Cost is billed per GB-second of duration, rounded up to the millisecond, plus the request charge. The recommended
+size is the cheapest one whose p50 warm duration is within --tolerance of the fastest size's, printed as a
+performance profile for performance_profiles.json:
+
+    python -m benchmarks.bench_power_tuning --invocations 200 --tolerance 0.1
+
+CPU speed differs between this machine and Lambda, so --cpu-scale multiplies the measured CPU time.
+"""
+import argparse
+import contextlib
+import io
+import itertools
+import json
+import math
+import os
+import time
+
+from benchmarks.bench_config_event_processing import Config, ControlBroker
+from benchmarks.bench_evaluation_dedup import config_events
+from benchmarks.stubs import StubServer
+from utils import paths
+from utils.stats import percentile
+
+SFN_ARN = "arn:aws:states:us-east-1:123456789012:stateMachine:ConfigEventProcessing"
+
+# memory at which Lambda allocates one full vCPU
+FULL_VCPU_MB = 1769
+
+# us-east-1, x86_64
+PRICE_PER_GB_SECOND = 0.0000166667
+PRICE_PER_REQUEST = 0.0000002
+
+# handler module, and the construct id a performance profile tunes it by
+FUNCTIONS = {
+    "invoked_by_config": "InvokedByConfig",
+    "sign_apigw_request": "SignApigwRequest",
+    "requests_get": "RequestsGet",
+    "put_evaluations": "PutEvaluations",
+    "get_resource_config_compliance": "GetResourceConfigCompliance",
+}
+
+
+class StepFunctions:
+    """StartExecution, accepting every input."""
+
+    def __init__(self):
+        self.ids = itertools.count()
+
+    def respond(self, path, body):
+        return 200, {"executionArn": f"{SFN_ARN.replace(':stateMachine:', ':execution:')}:{next(self.ids)}", "startDate": time.time()}
+
+
+def handler_events(name, event, report_url):
+    """The payload ConfigEventProcessing passes the handler, for one Config event."""
+    invoking_event = json.loads(event["invokingEvent"])
+    return {
+        "invoked_by_config": event,
+        "sign_apigw_request": event,
+        "requests_get": {"Url": report_url, "Projection": ["EvalEngineLambdalith.Evaluation.IsCompliant"]},
+        "put_evaluations": {
+            "Compliance": True,
+            "ConfigResultToken": event["resultToken"],
+            "ResourceId": invoking_event["configurationItem"]["resourceId"],
+            "ResourceType": invoking_event["configurationItem"]["resourceType"],
+            "ConfigRuleName": event["configRuleName"],
+        },
+        "get_resource_config_compliance": {"ConfigEvent": event, "ExpectedComplianceStatus": True},
+    }[name]
+
+
+def measure(call):
+    """(wall seconds, CPU seconds of this thread) of one call"""
+    wall, cpu = time.perf_counter(), time.thread_time()
+    call()
+    return time.perf_counter() - wall, time.thread_time() - cpu
+
+
+def invocations(name, events, report_url):
+    """The cold invocation, import included, then the warm ones."""
+    from tests.lambdas import load_lambda
+
+    handler = {}
+
+    def cold():
+        handler["module"] = load_lambda(name)
+        handler["module"].lambda_handler(handler_events(name, events[0], report_url), None)
+
+    measured = [measure(cold)]
+    for event in events[1:]:
+        payload = handler_events(name, event, report_url)
+        measured.append(measure(lambda: handler["module"].lambda_handler(payload, None)))
+    return measured[0], measured[1:]
+
+
+def modeled(wall, cpu, memory_size, *, latency, cpu_scale):
+    """Duration in seconds at memory_size, from one local invocation"""
+    wait = max(wall - cpu, 0) + latency
+    return wait + cpu * cpu_scale * FULL_VCPU_MB / min(memory_size, FULL_VCPU_MB)
+
+
+def cost(duration, memory_size):
+    billed = math.ceil(duration * 1000) / 1000
+    return billed * memory_size / 1024 * PRICE_PER_GB_SECOND + PRICE_PER_REQUEST
+
+
+def tune(cold, warm, memory_sizes, *, latency, cpu_scale, tolerance):
+    """Per memory size its p50 warm duration, cold duration and cost per million invocations, and the recommendation"""
+    sizes = {}
+    for memory_size in memory_sizes:
+        durations = [modeled(wall, cpu, memory_size, latency=latency, cpu_scale=cpu_scale) for wall, cpu in warm]
+        sizes[memory_size] = {
+            "p50": percentile(durations, 50),
+            "cold": modeled(*cold, memory_size, latency=latency, cpu_scale=cpu_scale),
+            "cost": sum(cost(d, memory_size) for d in durations) / len(durations) * 1_000_000,
+        }
+    fastest = min(s["p50"] for s in sizes.values())
+    within = [m for m, s in sizes.items() if s["p50"] <= fastest * (1 + tolerance)]
+    return sizes, min(within, key=lambda m: (sizes[m]["cost"], m))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--invocations", type=int, default=100, help="warm invocations per handler")
+    parser.add_argument("--handlers", nargs="+", default=list(FUNCTIONS), choices=list(FUNCTIONS))
+    parser.add_argument("--memory-sizes", type=int, nargs="+", default=[128, 256, 512, 1024, 1769, 3008])
+    parser.add_argument("--latency", type=float, default=0.02, help="seconds of service round trip added per invocation")
+    parser.add_argument("--cpu-scale", type=float, default=1.0, help="multiplier of the measured CPU time")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="slowdown over the fastest size worth its saving")
+    args = parser.parse_args()
+
+    for k, v in {
+        "AWS_DEFAULT_REGION": "us-east-1",
+        "AWS_ACCESS_KEY_ID": "benchmark",
+        "AWS_SECRET_ACCESS_KEY": "benchmark",
+        "LogLevel": "WARNING",
+    }.items():
+        os.environ.setdefault(k, v)
+    os.environ["ConfigEventProcessingSfnArn"] = SFN_ARN
+
+    with open(paths.REPO_ROOT / "tests/fixtures/config_event.json") as f:
+        template = json.load(f)
+    events = config_events(template, args.invocations + 1)
+
+    config = Config(latency=0)
+    config.config_rule_name = template["configRuleName"]
+    control_broker = ControlBroker(latency=0, report_delay=0)
+
+    profile = {}
+
+    with contextlib.ExitStack() as stack:
+        os.environ["AWS_ENDPOINT_URL_CONFIG_SERVICE"] = stack.enter_context(StubServer(config.respond)).url
+        os.environ["AWS_ENDPOINT_URL_SFN"] = stack.enter_context(StubServer(StepFunctions().respond)).url
+        control_broker.url = stack.enter_context(StubServer(control_broker.respond)).url
+        os.environ["ControlBrokerInvokeUrl"] = f"{control_broker.url}/ConfigEvent"
+        report_url = f"{control_broker.url}/reports/0.json?X-Amz-Signature=abc"
+
+        print(f"modeled duration per memory size, {args.invocations} warm invocations, {args.latency * 1000:.0f} ms service latency")
+        for name in args.handlers:
+            with contextlib.redirect_stdout(io.StringIO()):
+                cold, warm = invocations(name, events, report_url)
+            sizes, recommended = tune(
+                cold,
+                warm,
+                args.memory_sizes,
+                latency=args.latency,
+                cpu_scale=args.cpu_scale,
+                tolerance=args.tolerance,
+            )
+            profile[FUNCTIONS[name]] = {"MemorySize": recommended}
+            print(f"{name}: CPU {percentile([c for _, c in warm], 50) * 1000:.2f} ms of {percentile([w for w, _ in warm], 50) * 1000:.2f} ms p50 warm locally")
+            for memory_size, s in sizes.items():
+                print(
+                    f"  {memory_size:5d} MB  p50 {s['p50'] * 1000:8.2f} ms  cold {s['cold'] * 1000:8.2f} ms  "
+                    f"${s['cost']:7.3f} per million{'  <- recommended' if memory_size == recommended else ''}"
+                )
+
+    print(json.dumps(profile, indent=4))
+
+
+if __name__ == "__main__":
+    main()
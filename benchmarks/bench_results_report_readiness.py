@@ -0,0 +1,150 @@
+"""End-to-end wait for the OPA results report: GetIsCompliant polling vs task token notification.
+
+A simulated report writer makes each report readable after a lognormal delay. Both strategies fetch
+it through requests_get against a local stub of the presigned URL:
+
+poll:  GetIsCompliant's Retry schedule, 1s interval, BackoffRate 2.0, 8 retries
+event: WaitForResultsReport checks once, then waits for the writer's notification, then fetches once,
+       falling back to the poll schedule after the wait timeout
+
+Latencies are reported in simulated seconds; --time-scale shrinks them to keep the run short. Lambda
+and state transition overheads are not modelled, they add per attempt and so further favour event.
+
+    python -m benchmarks.bench_results_report_readiness --trials 200
+"""
+import argparse
+import contextlib
+import io
+import math
+import os
+import random
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from benchmarks.stubs import StubServer
+from utils.stats import percentile
+
+REPORT = {"EvalEngineLambdalith": {"Evaluation": {"IsCompliant": True}}}
+
+POLL_INTERVAL_SECONDS = 1
+POLL_MAX_ATTEMPTS = 8
+POLL_BACKOFF_RATE = 2.0
+
+
+class Simulation:
+
+    def __init__(self, *, trials, time_scale, median_write_delay, notification_latency, wait_timeout, seed):
+        rng = random.Random(seed)
+        self.write_delays = [rng.lognormvariate(math.log(median_write_delay), 0.75) for _ in range(trials)]
+        self.time_scale = time_scale
+        self.notification_latency = notification_latency
+        self.wait_timeout = wait_timeout
+        self.ready_at = {}
+        self.http = requests.Session()
+
+    def respond(self, path, body):
+        ready_at = self.ready_at.get(path.rsplit("/", 1)[-1])
+        if ready_at is not None and time.perf_counter() >= ready_at:
+            return 200, REPORT
+        return 404, {"Error": "NoSuchKey"}
+
+    def sleep(self, seconds):
+        time.sleep(seconds * self.time_scale)
+
+    def start_writer(self, trial, started):
+        # the report becomes readable after its write delay, its S3 event arrives after the notification latency
+        written = threading.Event()
+        ready_at = started + self.write_delays[trial] * self.time_scale
+        self.ready_at[str(trial)] = ready_at
+        notify_in = max(0, ready_at - time.perf_counter()) + self.notification_latency * self.time_scale
+        threading.Timer(notify_in, written.set).start()
+        return written
+
+    def poll(self, url, gets):
+        for attempt in range(POLL_MAX_ATTEMPTS + 1):
+            gets.append(url)
+            if self.requests_get.requests_get(url, http=self.http):
+                return True
+            if attempt < POLL_MAX_ATTEMPTS:
+                self.sleep(POLL_INTERVAL_SECONDS * POLL_BACKOFF_RATE ** attempt)
+        return False
+
+    def run_poll(self, trial):
+        started = time.perf_counter()
+        self.start_writer(trial, started)
+        gets = []
+        self.poll(f"{self.url}/report/{trial}", gets)
+        return (time.perf_counter() - started) / self.time_scale, len(gets)
+
+    def run_event(self, trial):
+        started = time.perf_counter()
+        written = self.start_writer(trial, started)
+        url = f"{self.url}/report/{trial}"
+        gets = [url]
+        if not self.requests_get.requests_get(url, http=self.http):
+            if written.wait(self.wait_timeout * self.time_scale):
+                gets.append(url)
+                self.requests_get.requests_get(url, http=self.http)
+            else:
+                self.poll(url, gets)
+        return (time.perf_counter() - started) / self.time_scale, len(gets)
+
+
+def report(name, results):
+    latencies = [latency for latency, _ in results]
+    gets = [count for _, count in results]
+    print(
+        f"{name:<6}"
+        f"p50 {percentile(latencies, 50):7.2f} s  "
+        f"p90 {percentile(latencies, 90):7.2f} s  "
+        f"p99 {percentile(latencies, 99):7.2f} s  "
+        f"mean {statistics.mean(latencies):7.2f} s  "
+        f"GETs/report {statistics.mean(gets):5.2f}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--trials", type=int, default=200)
+    parser.add_argument("--time-scale", type=float, default=0.1, help="real seconds per simulated second")
+    parser.add_argument("--median-write-delay", type=float, default=3.0, help="simulated seconds")
+    parser.add_argument("--notification-latency", type=float, default=0.5, help="simulated seconds")
+    parser.add_argument("--wait-timeout", type=float, default=60, help="WaitForResultsReport TimeoutSeconds")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+
+    from tests.lambdas import load_lambda
+
+    simulation = Simulation(
+        trials=args.trials,
+        time_scale=args.time_scale,
+        median_write_delay=args.median_write_delay,
+        notification_latency=args.notification_latency,
+        wait_timeout=args.wait_timeout,
+        seed=args.seed,
+    )
+
+    with StubServer(simulation.respond) as server, contextlib.redirect_stdout(io.StringIO()):
+        simulation.url = server.url
+        simulation.requests_get = load_lambda("requests_get")
+        with ThreadPoolExecutor(max_workers=32) as pool:
+            poll_results = list(pool.map(simulation.run_poll, range(args.trials)))
+        with ThreadPoolExecutor(max_workers=32) as pool:
+            event_results = list(pool.map(simulation.run_event, range(args.trials)))
+
+    print(
+        f"results report readiness, {args.trials} reports, "
+        f"median write delay {args.median_write_delay}s, notification latency {args.notification_latency}s"
+    )
+    report("poll", poll_results)
+    report("event", event_results)
+
+
+if __name__ == "__main__":
+    main()
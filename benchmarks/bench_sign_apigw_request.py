@@ -0,0 +1,110 @@
+"""Per-call latency of sign_apigw_request against a local stub Control Broker.
+
+cold: what every invocation paid before, a new connection and a new signer per call
+warm: the module-level keep-alive session and cached signer reused by warm invocations
+
+    python -m benchmarks.bench_sign_apigw_request --iterations 200 --tls
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import statistics
+import subprocess
+import tempfile
+import time
+
+from benchmarks.stubs import StubServer, percentile
+from utils import paths
+
+CONTROL_BROKER_RESPONSE = {
+    "Response": {
+        "ControlBrokerEvaluation": {
+            "OutputHandlers": {
+                "OPA": {"PresignedUrl": "https://results.s3.amazonaws.com/report.json"}
+            }
+        }
+    }
+}
+
+
+def self_signed_certificate(directory):
+    cert, key = os.path.join(directory, "cert.pem"), os.path.join(directory, "key.pem")
+    subprocess.run(
+        [
+            "openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1",
+            "-keyout", key, "-out", cert, "-subj", "/CN=127.0.0.1",
+            "-addext", "subjectAltName=IP:127.0.0.1",
+        ],
+        check=True,
+        capture_output=True,
+    )
+    return cert, key
+
+
+def timed_calls(call, iterations):
+    latencies = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        call()
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+def report(name, latencies):
+    print(
+        f"{name:<6}"
+        f"mean {statistics.mean(latencies):8.3f} ms  "
+        f"p50 {percentile(latencies, 50):8.3f} ms  "
+        f"p90 {percentile(latencies, 90):8.3f} ms  "
+        f"p99 {percentile(latencies, 99):8.3f} ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--tls", action="store_true", help="serve HTTPS with a throwaway self-signed certificate")
+    args = parser.parse_args()
+
+    os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+    os.environ.setdefault("AWS_ACCESS_KEY_ID", "benchmark")
+    os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "benchmark")
+
+    with open(paths.REPO_ROOT / "tests/fixtures/config_event.json") as f:
+        config_event = json.load(f)
+
+    with tempfile.TemporaryDirectory() as directory, contextlib.ExitStack() as stack:
+        certificate = self_signed_certificate(directory) if args.tls else None
+        if certificate:
+            os.environ["REQUESTS_CA_BUNDLE"] = certificate[0]
+
+        server = stack.enter_context(StubServer(lambda path, body: (200, CONTROL_BROKER_RESPONSE), certificate=certificate))
+        os.environ["ControlBrokerInvokeUrl"] = f"{server.url}/ConfigEvent"
+
+        from tests.lambdas import load_lambda
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            sign_apigw_request = load_lambda("sign_apigw_request")
+
+            def cold():
+                sign_apigw_request.control_broker.signers.clear()
+                sign_apigw_request.get_host.cache_clear()
+                sign_apigw_request.post_config_event(config_event=config_event, http=sign_apigw_request.new_http_session())
+
+            def warm():
+                sign_apigw_request.post_config_event(config_event=config_event)
+
+            warm()
+            cold_latencies = timed_calls(cold, args.iterations)
+            warm_latencies = timed_calls(warm, args.iterations)
+
+    print(f"sign_apigw_request.post_config_event, {args.iterations} calls, {'https' if args.tls else 'http'}")
+    report("cold", cold_latencies)
+    report("warm", warm_latencies)
+    print(f"warm/cold mean: {statistics.mean(warm_latencies) / statistics.mean(cold_latencies):.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,43 +1,72 @@
 import builtins
-from typing import Dict
-from aws_cdk import aws_config, aws_lambda, Duration, aws_stepfunctions
+import json
+from typing import Dict, List
+
+from aws_cdk import aws_config, aws_lambda
 from constructs import Construct
-from utils import paths
+
+DEFAULT_CONFIG_RULES = [
+    {
+        "Name": "SQS-PoC",
+        "ResourceTypes": ["AWS::SQS::Queue"],
+    },
+]
+
 
 class ControlBrokerConfigRule(Construct):
-    """L3 construct Config rule that calls the Control Broker on resource changes."""
+    """L3 construct Config rule evaluated by the stack's shared evaluation function.
+
+    Every rule triggers the same function, so a rule adds only its AWS::Config::ConfigRule:
+    no lambda, no state machine and no cold start of its own.
+    """
 
     def __init__(
         self,
         scope: Construct,
         id: builtins.str,
-        control_broker_statemachine: aws_stepfunctions.StateMachine,
-        rule_scope: aws_config.RuleScope,
-        lambda_function_kwargs: Dict = dict(
-            memory_size=512,
-            timeout=Duration.seconds(60),
-        ),
+        evaluation_function: aws_lambda.IFunction,
+        resource_types: List[str],
+        input_parameters: Dict = None,
+        config_rule_name: str = None,
+        description: str = None,
     ):
         super().__init__(scope, id)
-        self.custom_config_lambda_fn = aws_lambda.Function(
-            self,
-            f"{id}CustomLambdaFn",
-            code=aws_lambda.Code.from_asset(str(paths.LAMBDA_FUNCTIONS / 'custom_config')),
-            handler='lambda_function.lambda_handler',
-            runtime=aws_lambda.Runtime.PYTHON_3_9,
-            environment=dict(
-                ProcessingSfnArn=control_broker_statemachine.state_machine_arn
-            ),
-            **lambda_function_kwargs
-        )
-        control_broker_statemachine.grant_start_execution(self.custom_config_lambda_fn)
-        control_broker_statemachine.grant_start_sync_execution(self.custom_config_lambda_fn)
 
         self.custom_config_rule = aws_config.CustomRule(
             self,
-            f"{id}CustomConfigRule",
-            rule_scope=rule_scope,
-            lambda_function=self.custom_config_lambda_fn,
+            "Rule",
+            config_rule_name=config_rule_name,
+            description=description,
+            rule_scope=aws_config.RuleScope.from_resources([
+                aws_config.ResourceType.of(resource_type) for resource_type in resource_types
+            ]),
+            lambda_function=evaluation_function,
             configuration_changes=True,
+            # Config passes every parameter value as a string
+            input_parameters={
+                k: v if isinstance(v, str) else json.dumps(v)
+                for k, v in (input_parameters or {}).items()
+            } or None,
         )
 
+    @property
+    def config_rule_name(self):
+        return self.custom_config_rule.config_rule_name
+
+
+def validate_config_rules(config_rules: List[Dict]):
+    names = [rule.get("Name") for rule in config_rules]
+    if not config_rules:
+        raise ValueError("config_rules must declare at least one rule")
+    if not all(names) or len(set(names)) != len(names):
+        raise ValueError(f"config_rules need unique names, not {names}")
+    for rule in config_rules:
+        if not rule.get("ResourceTypes"):
+            raise ValueError(f'config rule {rule["Name"]} needs ResourceTypes')
+    return config_rules
+
+
+def load_config_rules(path):
+    """Config rules declared in a JSON file, a list of Name, ResourceTypes and optional Parameters."""
+    with open(path) as f:
+        return validate_config_rules(json.load(f))
@@ -1,58 +1,386 @@
 import json
-from typing import List
 
 from aws_cdk import (
+    BundlingOptions,
+    DockerVolume,
     Duration,
     Stack,
     RemovalPolicy,
     aws_lambda,
-    aws_config,
+    aws_applicationautoscaling,
     aws_sqs,
     aws_iam,
     aws_stepfunctions,
     aws_logs,
     aws_s3,
+    aws_events,
     aws_events_targets,
-    aws_lambda_python_alpha, #expirmental
+    aws_dynamodb,
+    aws_cloudwatch,
+    aws_lambda_event_sources,
 )
 from constructs import Construct
-from utils import paths
+from components.config_rules import DEFAULT_CONFIG_RULES, ControlBrokerConfigRule, validate_config_rules
+from utils import lambda_layers, paths
 
 
 class ControlBrokerConsumerExampleConfigStack(Stack):
 
+    # how the verdicts of fanned out endpoints combine: the verdict, when any of them is the value
+    VERDICT_COMBINERS = {
+        "AllMustPass": ("AnyNonCompliant", False),
+        "AnyMustPass": ("AnyCompliant", True),
+    }
+    
+    # functions a performance profile can tune, by construct id
+    PERFORMANCE_PROFILE_FUNCTIONS = (
+        "SignApigwRequest",
+        "RequestsGet",
+        "PutEvaluations",
+        "GetResourceConfigCompliance",
+        "WaitForResultsReport",
+        "ResultsReportWritten",
+        "EvaluationPipeline",
+        "InvokedByConfig",
+        "VerdictChanges",
+    )
+
     def __init__(self,
         scope: Construct,
         construct_id: str,
         control_broker_apigw_url:str,
+        batch_evaluation:bool = False,
+        batch_size:int = 100,
+        batch_max_batching_window_seconds:int = 30,
+        batch_max_concurrency:int = 10,
+        state_machine_type:str = "STANDARD",
+        evaluation_topology:str = "StepFunctions",
+        results_report_readiness:str = "Poll",
+        results_bucket_name:str = None,
+        results_report_wait_timeout_seconds:int = 60,
+        compliance_cache:bool = True,
+        compliance_cache_ttl_seconds:int = 300,
+        compliance_cache_max_entries:int = 1024,
+        compliance_cache_table:bool = False,
+        claim_check:bool = False,
+        claim_check_retention_days:int = 7,
+        evaluation_dedup:bool = False,
+        evaluation_dedup_ttl_seconds:int = 86400,
+        policy_version:str = None,
+        verdict_store:bool = False,
+        evaluation_order_guard:bool = False,
+        control_broker_concurrency:int = 16,
+        control_broker_endpoints:list = None,
+        verdict_combiner:str = "AllMustPass",
+        fan_out_max_concurrency:int = 0,
+        config_rules:list = None,
+        performance_profile:str = "dev",
+        log_level:str = "INFO",
+        log_sample_rate:float = 0.0,
+        log_payload_max_bytes:int = 2048,
+        state_machine_log_level:str = "ERROR",
+        state_machine_include_execution_data:bool = False,
         **kwargs) -> None:
         super().__init__(scope, construct_id, **kwargs)
         
         self.control_broker_apigw_url = control_broker_apigw_url
         
+        # batch evaluation: buffer Config events in SQS, start one execution per drained batch
+        self.batch_evaluation = batch_evaluation
+        self.batch_size = batch_size
+        self.batch_max_batching_window_seconds = batch_max_batching_window_seconds
+        self.batch_max_concurrency = batch_max_concurrency
+        
+        # EXPRESS: invoked_by_config waits on StartSyncExecution instead of StartExecution
+        if state_machine_type not in ("STANDARD", "EXPRESS"):
+            raise ValueError(f'state_machine_type must be STANDARD or EXPRESS, not {state_machine_type}')
+        self.state_machine_type = state_machine_type
+        
+        # StepFunctions: one lambda per state, Lambdalith: every state in one evaluation pipeline lambda
+        if evaluation_topology not in ("StepFunctions", "Lambdalith"):
+            raise ValueError(f'evaluation_topology must be StepFunctions or Lambdalith, not {evaluation_topology}')
+        self.evaluation_topology = evaluation_topology
+        
+        # TaskToken: wait for the S3 event of the results report, polling only as a fallback
+        if results_report_readiness not in ("Poll", "TaskToken"):
+            raise ValueError(f'results_report_readiness must be Poll or TaskToken, not {results_report_readiness}')
+        if results_report_readiness == "TaskToken":
+            if evaluation_topology != "StepFunctions" or state_machine_type != "STANDARD":
+                raise ValueError('results_report_readiness TaskToken requires a STANDARD StepFunctions evaluation topology')
+            if not results_bucket_name:
+                raise ValueError('results_report_readiness TaskToken requires results_bucket_name')
+        self.results_report_readiness = results_report_readiness
+        self.results_bucket_name = results_bucket_name
+        self.results_report_wait_timeout_seconds = results_report_wait_timeout_seconds
+        
+        # cache GetComplianceDetailsByResource lookups in memory, optionally shared through a DynamoDB table
+        self.compliance_cache = compliance_cache
+        self.compliance_cache_ttl_seconds = compliance_cache_ttl_seconds
+        self.compliance_cache_max_entries = compliance_cache_max_entries
+        self.compliance_cache_table = compliance_cache_table
+        
+        # claim check: store Config events in S3, pass only a pointer and routing fields through the workflow
+        self.claim_check = claim_check
+        self.claim_check_retention_days = claim_check_retention_days
+        
+        # dedup: replay the verdict of identical content against the same rule and policy version
+        self.evaluation_dedup = evaluation_dedup
+        self.evaluation_dedup_ttl_seconds = evaluation_dedup_ttl_seconds
+        self.policy_version = policy_version
+        
+        # the current verdict per rule and resource, with a change feed of its transitions to EventBridge
+        self.verdict_store = verdict_store
+        
+        # drop the evaluation of an older configuration item than one already put for the resource
+        self.evaluation_order_guard = evaluation_order_guard
+        
+        # Control Broker requests in flight at once when the evaluation pipeline posts a batch
+        self.control_broker_concurrency = control_broker_concurrency
+        
+        # fan out: evaluate each Config event against every endpoint and output handler, combining the verdicts
+        if control_broker_endpoints:
+            if evaluation_topology != "StepFunctions":
+                raise ValueError('control_broker_endpoints requires the StepFunctions evaluation topology')
+            names = [endpoint["Name"] for endpoint in control_broker_endpoints]
+            if len(set(names)) != len(names):
+                raise ValueError(f'control_broker_endpoints names must be unique, not {names}')
+        if verdict_combiner not in self.VERDICT_COMBINERS:
+            raise ValueError(f'verdict_combiner must be one of {", ".join(self.VERDICT_COMBINERS)}, not {verdict_combiner}')
+        self.control_broker_endpoints = [
+            {"Name": endpoint["Name"], "Url": endpoint["Url"], "OutputHandler": endpoint.get("OutputHandler", "OPA")}
+            for endpoint in control_broker_endpoints or []
+        ]
+        self.verdict_combiner = verdict_combiner
+        self.fan_out_max_concurrency = fan_out_max_concurrency
+        
+        # Config rules served by the one evaluation pipeline, each with its scope and prefilter parameters
+        self.config_rules = validate_config_rules(config_rules or DEFAULT_CONFIG_RULES)
+        
+        # memory, timeout, reserved and provisioned concurrency per function, from performance_profiles.json
+        self.performance_profile = performance_profile
+        self.performance_settings = self.load_performance_profile(performance_profile)
+        self.invoke_targets = {}
+        
+        # structured logs of every lambda: level, fraction of invocations logged at DEBUG, longest payload field
+        if log_level not in ("DEBUG", "INFO", "WARNING", "ERROR"):
+            raise ValueError(f'log_level must be DEBUG, INFO, WARNING or ERROR, not {log_level}')
+        self.log_level = log_level
+        self.log_sample_rate = log_sample_rate
+        self.log_payload_max_bytes = log_payload_max_bytes
+        
+        # ALL with execution data records every state's input and output, ERROR only the failures
+        if state_machine_log_level not in ("ALL", "ERROR", "FATAL", "OFF"):
+            raise ValueError(f'state_machine_log_level must be ALL, ERROR, FATAL or OFF, not {state_machine_log_level}')
+        self.state_machine_log_level = state_machine_log_level
+        self.state_machine_include_execution_data = state_machine_include_execution_data
+        
+        # built by utils.lambda_layers: pinned by hash, pruned and precompiled
         self.layers = {
-            'requests': aws_lambda_python_alpha.PythonLayerVersion(self,
-                    "requests",
-                    entry="./supplementary_files/lambda_layers/requests",
-                    compatible_runtimes=[
-                        aws_lambda.Runtime.PYTHON_3_9
-                    ]
-                ),
-            'aws_requests_auth':aws_lambda_python_alpha.PythonLayerVersion(
-                    self,
-                    "aws_requests_auth",
-                    entry="./supplementary_files/lambda_layers/aws_requests_auth",
-                    compatible_runtimes=[
-                        aws_lambda.Runtime.PYTHON_3_9
-                    ]
+            name: aws_lambda.LayerVersion(
+                self,
+                name,
+                code=aws_lambda.Code.from_asset(
+                    str(paths.LAMBDA_LAYERS / name),
+                    asset_hash=lambda_layers.source_hash(paths.LAMBDA_LAYERS / name),
+                    bundling=BundlingOptions(
+                        image=aws_lambda.Runtime.PYTHON_3_9.bundling_image,
+                        volumes=[
+                            DockerVolume(host_path=lambda_layers.__file__, container_path="/layer-build/lambda_layers.py"),
+                        ],
+                        command=["python", "/layer-build/lambda_layers.py", "build", "/asset-input", "/asset-output"],
+                    ),
                 ),
+                compatible_runtimes=[
+                    aws_lambda.Runtime.PYTHON_3_9
+                ],
+            )
+            for name in lambda_layers.LAYERS
         }
         
         self.demo_change_tracked_by_config()
         self.utils()
-        self.config_event_processing_sfn_lambdas()
-        self.config_event_processing_sfn()
+        self.compliance_cache_table_and_environment()
+        self.evaluation_dedup_table()
+        self.verdict_store_table_and_change_feed()
+        self.evaluation_order_table()
+        if self.evaluation_topology == "StepFunctions":
+            self.config_event_processing_sfn_lambdas()
+            if self.results_report_readiness == "TaskToken":
+                self.results_report_readiness_notification()
+            self.config_event_processing_sfn()
+        else:
+            self.evaluation_pipeline()
         self.invoked_by_config()
+        self.logging_environment()
+        self.metrics_dashboard_and_alarms()
+    
+    def metrics_dashboard_and_alarms(self):
+        
+        # charted and alarmed from the same definitions the lambdas emit through cb_runtime.metrics
+        
+        with open(paths.METRIC_DEFINITIONS) as f:
+            definitions = json.load(f)
+        
+        def metric(name, statistic, period, label=None):
+            return aws_cloudwatch.Metric(
+                namespace=definitions["Namespace"],
+                metric_name=name,
+                statistic=statistic,
+                period=period,
+                label=label,
+            )
+        
+        widgets = []
+        self.metric_alarms = {}
+        
+        for name, definition in definitions["Metrics"].items():
+            
+            statistics = ["p50", "p99"] if definition["Unit"] == "Milliseconds" else ["Sum"]
+            
+            widgets.append(
+                aws_cloudwatch.GraphWidget(
+                    title=name,
+                    left=[metric(name, statistic, Duration.minutes(1), f"{name} {statistic}") for statistic in statistics],
+                    width=8,
+                )
+            )
+            
+            if "AlarmP99" in definition:
+                
+                self.metric_alarms[name] = aws_cloudwatch.Alarm(
+                    self,
+                    f"{name}P99",
+                    metric=metric(name, "p99", Duration.minutes(5)),
+                    threshold=definition["AlarmP99"],
+                    evaluation_periods=3,
+                    datapoints_to_alarm=2,
+                    comparison_operator=aws_cloudwatch.ComparisonOperator.GREATER_THAN_THRESHOLD,
+                    treat_missing_data=aws_cloudwatch.TreatMissingData.NOT_BREACHING,
+                    alarm_description=f'p99 {definition["Description"]} above {definition["AlarmP99"]} {definition["Unit"]}',
+                )
+        
+        self.dashboard = aws_cloudwatch.Dashboard(
+            self,
+            "ConfigConsumerDashboard",
+            widgets=[widgets[i:i + 3] for i in range(0, len(widgets), 3)],
+        )
+    
+    def load_performance_profile(self, name:str):
+        
+        # each function's settings: the profile's Default, overridden by its own entry
+        
+        with open(paths.PERFORMANCE_PROFILES) as f:
+            profiles = json.load(f)
+        
+        if name not in profiles:
+            raise ValueError(f'performance_profile must be one of {", ".join(profiles)}, not {name}')
+        
+        profile = profiles[name]
+        
+        unknown = set(profile) - {"Default", *self.PERFORMANCE_PROFILE_FUNCTIONS}
+        if unknown:
+            raise ValueError(f'performance_profile {name} tunes unknown functions {", ".join(sorted(unknown))}')
+        
+        settings = {
+            function_id: {**profile.get("Default", {}), **profile.get(function_id, {})}
+            for function_id in self.PERFORMANCE_PROFILE_FUNCTIONS
+        }
+        
+        for function_id, function_settings in settings.items():
+            
+            provisioned = function_settings.get("ProvisionedConcurrency")
+            if not provisioned:
+                continue
+            
+            capacities = [(provisioned["Min"], provisioned["Max"])] + [
+                (schedule["Min"], schedule["Max"]) for schedule in provisioned.get("Schedules", [])
+            ]
+            if provisioned["Min"] < 1 or any(low > high for low, high in capacities):
+                raise ValueError(f'{function_id} provisioned concurrency needs 1 <= Min <= Max, not {capacities}')
+            
+            # provisioned concurrency is drawn from the reserved concurrency, when there is one
+            reserved = function_settings.get("ReservedConcurrency")
+            if reserved is not None and max(high for _, high in capacities) > reserved:
+                raise ValueError(f'{function_id} provisioned concurrency exceeds its reserved concurrency {reserved}')
+        
+        return settings
+    
+    def performance(self, function_id:str, *, timeout:Duration, memory_size:int):
+        
+        # Function kwargs, the profile's settings in place of the given defaults
+        
+        settings = self.performance_settings[function_id]
+        
+        return dict(
+            timeout=Duration.seconds(settings["TimeoutSeconds"]) if "TimeoutSeconds" in settings else timeout,
+            memory_size=settings.get("MemorySize", memory_size),
+            reserved_concurrent_executions=settings.get("ReservedConcurrency"),
+        )
+    
+    def function_layers(self, function:str):
+        
+        # only the layers whose packages the handler imports, read from its source
+        
+        return [
+            self.layers[name]
+            for name in lambda_layers.function_layers(
+                function,
+                lambda_functions=paths.LAMBDA_FUNCTIONS,
+                lambda_layers=paths.LAMBDA_LAYERS,
+            )
+        ]
+    
+    def provisioned_concurrency(self, lambda_function:aws_lambda.Function):
+        
+        # a live alias kept warm and scaled on utilization and schedule, invoked in place of the function
+        
+        function_id = lambda_function.node.id
+        provisioned = self.performance_settings[function_id].get("ProvisionedConcurrency")
+        
+        if not provisioned:
+            return
+        
+        alias = aws_lambda.Alias(
+            self,
+            f"{function_id}Live",
+            alias_name="live",
+            version=lambda_function.current_version,
+            provisioned_concurrent_executions=provisioned["Min"],
+        )
+        
+        scaling = alias.add_auto_scaling(
+            min_capacity=provisioned["Min"],
+            max_capacity=provisioned["Max"],
+        )
+        
+        if "UtilizationTarget" in provisioned:
+            scaling.scale_on_utilization(utilization_target=provisioned["UtilizationTarget"])
+        
+        for schedule in provisioned.get("Schedules", []):
+            scaling.scale_on_schedule(
+                schedule["Name"],
+                schedule=aws_applicationautoscaling.Schedule.expression(schedule["Schedule"]),
+                min_capacity=schedule["Min"],
+                max_capacity=schedule["Max"],
+            )
+        
+        self.invoke_targets[function_id] = alias
+    
+    def invoke_target(self, lambda_function:aws_lambda.Function):
+        
+        # the live alias of a function with provisioned concurrency, otherwise the function itself
+        
+        return self.invoke_targets.get(lambda_function.node.id, lambda_function)
+    
+    def logging_environment(self):
+        
+        # read by cb_runtime.logs in every lambda of the stack
+        
+        for construct in self.node.find_all():
+            if isinstance(construct, aws_lambda.Function):
+                construct.add_environment("LogLevel", self.log_level)
+                construct.add_environment("LogSampleRate", str(self.log_sample_rate))
+                construct.add_environment("LogPayloadMaxBytes", str(self.log_payload_max_bytes))
     
     def demo_change_tracked_by_config(self):
         
@@ -94,8 +422,204 @@ class ControlBrokerConsumerExampleConfigStack(Stack):
             block_public_access=aws_s3.BlockPublicAccess.BLOCK_ALL,
             removal_policy=RemovalPolicy.DESTROY,
             auto_delete_objects=True,
+            lifecycle_rules=[
+                aws_s3.LifecycleRule(
+                    prefix="config-events/",
+                    expiration=Duration.days(self.claim_check_retention_days),
+                )
+            ],
+        )
+    
+    def grant_resolve_config_event(self, lambda_function):
+        
+        # read claim checks, and the history of oversized configuration items
+        
+        lambda_function.role.add_to_policy(
+            aws_iam.PolicyStatement(
+                actions=[
+                    "s3:GetObject",
+                ],
+                resources=[
+                    self.bucket_config_event_raw_inputs.arn_for_objects("config-events/*"),
+                ],
+            )
+        )
+        
+        lambda_function.role.add_to_policy(
+            aws_iam.PolicyStatement(
+                actions=[
+                    "config:GetResourceConfigHistory",
+                ],
+                resources=["*"]
+            )
+        )
+        
+    def compliance_cache_table_and_environment(self):
+        
+        self.table_compliance_cache = None
+        
+        if self.compliance_cache and self.compliance_cache_table:
+            
+            self.table_compliance_cache = aws_dynamodb.Table(
+                self,
+                "ComplianceCache",
+                partition_key=aws_dynamodb.Attribute(
+                    name="CacheKey",
+                    type=aws_dynamodb.AttributeType.STRING
+                ),
+                billing_mode=aws_dynamodb.BillingMode.PAY_PER_REQUEST,
+                time_to_live_attribute="ExpiresAt",
+                removal_policy=RemovalPolicy.DESTROY,
+            )
+        
+        self.compliance_cache_environment = dict(
+            ComplianceCacheTtlSeconds=str(self.compliance_cache_ttl_seconds if self.compliance_cache else 0),
+            ComplianceCacheMaxEntries=str(self.compliance_cache_max_entries),
+        )
+        
+        if self.table_compliance_cache:
+            self.compliance_cache_environment["ComplianceCacheTableName"] = self.table_compliance_cache.table_name
+    
+    def grant_compliance_cache(self, lambda_function):
+        
+        if self.table_compliance_cache:
+            self.table_compliance_cache.grant_read_write_data(lambda_function)
+    
+    def evaluation_dedup_table(self):
+        
+        self.table_evaluation_dedup = None
+        
+        if self.evaluation_dedup:
+            
+            self.table_evaluation_dedup = aws_dynamodb.Table(
+                self,
+                "EvaluationDedup",
+                partition_key=aws_dynamodb.Attribute(
+                    name="ContentHash",
+                    type=aws_dynamodb.AttributeType.STRING
+                ),
+                billing_mode=aws_dynamodb.BillingMode.PAY_PER_REQUEST,
+                time_to_live_attribute="ExpiresAt",
+                removal_policy=RemovalPolicy.DESTROY,
+            )
+    
+    def grant_evaluation_dedup(self, lambda_function):
+        
+        if self.table_evaluation_dedup:
+            
+            self.table_evaluation_dedup.grant_read_write_data(lambda_function)
+            
+            lambda_function.add_environment("EvaluationDedupTableName", self.table_evaluation_dedup.table_name)
+            lambda_function.add_environment("EvaluationDedupTtlSeconds", str(self.evaluation_dedup_ttl_seconds))
+            if self.policy_version:
+                lambda_function.add_environment("ControlBrokerPolicyVersion", self.policy_version)
+    
+    def verdict_store_table_and_change_feed(self):
+        
+        self.table_verdict_store = None
+        
+        if not self.verdict_store:
+            return
+        
+        # written alongside every evaluation put to Config, read in O(1) per resource
+        
+        self.table_verdict_store = aws_dynamodb.Table(
+            self,
+            "ComplianceVerdicts",
+            partition_key=aws_dynamodb.Attribute(
+                name="ConfigRuleName",
+                type=aws_dynamodb.AttributeType.STRING
+            ),
+            sort_key=aws_dynamodb.Attribute(
+                name="ResourceKey",
+                type=aws_dynamodb.AttributeType.STRING
+            ),
+            billing_mode=aws_dynamodb.BillingMode.PAY_PER_REQUEST,
+            stream=aws_dynamodb.StreamViewType.NEW_AND_OLD_IMAGES,
+            removal_policy=RemovalPolicy.DESTROY,
+        )
+        
+        # only the writes changing a verdict invoke the change feed, refreshes are filtered out by the mapping
+        
+        self.lambda_verdict_changes = aws_lambda.Function(
+            self,
+            "VerdictChanges",
+            runtime=aws_lambda.Runtime.PYTHON_3_9,
+            handler="lambda_function.lambda_handler",
+            **self.performance("VerdictChanges", timeout=Duration.seconds(60), memory_size=256),
+            code=aws_lambda.Code.from_asset("./supplementary_files/lambdas/verdict_changes"),
+            layers=self.function_layers("verdict_changes"),
+        )
+        
+        self.provisioned_concurrency(self.lambda_verdict_changes)
+        
+        self.invoke_target(self.lambda_verdict_changes).add_event_source(
+            aws_lambda_event_sources.DynamoEventSource(
+                self.table_verdict_store,
+                starting_position=aws_lambda.StartingPosition.LATEST,
+                batch_size=100,
+                report_batch_item_failures=True,
+                retry_attempts=10,
+                filters=[
+                    aws_lambda.FilterCriteria.filter({
+                        "dynamodb": {"NewImage": {"Transition": {"BOOL": [True]}}},
+                    }),
+                ],
+            )
+        )
+        
+        self.lambda_verdict_changes.role.add_to_policy(
+            aws_iam.PolicyStatement(
+                actions=[
+                    "events:PutEvents",
+                ],
+                resources=[
+                    f"arn:{self.partition}:events:{self.region}:{self.account}:event-bus/default",
+                ],
+            )
         )
+    
+    def grant_verdict_store(self, lambda_function):
+        
+        if self.table_verdict_store:
+            
+            self.table_verdict_store.grant_read_write_data(lambda_function)
+            
+            lambda_function.add_environment("VerdictStoreTableName", self.table_verdict_store.table_name)
+            if self.policy_version:
+                lambda_function.add_environment("ControlBrokerPolicyVersion", self.policy_version)
+    
+    def evaluation_order_table(self):
+        
+        self.table_evaluation_order = None
         
+        if self.evaluation_order_guard:
+            
+            # the OrderingTimestamp of the newest evaluation put per rule and resource, only ever moved forward
+            
+            self.table_evaluation_order = aws_dynamodb.Table(
+                self,
+                "EvaluationOrder",
+                partition_key=aws_dynamodb.Attribute(
+                    name="ConfigRuleName",
+                    type=aws_dynamodb.AttributeType.STRING
+                ),
+                sort_key=aws_dynamodb.Attribute(
+                    name="ResourceKey",
+                    type=aws_dynamodb.AttributeType.STRING
+                ),
+                billing_mode=aws_dynamodb.BillingMode.PAY_PER_REQUEST,
+                removal_policy=RemovalPolicy.DESTROY,
+            )
+    
+    def grant_evaluation_order(self, lambda_function):
+        
+        if self.table_evaluation_order:
+            
+            self.table_evaluation_order.grant_read_write_data(lambda_function)
+            
+            lambda_function.add_environment("EvaluationOrderTableName", self.table_evaluation_order.table_name)
+    
     def config_event_processing_sfn_lambdas(self):
 
         # sign apigw request
@@ -105,20 +629,20 @@ class ControlBrokerConsumerExampleConfigStack(Stack):
             "SignApigwRequest",
             runtime=aws_lambda.Runtime.PYTHON_3_9,
             handler="lambda_function.lambda_handler",
-            timeout=Duration.seconds(60),
-            memory_size=1024,
+            **self.performance("SignApigwRequest", timeout=Duration.seconds(60), memory_size=1024),
             code=aws_lambda.Code.from_asset(
                 "./supplementary_files/lambdas/sign_apigw_request"
             ),
             environment=dict(
                 ControlBrokerInvokeUrl=self.control_broker_apigw_url,
                 ConfigEventsRawInputBucket=self.bucket_config_event_raw_inputs.bucket_name,
+                # fanned out executions name their endpoint, which is resolved here rather than read from the state input
+                ControlBrokerEndpoints=json.dumps({e["Name"]: e["Url"] for e in self.control_broker_endpoints}),
             ),
-            layers = [
-                self.layers['requests'],
-                self.layers['aws_requests_auth'],
-            ]
+            layers=self.function_layers("sign_apigw_request"),
         )
+        
+        self.grant_resolve_config_event(self.lambda_sign_apigw_request)
 
         self.lambda_sign_apigw_request.role.add_to_policy(
             aws_iam.PolicyStatement(
@@ -139,14 +663,11 @@ class ControlBrokerConsumerExampleConfigStack(Stack):
             "RequestsGet",
             runtime=aws_lambda.Runtime.PYTHON_3_9,
             handler="lambda_function.lambda_handler",
-            timeout=Duration.seconds(60),
-            memory_size=1024,
+            **self.performance("RequestsGet", timeout=Duration.seconds(60), memory_size=1024),
             code=aws_lambda.Code.from_asset(
                 "./supplementary_files/lambdas/requests_get"
             ),
-            layers=[
-                self.layers['requests'],
-            ]
+            layers=self.function_layers("requests_get"),
         )
        
         # put evaluations
@@ -156,11 +677,20 @@ class ControlBrokerConsumerExampleConfigStack(Stack):
             "PutEvaluations",
             runtime=aws_lambda.Runtime.PYTHON_3_9,
             handler="lambda_function.lambda_handler",
-            timeout=Duration.seconds(60),
-            memory_size=1024,
+            **self.performance("PutEvaluations", timeout=Duration.seconds(60), memory_size=1024),
             code=aws_lambda.Code.from_asset("./supplementary_files/lambdas/put_evaluations"),
+            environment=dict(self.compliance_cache_environment),
+            layers=self.function_layers("put_evaluations"),
         )
         
+        self.grant_compliance_cache(self.lambda_put_evaluations)
+        
+        self.grant_evaluation_dedup(self.lambda_put_evaluations)
+        
+        self.grant_verdict_store(self.lambda_put_evaluations)
+        
+        self.grant_evaluation_order(self.lambda_put_evaluations)
+        
         self.lambda_put_evaluations.role.add_to_policy(
             aws_iam.PolicyStatement(
                 actions=[
@@ -177,11 +707,14 @@ class ControlBrokerConsumerExampleConfigStack(Stack):
             "GetResourceConfigCompliance",
             runtime=aws_lambda.Runtime.PYTHON_3_9,
             handler="lambda_function.lambda_handler",
-            timeout=Duration.seconds(60),
-            memory_size=1024,
+            **self.performance("GetResourceConfigCompliance", timeout=Duration.seconds(60), memory_size=1024),
             code=aws_lambda.Code.from_asset("./supplementary_files/lambdas/get_resource_config_compliance"),
+            environment=dict(self.compliance_cache_environment),
+            layers=self.function_layers("get_resource_config_compliance"),
         )
         
+        self.grant_compliance_cache(self.lambda_get_resource_config_compliance)
+        
         self.lambda_get_resource_config_compliance.role.add_to_policy(
             aws_iam.PolicyStatement(
                 actions=[
@@ -193,7 +726,90 @@ class ControlBrokerConsumerExampleConfigStack(Stack):
             )
         )
         
+        for lambda_function in [
+            self.lambda_sign_apigw_request,
+            self.lambda_requests_get,
+            self.lambda_put_evaluations,
+            self.lambda_get_resource_config_compliance,
+        ]:
+            self.provisioned_concurrency(lambda_function)
+        
+
+    def results_report_readiness_notification(self):
+        
+        # executions register a task token per results report, resumed by the S3 Object Created event
+        
+        self.table_results_report_waiters = aws_dynamodb.Table(
+            self,
+            "ResultsReportWaiters",
+            partition_key=aws_dynamodb.Attribute(
+                name="ReportKey",
+                type=aws_dynamodb.AttributeType.STRING
+            ),
+            billing_mode=aws_dynamodb.BillingMode.PAY_PER_REQUEST,
+            time_to_live_attribute="ExpiresAt",
+            removal_policy=RemovalPolicy.DESTROY,
+        )
+        
+        self.lambda_wait_for_results_report = aws_lambda.Function(
+            self,
+            "WaitForResultsReport",
+            runtime=aws_lambda.Runtime.PYTHON_3_9,
+            handler="lambda_function.lambda_handler",
+            **self.performance("WaitForResultsReport", timeout=Duration.seconds(60), memory_size=1024),
+            code=aws_lambda.Code.from_asset("./supplementary_files/lambdas/wait_for_results_report"),
+            environment=dict(
+                ResultsReportWaitersTable=self.table_results_report_waiters.table_name,
+            ),
+            layers=self.function_layers("wait_for_results_report"),
+        )
+        
+        self.lambda_results_report_written = aws_lambda.Function(
+            self,
+            "ResultsReportWritten",
+            runtime=aws_lambda.Runtime.PYTHON_3_9,
+            handler="lambda_function.lambda_handler",
+            **self.performance("ResultsReportWritten", timeout=Duration.seconds(60), memory_size=1024),
+            code=aws_lambda.Code.from_asset("./supplementary_files/lambdas/results_report_written"),
+            environment=dict(
+                ResultsReportWaitersTable=self.table_results_report_waiters.table_name,
+            ),
+            layers=self.function_layers("results_report_written"),
+        )
+        
+        for lambda_function in [self.lambda_wait_for_results_report, self.lambda_results_report_written]:
+            
+            self.table_results_report_waiters.grant_read_write_data(lambda_function)
+            
+            lambda_function.role.add_to_policy(
+                aws_iam.PolicyStatement(
+                    actions=[
+                        "states:SendTaskSuccess",
+                    ],
+                    resources=["*"]
+                )
+            )
+            
+            self.provisioned_concurrency(lambda_function)
+        
+        # requires EventBridge notifications enabled on the Control Broker results bucket
         
+        aws_events.Rule(
+            self,
+            "ResultsReportWrittenRule",
+            event_pattern=aws_events.EventPattern(
+                source=["aws.s3"],
+                detail_type=["Object Created"],
+                detail={
+                    "bucket": {
+                        "name": [self.results_bucket_name]
+                    }
+                },
+            ),
+            targets=[
+                aws_events_targets.LambdaFunction(self.invoke_target(self.lambda_results_report_written))
+            ]
+        )
 
     def config_event_processing_sfn(self):
         
@@ -213,14 +829,17 @@ class ControlBrokerConsumerExampleConfigStack(Stack):
             aws_iam.PolicyStatement(
                 actions=["lambda:InvokeFunction"],
                 resources=[
-                    self.lambda_requests_get.function_arn,
-                    self.lambda_put_evaluations.function_arn,
-                    self.lambda_get_resource_config_compliance.function_arn,
-                    self.lambda_sign_apigw_request.function_arn,
+                    self.invoke_target(self.lambda_requests_get).function_arn,
+                    self.invoke_target(self.lambda_put_evaluations).function_arn,
+                    self.invoke_target(self.lambda_get_resource_config_compliance).function_arn,
+                    self.invoke_target(self.lambda_sign_apigw_request).function_arn,
                 ],
             )
         )
         
+        if self.results_report_readiness == "TaskToken":
+            self.invoke_target(self.lambda_wait_for_results_report).grant_invoke(self.role_config_event_processing_sfn)
+        
         # log_group_config_event_processing_sfn.grant(self.role_config_event_processing_sfn)
 
         self.role_config_event_processing_sfn.add_to_policy(
@@ -253,12 +872,18 @@ class ControlBrokerConsumerExampleConfigStack(Stack):
         simply assert that final Compliance status is equal to expected_final_status
         
         """
+        
+        if self.batch_evaluation:
+            self.config_event_processing_definition = self.batch_config_event_processing_definition(
+                self.config_event_processing_states()
+            )
+        else:
+            self.config_event_processing_definition = self.config_event_processing_states()
 
         self.sfn_config_event_processing = aws_stepfunctions.CfnStateMachine(
             self,
             "ConfigEventProcessing",
-            state_machine_type="STANDARD",
-            # state_machine_type="EXPRESS",
+            state_machine_type=self.state_machine_type,
             role_arn=self.role_config_event_processing_sfn.role_arn,
             logging_configuration=aws_stepfunctions.CfnStateMachine.LoggingConfigurationProperty(
                 destinations=[
@@ -268,181 +893,635 @@ class ControlBrokerConsumerExampleConfigStack(Stack):
                         )
                     )
                 ],
-                # include_execution_data=False,
-                # level="ERROR",
-                include_execution_data=True,
-                level="ALL",
+                include_execution_data=self.state_machine_include_execution_data,
+                level=self.state_machine_log_level,
             ),
-            definition_string=json.dumps({
-                "StartAt": "ParseInput",
-                "States": {
-                    "ParseInput": {
-                        "Type":"Pass",
-                        "Next":"SignApigwRequest",
-                        "Parameters": {
-                            "InvokingEvent.$":"States.StringToJson($.invokingEvent)",
-                            "ConfigEvent.$":"$"
-                        }
-                    },
-                    "SignApigwRequest": {
-                        "Type": "Task",
-                        "Next":"GetResourceConfigComplianceInitial",
-                        "ResultPath": "$.SignApigwRequest",
-                        "Resource": "arn:aws:states:::lambda:invoke",
-                        "Parameters": {
-                            "FunctionName": self.lambda_sign_apigw_request.function_name,
-                            "Payload.$": "$.ConfigEvent"
-                        },
-                        "ResultSelector": {"Payload.$": "$.Payload"},
-                    },
-                    "GetResourceConfigComplianceInitial":{
-                        "Type": "Task",
-                        "Next":"GetIsCompliant", 
-                        "ResultPath": "$.GetResourceConfigComplianceInitial",
-                        "Resource": "arn:aws:states:::lambda:invoke",
-                        "Parameters": {
-                            "FunctionName": self.lambda_get_resource_config_compliance.function_name,
-                            "Payload": {
-                                "ConfigEvent.$":"$.ConfigEvent",
-                                "ExpectedComplianceStatus": None
-                            }
-                        },
-                        "ResultSelector": {
-                            "Payload.$": "$.Payload"
-                        },
+            definition_string=json.dumps(self.config_event_processing_definition)
+        )
+
+        self.sfn_config_event_processing.node.add_dependency(self.role_config_event_processing_sfn)
+
+    def config_event_processing_states(self):
+        
+        # a single Config event: sign, evaluate, put evaluation, verify
+        
+        if self.control_broker_endpoints:
+            return self.fan_out_config_event_processing_states()
+        
+        presigned_url_path = "$.SignApigwRequest.Payload.Response.ControlBrokerEvaluation.OutputHandlers.OPA.PresignedUrl"
+        
+        definition = {
+            "StartAt": "ParseInput",
+            "States": {
+                "ParseInput": {
+                    "Type":"Pass",
+                    "Next":"SignApigwRequest",
+                    "Parameters": {
+                        "InvokingEvent.$":"States.StringToJson($.invokingEvent)",
+                        "ConfigEvent.$":"$"
+                    }
+                },
+                "SignApigwRequest": {
+                    "Type": "Task",
+                    "Next":"GetResourceConfigComplianceInitial",
+                    "ResultPath": "$.SignApigwRequest",
+                    "Resource": "arn:aws:states:::lambda:invoke",
+                    "Parameters": {
+                        "FunctionName": self.invoke_target(self.lambda_sign_apigw_request).function_name,
+                        "Payload.$": "$.ConfigEvent"
                     },
-                    "GetIsCompliant": {
-                        "Type": "Task",
-                        "Next": "PutEvaluations",
-                        "ResultPath": "$.GetIsCompliant",
-                        "Resource": "arn:aws:states:::lambda:invoke",
-                        "Parameters": {
-                            "FunctionName": self.lambda_requests_get.function_name,
-                            "Payload":{
-                                "Url.$":"$.SignApigwRequest.Payload.Response.ControlBrokerEvaluation.OutputHandlers.OPA.PresignedUrl",
-                            }
-                        },
-                        "ResultSelector": {
-                            "Payload.$": "$.Payload"
-                        },
-                        "Retry": [
-                            {
-                                "ErrorEquals": [
-                                    "StatusCodeNot200Exception"
-                                ],
-                                "IntervalSeconds": 1,
-                                "MaxAttempts": 8,
-                                "BackoffRate": 2.0
-                            }
+                    "ResultSelector": {"Payload.$": "$.Payload"},
+                },
+                "GetResourceConfigComplianceInitial": self.get_resource_config_compliance_initial_state(next_state="GetIsCompliant"),
+                "GetIsCompliant": self.get_is_compliant_state(presigned_url_path=presigned_url_path, next_state="PutEvaluations"),
+                "ResultsReportDoesNotYetExist": {
+                    "Type":"Fail"
+                },
+                "ResultsReportProjectionNotFound": {
+                    "Type":"Fail",
+                    "Error":"ProjectionNotFound",
+                    "Cause":"the results report lacks a projected field"
+                },
+                **self.put_and_verify_evaluation_states(
+                    compliance_path="$.GetIsCompliant.Payload.EvalEngineLambdalith.Evaluation.IsCompliant"
+                ),
+            }
+        }
+        
+        if self.evaluation_dedup:
+            
+            # recorded with the verdict, for invoked_by_config to replay
+            
+            definition["States"]["PutEvaluations"]["Parameters"]["Payload"]["EvaluationContentHash.$"] = "$.ConfigEvent.EvaluationContentHash"
+        
+        if self.results_report_readiness == "TaskToken":
+            
+            # wait for the results report to be written, falling back to polling in GetIsCompliant
+            
+            definition["States"]["GetResourceConfigComplianceInitial"]["Next"] = "WaitForResultsReport"
+            definition["States"]["WaitForResultsReport"] = self.wait_for_results_report_state(presigned_url_path=presigned_url_path)
+        
+        return definition
+    
+    def fan_out_config_event_processing_states(self):
+        
+        # a single Config event against every endpoint and output handler at once, so the evaluation
+        # takes as long as the slowest branch rather than the sum of them
+        
+        presigned_url_path = "$.SignApigwRequest.Payload.PresignedUrl"
+        
+        branch_states = {
+            "SignApigwRequest": {
+                "Type": "Task",
+                "Next": "GetIsCompliant",
+                "ResultPath": "$.SignApigwRequest",
+                "Resource": "arn:aws:states:::lambda:invoke",
+                "Parameters": {
+                    "FunctionName": self.invoke_target(self.lambda_sign_apigw_request).function_name,
+                    "Payload": {
+                        "ConfigEvent.$": "$.ConfigEvent",
+                        "Endpoint.$": "$.Endpoint.Name",
+                        "OutputHandler.$": "$.Endpoint.OutputHandler",
+                    }
+                },
+                "ResultSelector": {"Payload.$": "$.Payload"},
+            },
+            # state names are unique across the whole machine, Map iterators included
+            "GetIsCompliant": self.get_is_compliant_state(
+                presigned_url_path=presigned_url_path,
+                next_state="EndpointVerdict",
+                does_not_yet_exist_state="EndpointResultsReportDoesNotYetExist",
+            ),
+            "EndpointResultsReportDoesNotYetExist": {
+                "Type": "Fail"
+            },
+            "ResultsReportProjectionNotFound": {
+                "Type": "Fail",
+                "Error": "ProjectionNotFound",
+                "Cause": "the results report lacks a projected field"
+            },
+            "EndpointVerdict": {
+                "Type": "Pass",
+                "End": True,
+                "OutputPath": "$.GetIsCompliant.Payload.EvalEngineLambdalith.Evaluation.IsCompliant",
+            },
+        }
+        
+        if self.results_report_readiness == "TaskToken":
+            branch_states["SignApigwRequest"]["Next"] = "WaitForResultsReport"
+            branch_states["WaitForResultsReport"] = self.wait_for_results_report_state(presigned_url_path=presigned_url_path)
+        
+        combined_variable, combined_verdict = self.VERDICT_COMBINERS[self.verdict_combiner]
+        
+        definition = {
+            "StartAt": "ParseInput",
+            "States": {
+                "ParseInput": {
+                    "Type":"Pass",
+                    "Next":"GetResourceConfigComplianceInitial",
+                    "Parameters": {
+                        "InvokingEvent.$":"States.StringToJson($.invokingEvent)",
+                        "ConfigEvent.$":"$",
+                        "ControlBrokerEndpoints": [
+                            {"Name": e["Name"], "OutputHandler": e["OutputHandler"]}
+                            for e in self.control_broker_endpoints
                         ],
-                        "Catch": [
-                            {
-                                "ErrorEquals":[
-                                    "States.ALL"
-                                ],
-                                "Next": "ResultsReportDoesNotYetExist"
-                            }
-                        ]
+                    }
+                },
+                "GetResourceConfigComplianceInitial": self.get_resource_config_compliance_initial_state(next_state="EvaluateEndpoints"),
+                "EvaluateEndpoints": {
+                    "Type": "Map",
+                    "Next": "CombineVerdicts",
+                    "ItemsPath": "$.ControlBrokerEndpoints",
+                    "MaxConcurrency": self.fan_out_max_concurrency,
+                    "Parameters": {
+                        "ConfigEvent.$": "$.ConfigEvent",
+                        "Endpoint.$": "$$.Map.Item.Value",
                     },
-                    "ResultsReportDoesNotYetExist": {
-                        "Type":"Fail"
+                    "ResultPath": "$.Verdicts",
+                    "Iterator": {
+                        "StartAt": "SignApigwRequest",
+                        "States": branch_states,
                     },
-                    "PutEvaluations": {
-                        "Type": "Task",
-                        "Next": "GetResourceConfigCompliancee",
-                        "ResultPath": "$.PutEvaluations",
-                        "Resource": "arn:aws:states:::lambda:invoke",
-                        "Parameters": {
-                            "FunctionName": self.lambda_put_evaluations.function_name,
-                            "Payload": {
-                                "Compliance.$": "$.GetIsCompliant.Payload.EvalEngineLambdalith.Evaluation.IsCompliant",
-                                "ConfigResultToken.$":"$.ConfigEvent.resultToken",
-                                "ResourceId.$":"$.InvokingEvent.configurationItem.resourceId",
-                                "ResourceType.$":"$.InvokingEvent.configurationItem.resourceType",
-                            },
-                        },
-                        "ResultSelector": {"Payload.$": "$.Payload"},
+                    "Catch": [
+                        {
+                            "ErrorEquals":[
+                                "States.ALL"
+                            ],
+                            "Next": "ResultsReportDoesNotYetExist"
+                        }
+                    ]
+                },
+                "ResultsReportDoesNotYetExist": {
+                    "Type":"Fail"
+                },
+                "CombineVerdicts": {
+                    "Type": "Pass",
+                    "Next": "ChoiceCombinedVerdict",
+                    "ResultPath": "$.CombinedVerdicts",
+                    "Parameters": {
+                        "AnyCompliant.$": "States.ArrayContains($.Verdicts, true)",
+                        "AnyNonCompliant.$": "States.ArrayContains($.Verdicts, false)",
                     },
-                    "GetResourceConfigCompliancee":{
-                        "Type": "Task",
-                        "Next":"ChoiceComplianceStatusIsAsExpected",
-                        "ResultPath": "$.GetResourceConfigCompliancee",
-                        "Resource": "arn:aws:states:::lambda:invoke",
-                        "Parameters": {
-                            "FunctionName": self.lambda_get_resource_config_compliance.function_name,
-                            "Payload": {
-                                "ConfigEvent.$":"$.ConfigEvent",
-                                "ExpectedComplianceStatus.$": "$.GetIsCompliant.Payload.EvalEngineLambdalith.Evaluation.IsCompliant"
-                            }
-                        },
-                        "ResultSelector": {
-                            "Payload.$": "$.Payload"
+                },
+                "ChoiceCombinedVerdict": {
+                    "Type": "Choice",
+                    "Default": "CombinedVerdictFalse" if combined_verdict else "CombinedVerdictTrue",
+                    "Choices": [
+                        {
+                            "Variable": f"$.CombinedVerdicts.{combined_variable}",
+                            "BooleanEquals": True,
+                            "Next": "CombinedVerdictTrue" if combined_verdict else "CombinedVerdictFalse"
                         },
+                    ]
+                },
+                "CombinedVerdictTrue": {
+                    "Type": "Pass",
+                    "Next": "PutEvaluations",
+                    "Result": True,
+                    "ResultPath": "$.IsCompliant",
+                },
+                "CombinedVerdictFalse": {
+                    "Type": "Pass",
+                    "Next": "PutEvaluations",
+                    "Result": False,
+                    "ResultPath": "$.IsCompliant",
+                },
+                **self.put_and_verify_evaluation_states(compliance_path="$.IsCompliant"),
+            }
+        }
+        
+        if self.evaluation_dedup:
+            definition["States"]["PutEvaluations"]["Parameters"]["Payload"]["EvaluationContentHash.$"] = "$.ConfigEvent.EvaluationContentHash"
+        
+        return definition
+    
+    def get_resource_config_compliance_initial_state(self, *, next_state:str):
+        return {
+            "Type": "Task",
+            "Next": next_state,
+            "ResultPath": "$.GetResourceConfigComplianceInitial",
+            "Resource": "arn:aws:states:::lambda:invoke",
+            "Parameters": {
+                "FunctionName": self.invoke_target(self.lambda_get_resource_config_compliance).function_name,
+                "Payload": {
+                    "ConfigEvent.$":"$.ConfigEvent",
+                    "ExpectedComplianceStatus": None
+                }
+            },
+            "ResultSelector": {
+                "Payload.$": "$.Payload"
+            },
+        }
+    
+    def get_is_compliant_state(self, *, presigned_url_path:str, next_state:str, does_not_yet_exist_state:str = "ResultsReportDoesNotYetExist"):
+        return {
+            "Type": "Task",
+            "Next": next_state,
+            "ResultPath": "$.GetIsCompliant",
+            "Resource": "arn:aws:states:::lambda:invoke",
+            "Parameters": {
+                "FunctionName": self.invoke_target(self.lambda_requests_get).function_name,
+                "Payload":{
+                    "Url.$": presigned_url_path,
+                    # stream the report and return only what the following states read
+                    "Projection": [
+                        "EvalEngineLambdalith.Evaluation.IsCompliant",
+                    ],
+                }
+            },
+            "ResultSelector": {
+                "Payload.$": "$.Payload"
+            },
+            "Retry": [
+                {
+                    "ErrorEquals": [
+                        "StatusCodeNot200Exception"
+                    ],
+                    "IntervalSeconds": 1,
+                    "MaxAttempts": 8,
+                    "BackoffRate": 2.0
+                }
+            ],
+            "Catch": [
+                {
+                    # the report exists, so it is not retried
+                    "ErrorEquals":[
+                        "ProjectionNotFound"
+                    ],
+                    "Next": "ResultsReportProjectionNotFound"
+                },
+                {
+                    "ErrorEquals":[
+                        "States.ALL"
+                    ],
+                    "Next": does_not_yet_exist_state
+                }
+            ]
+        }
+    
+    def wait_for_results_report_state(self, *, presigned_url_path:str):
+        return {
+            "Type": "Task",
+            "Next": "GetIsCompliant",
+            "ResultPath": "$.WaitForResultsReport",
+            "Resource": "arn:aws:states:::lambda:invoke.waitForTaskToken",
+            "TimeoutSeconds": self.results_report_wait_timeout_seconds,
+            "Parameters": {
+                "FunctionName": self.invoke_target(self.lambda_wait_for_results_report).function_name,
+                "Payload": {
+                    "TaskToken.$": "$$.Task.Token",
+                    "Url.$": presigned_url_path,
+                }
+            },
+            "Catch": [
+                {
+                    "ErrorEquals": [
+                        "States.ALL"
+                    ],
+                    "ResultPath": "$.WaitForResultsReport",
+                    "Next": "GetIsCompliant"
+                }
+            ]
+        }
+    
+    def put_and_verify_evaluation_states(self, *, compliance_path:str):
+        
+        # put the verdict at compliance_path, then check Config recorded it
+        
+        states = {
+            "PutEvaluations": {
+                "Type": "Task",
+                "Next": "GetResourceConfigComplianceFinal",
+                "ResultPath": "$.PutEvaluations",
+                "Resource": "arn:aws:states:::lambda:invoke",
+                "Parameters": {
+                    "FunctionName": self.invoke_target(self.lambda_put_evaluations).function_name,
+                    "Payload": {
+                        "Compliance.$": compliance_path,
+                        "ConfigResultToken.$":"$.ConfigEvent.resultToken",
+                        "ResourceId.$":"$.InvokingEvent.configurationItem.resourceId",
+                        "ResourceType.$":"$.InvokingEvent.configurationItem.resourceType",
+                        "ConfigRuleName.$":"$.ConfigEvent.configRuleName",
+                        "OrderingTimestamp.$":"$.InvokingEvent.configurationItem.configurationItemCaptureTime",
                     },
-                    "ChoiceComplianceStatusIsAsExpected": {
-                        "Type":"Choice",
-                        "Default":"ComplianceStatusIsAsExpectedFalse",
-                        "Choices":[
-                            {
-                                "Variable":"$.GetResourceConfigCompliancee.Payload.ComplianceIsAsExpected",
-                                "BooleanEquals":True,
-                                "Next":"ComplianceStatusIsAsExpectedTrue"
-                            },
-                        ]
+                },
+                "ResultSelector": {"Payload.$": "$.Payload"},
+            },
+            "GetResourceConfigComplianceFinal":{
+                "Type": "Task",
+                "Next":"ChoiceComplianceStatusIsAsExpected",
+                "ResultPath": "$.GetResourceConfigComplianceFinal",
+                "Resource": "arn:aws:states:::lambda:invoke",
+                "Parameters": {
+                    "FunctionName": self.invoke_target(self.lambda_get_resource_config_compliance).function_name,
+                    "Payload": {
+                        "ConfigEvent.$":"$.ConfigEvent",
+                        "ExpectedComplianceStatus.$": compliance_path
+                    }
+                },
+                "ResultSelector": {
+                    "Payload.$": "$.Payload"
+                },
+            },
+            "ChoiceComplianceStatusIsAsExpected": {
+                "Type":"Choice",
+                "Default":"ComplianceStatusIsAsExpectedFalse",
+                "Choices":[
+                    {
+                        "Variable":"$.GetResourceConfigComplianceFinal.Payload.ComplianceIsAsExpected",
+                        "BooleanEquals":True,
+                        "Next":"ComplianceStatusIsAsExpectedTrue"
                     },
-                    "ComplianceStatusIsAsExpectedTrue":{
-                        "Type":"Succeed"
+                ]
+            },
+            "ComplianceStatusIsAsExpectedTrue":{
+                "Type":"Succeed"
+            },
+            "ComplianceStatusIsAsExpectedFalse":{
+                "Type":"Fail"
+            }
+        }
+        
+        if self.verdict_store:
+            
+            # the verdict store records the latency from the Config notification
+            
+            states["PutEvaluations"]["Parameters"]["Payload"]["NotificationCreationTime.$"] = "$.InvokingEvent.notificationCreationTime"
+        
+        if self.evaluation_order_guard:
+            
+            # a superseded evaluation was not put, and Config holds the newer verdict instead of this one
+            
+            states["PutEvaluations"]["Next"] = "ChoiceEvaluationSuperseded"
+            states["ChoiceEvaluationSuperseded"] = {
+                "Type":"Choice",
+                "Default":"GetResourceConfigComplianceFinal",
+                "Choices":[
+                    {
+                        "Variable":"$.PutEvaluations.Payload.Superseded",
+                        "BooleanEquals":True,
+                        "Next":"ComplianceStatusIsAsExpectedTrue"
                     },
-                    "ComplianceStatusIsAsExpectedFalse":{
-                        "Type":"Fail"
-                    }
+                ]
+            }
+        
+        return states
+    
+    def batch_config_event_processing_definition(self, item_definition:dict):
+        
+        # a batch of Config events: run the single event states per item via Map
+        
+        # a Fail inside the Map would abort the whole batch,
+        # so each item instead ends with whether it succeeded
+        
+        item_states = {}
+        
+        for name, state in item_definition["States"].items():
+            if state["Type"] in ("Succeed", "Fail"):
+                item_states[name] = {
+                    "Type": "Pass",
+                    "Result": state["Type"] == "Succeed",
+                    "End": True,
+                }
+            else:
+                item_states[name] = state
+        
+        return {
+            "StartAt": "ProcessConfigEvents",
+            "States": {
+                "ProcessConfigEvents": {
+                    "Type": "Map",
+                    "Next": "CheckConfigEventsSucceeded",
+                    "ItemsPath": "$.ConfigEvents",
+                    "MaxConcurrency": self.batch_max_concurrency,
+                    "ResultPath": "$.ConfigEventsSucceeded",
+                    "Iterator": {
+                        "StartAt": item_definition["StartAt"],
+                        "States": item_states,
+                    },
+                },
+                "CheckConfigEventsSucceeded": {
+                    "Type": "Pass",
+                    "Next": "ChoiceAllConfigEventsSucceeded",
+                    "Parameters": {
+                        "AnyConfigEventFailed.$": "States.ArrayContains($.ConfigEventsSucceeded, false)"
+                    },
+                    "ResultPath": "$.CheckConfigEventsSucceeded",
+                },
+                "ChoiceAllConfigEventsSucceeded": {
+                    "Type": "Choice",
+                    "Default": "ConfigEventsSucceededTrue",
+                    "Choices": [
+                        {
+                            "Variable": "$.CheckConfigEventsSucceeded.AnyConfigEventFailed",
+                            "BooleanEquals": True,
+                            "Next": "ConfigEventsSucceededFalse"
+                        },
+                    ]
+                },
+                "ConfigEventsSucceededTrue": {
+                    "Type": "Succeed"
+                },
+                "ConfigEventsSucceededFalse": {
+                    "Type": "Fail",
+                    "Error": "ConfigEventsFailed",
+                    # whether each Config event succeeded, for invoked_by_config to redeliver only the failed ones
+                    "CausePath": "States.JsonToString($.ConfigEventsSucceeded)"
                 }
-            })
+            }
+        }
+    
+    def evaluation_pipeline(self):
+        
+        # sign, evaluate, put evaluation and verify in one process, sharing clients and the HTTP session
+        
+        self.lambda_evaluation_pipeline = aws_lambda.Function(
+            self,
+            "EvaluationPipeline",
+            runtime=aws_lambda.Runtime.PYTHON_3_9,
+            handler="evaluation_pipeline.lambda_function.lambda_handler",
+            **self.performance("EvaluationPipeline", timeout=Duration.minutes(5), memory_size=1024),
+            # a failed evaluation is not re-run, as with a failed ConfigEventProcessing execution
+            retry_attempts=0,
+            code=aws_lambda.Code.from_asset(str(paths.LAMBDA_FUNCTIONS)),
+            environment=dict(
+                ControlBrokerInvokeUrl=self.control_broker_apigw_url,
+                ConfigEventsRawInputBucket=self.bucket_config_event_raw_inputs.bucket_name,
+                ControlBrokerConcurrency=str(self.control_broker_concurrency),
+                **self.compliance_cache_environment,
+            ),
+            layers=self.function_layers("evaluation_pipeline"),
+        )
+        
+        self.provisioned_concurrency(self.lambda_evaluation_pipeline)
+        
+        self.grant_compliance_cache(self.lambda_evaluation_pipeline)
+        
+        self.grant_resolve_config_event(self.lambda_evaluation_pipeline)
+        
+        self.grant_evaluation_dedup(self.lambda_evaluation_pipeline)
+        
+        self.grant_verdict_store(self.lambda_evaluation_pipeline)
+        
+        self.grant_evaluation_order(self.lambda_evaluation_pipeline)
+        
+        self.lambda_evaluation_pipeline.role.add_to_policy(
+            aws_iam.PolicyStatement(
+                actions=[
+                    "s3:PutObject",
+                ],
+                resources=[
+                    self.bucket_config_event_raw_inputs.bucket_arn,
+                    self.bucket_config_event_raw_inputs.arn_for_objects("*"),
+                ],
+            )
+        )
+        
+        self.lambda_evaluation_pipeline.role.add_to_policy(
+            aws_iam.PolicyStatement(
+                actions=[
+                    "config:PutEvaluations",
+                    "config:GetComplianceDetailsByResource",
+                    "config:GetComplianceDetailsByConfigRule",
+                ],
+                resources=["*"]
+            )
         )
-
-        self.sfn_config_event_processing.node.add_dependency(self.role_config_event_processing_sfn)
     
     def invoked_by_config(self):
         
+        # EXPRESS executions run synchronously inside this lambda, for at most 5 minutes
+        
+        if self.evaluation_topology == "StepFunctions" and self.state_machine_type == "EXPRESS":
+            timeout = Duration.seconds(330)
+        else:
+            timeout = Duration.seconds(60)
+        
         self.lambda_invoked_by_config = aws_lambda.Function(
             self,
             f"InvokedByConfig",
             code=aws_lambda.Code.from_asset(str(paths.LAMBDA_FUNCTIONS / 'invoked_by_config')),
             handler='lambda_function.lambda_handler',
             runtime=aws_lambda.Runtime.PYTHON_3_9,
-            timeout=Duration.seconds(60),
-            memory_size=1024,
-            environment={
-                
-                "ConfigEventProcessingSfnArn": self.sfn_config_event_processing.attr_arn
-            },
-            layers=[
-                self.layers['requests'],
-                self.layers['aws_requests_auth']
-            ]
+            **self.performance("InvokedByConfig", timeout=timeout, memory_size=1024),
+            environment=dict(
+                ConfigEventsRawInputBucket=self.bucket_config_event_raw_inputs.bucket_name,
+                ConfigEventClaimCheck=str(self.claim_check).lower(),
+            ),
+            layers=self.function_layers("invoked_by_config"),
         )
         
+        self.provisioned_concurrency(self.lambda_invoked_by_config)
+        
+        self.grant_evaluation_dedup(self.lambda_invoked_by_config)
+        
+        self.grant_verdict_store(self.lambda_invoked_by_config)
+        
+        self.grant_evaluation_order(self.lambda_invoked_by_config)
+        
+        # prefiltered NOT_APPLICABLE resources and dedup hits are put straight to Config
+        
         self.lambda_invoked_by_config.role.add_to_policy(
             aws_iam.PolicyStatement(
                 actions=[
-                    "states:StartExecution",
+                    "config:PutEvaluations",
+                ],
+                resources=["*"]
+            )
+        )
+        
+        # oversized configuration items are always claim checked
+        
+        self.lambda_invoked_by_config.role.add_to_policy(
+            aws_iam.PolicyStatement(
+                actions=[
+                    "s3:PutObject",
                 ],
                 resources=[
-                    self.sfn_config_event_processing.attr_arn,
+                    self.bucket_config_event_raw_inputs.arn_for_objects("config-events/*"),
                 ],
             )
         )
         
+        if self.evaluation_topology == "StepFunctions":
+            
+            self.lambda_invoked_by_config.add_environment(
+                "ConfigEventProcessingSfnArn",
+                self.sfn_config_event_processing.attr_arn
+            )
+            self.lambda_invoked_by_config.add_environment(
+                "ConfigEventProcessingSfnType",
+                self.state_machine_type
+            )
+        
+            self.lambda_invoked_by_config.role.add_to_policy(
+                aws_iam.PolicyStatement(
+                    actions=[
+                        "states:StartExecution",
+                        "states:StartSyncExecution",
+                    ],
+                    resources=[
+                        self.sfn_config_event_processing.attr_arn,
+                    ],
+                )
+            )
+        
+        else:
+            
+            self.lambda_invoked_by_config.add_environment(
+                "EvaluationPipelineFunctionName",
+                self.invoke_target(self.lambda_evaluation_pipeline).function_name
+            )
+            
+            self.invoke_target(self.lambda_evaluation_pipeline).grant_invoke(self.lambda_invoked_by_config)
+        
+        if self.batch_evaluation:
+            
+            # buffer Config events, drained by the same lambda into one execution per batch
+            
+            self.queue_config_event_buffer = aws_sqs.Queue(
+                self,
+                "ConfigEventBuffer",
+                visibility_timeout=Duration.seconds(60 * 6),
+                dead_letter_queue=aws_sqs.DeadLetterQueue(
+                    max_receive_count=3,
+                    queue=aws_sqs.Queue(
+                        self,
+                        "ConfigEventBufferDLQ",
+                    ),
+                ),
+            )
+            
+            self.queue_config_event_buffer.grant_send_messages(self.lambda_invoked_by_config)
+            
+            self.lambda_invoked_by_config.add_environment(
+                "ConfigEventBufferQueueUrl",
+                self.queue_config_event_buffer.queue_url
+            )
+            
+            self.invoke_target(self.lambda_invoked_by_config).add_event_source(
+                aws_lambda_event_sources.SqsEventSource(
+                    self.queue_config_event_buffer,
+                    batch_size=self.batch_size,
+                    max_batching_window=Duration.seconds(self.batch_max_batching_window_seconds),
+                    report_batch_item_failures=True,
+                )
+            )
+        
 
-        self.custom_config_rule_sqs_poc = aws_config.CustomRule(
-            self,
-            "SQS-PoC",
-            rule_scope=aws_config.RuleScope.from_resources([
-                aws_config.ResourceType.SQS_QUEUE,
-            ]),
-            lambda_function=self.lambda_invoked_by_config,
-            configuration_changes=True,
-        )
+        self.config_rule_constructs = [
+            ControlBrokerConfigRule(
+                self,
+                rule["Name"],
+                evaluation_function=self.invoke_target(self.lambda_invoked_by_config),
+                resource_types=rule["ResourceTypes"],
+                input_parameters=rule.get("Parameters"),
+                config_rule_name=rule.get("ConfigRuleName"),
+                description=rule.get("Description"),
+            )
+            for rule in self.config_rules
+        ]
 
         log_group_config_compliance = aws_logs.LogGroup(
             self,
@@ -451,7 +1530,19 @@ class ControlBrokerConsumerExampleConfigStack(Stack):
             removal_policy=RemovalPolicy.DESTROY,
         )
 
-        self.custom_config_rule_sqs_poc.on_compliance_change(
-            "Log",
-            target = aws_events_targets.CloudWatchLogGroup(log_group_config_compliance)
-        )
\ No newline at end of file
+        # one EventBridge rule for the compliance changes of every Config rule
+
+        aws_events.Rule(
+            self,
+            "ConfigRulesComplianceChange",
+            event_pattern=aws_events.EventPattern(
+                source=["aws.config"],
+                detail_type=["Config Rules Compliance Change"],
+                detail={
+                    "configRuleName": [rule.config_rule_name for rule in self.config_rule_constructs],
+                },
+            ),
+            targets=[
+                aws_events_targets.CloudWatchLogGroup(log_group_config_compliance),
+            ],
+        )
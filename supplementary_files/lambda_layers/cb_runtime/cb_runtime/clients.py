@@ -0,0 +1,57 @@
+import functools
+import os
+
+import boto3
+from botocore.config import Config
+
+from cb_runtime import logs
+
+# one client per service per execution environment, created on first use rather than at import,
+# so a cold start pays only for the clients its invocation actually calls
+
+def client_config():
+    return Config(
+        connect_timeout = float(os.environ.get('BotoConnectTimeoutSeconds',5)),
+        max_pool_connections = int(os.environ.get('BotoMaxPoolConnections',32)),
+        tcp_keepalive = True,
+        retries = {
+            'mode':'adaptive',
+            'max_attempts':int(os.environ.get('BotoMaxAttempts',5)),
+        },
+    )
+
+@functools.lru_cache(maxsize=None)
+def client(service_name):
+    logs.logger.debug('new client',service_name=service_name)
+    return boto3.client(service_name,config=client_config())
+
+@functools.lru_cache(maxsize=None)
+def resource(service_name):
+    logs.logger.debug('new resource',service_name=service_name)
+    return boto3.resource(service_name,config=client_config())
+
+class LazyClient:
+    """Stands in for client(service_name) at module level, creating it on the first attribute access."""
+
+    def __init__(self,service_name):
+        self.service_name = service_name
+
+    def __getattr__(self,name):
+        return getattr(client(self.service_name),name)
+
+    def __repr__(self):
+        return f'LazyClient({self.service_name!r})'
+
+@functools.lru_cache(maxsize=None)
+def lazy(service_name):
+    # the same stand-in for every module, which outlives reset() as it holds no client itself
+    return LazyClient(service_name)
+
+def region():
+    # set by the Lambda runtime, so no Session is needed to read it
+    return os.environ.get('AWS_REGION') or os.environ.get('AWS_DEFAULT_REGION') or boto3.session.Session().region_name
+
+def reset():
+    # a fresh execution environment, as after a cold start
+    client.cache_clear()
+    resource.cache_clear()
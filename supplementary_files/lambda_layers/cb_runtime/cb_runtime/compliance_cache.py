@@ -0,0 +1,114 @@
+import collections
+import os
+import time
+
+from botocore.exceptions import ClientError
+
+from cb_runtime import clients, logs
+
+# a value of None, no evaluation for the rule, is cached too, so misses are marked by MISS
+
+MISS = object()
+
+def cache_key(*,resource_type,resource_id,config_rule_name):
+    return f'{resource_type}|{resource_id}|{config_rule_name}'
+
+class ComplianceCache:
+    """Compliance by (resource type, resource id, rule name) for GetComplianceDetailsByResource lookups.
+
+    Entries live in memory for ttl_seconds, at most max_entries of them, least recently used evicted first.
+    With a table_name, entries are also written to and read from that DynamoDB table, which then holds them for
+    ttl_seconds. Memory is only a front of the table for memory_ttl_seconds, so invalidations by other lambdas
+    reach this one within memory_ttl_seconds.
+    """
+
+    def __init__(self,*,ttl_seconds,max_entries,table_name=None,memory_ttl_seconds=1,ddb=None,clock=time.time):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.memory_ttl_seconds = memory_ttl_seconds
+        self.clock = clock
+        self.entries = collections.OrderedDict()
+        self.table = None
+        if table_name:
+            self.table = (ddb or clients.resource('dynamodb')).Table(table_name)
+
+    @property
+    def enabled(self):
+        return self.ttl_seconds > 0
+
+    def get(self,key):
+
+        if not self.enabled:
+            return MISS
+
+        now = self.clock()
+
+        entry = self.entries.get(key)
+        if entry is not None:
+            value, expires_at = entry
+            if expires_at > now:
+                self.entries.move_to_end(key)
+                logs.logger.debug('compliance cache hit',key=key)
+                return value
+            del self.entries[key]
+
+        if self.table:
+            try:
+                item = self.table.get_item(Key={'CacheKey':key},ConsistentRead=True).get('Item')
+            except ClientError as e:
+                logs.logger.error('ClientError',operation='GetItem',error=str(e))
+            else:
+                if item and item['ExpiresAt'] > now:
+                    self._remember(key,item.get('Compliance'),float(item['ExpiresAt']),now)
+                    logs.logger.debug('compliance cache table hit',key=key)
+                    return item.get('Compliance')
+
+        logs.logger.debug('compliance cache miss',key=key)
+        return MISS
+
+    def put(self,key,value):
+
+        if not self.enabled:
+            return
+
+        now = self.clock()
+        expires_at = now + self.ttl_seconds
+
+        self._remember(key,value,expires_at,now)
+
+        if self.table:
+            try:
+                self.table.put_item(Item={
+                    'CacheKey': key,
+                    'Compliance': value,
+                    'ExpiresAt': int(expires_at),
+                })
+            except ClientError as e:
+                logs.logger.error('ClientError',operation='PutItem',error=str(e))
+
+    def invalidate(self,key):
+
+        self.entries.pop(key,None)
+
+        if self.table:
+            try:
+                self.table.delete_item(Key={'CacheKey':key})
+            except ClientError as e:
+                # the stale entry then expires from the table after ttl_seconds
+                logs.logger.error('ClientError',operation='DeleteItem',error=str(e))
+
+    def _remember(self,key,value,expires_at,now):
+        if self.table:
+            # read again from the table soon, where other lambdas invalidate it
+            expires_at = min(expires_at,now + self.memory_ttl_seconds)
+        self.entries[key] = (value,expires_at)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+def from_environment():
+    return ComplianceCache(
+        ttl_seconds = int(os.environ.get('ComplianceCacheTtlSeconds',0)),
+        max_entries = int(os.environ.get('ComplianceCacheMaxEntries',1024)),
+        table_name = os.environ.get('ComplianceCacheTableName'),
+    )
@@ -0,0 +1,159 @@
+import hashlib
+import json
+from datetime import datetime
+
+from botocore.exceptions import ClientError
+
+from cb_runtime import logs
+
+OVERSIZED_MESSAGE_TYPE = 'OversizedConfigurationItemChangeNotification'
+
+# periodic rules are notified without any configuration item
+SCHEDULED_MESSAGE_TYPE = 'ScheduledNotification'
+
+# the configuration item fields read by the states that do not need the full payload
+
+ROUTING_FIELDS = [
+    'resourceType',
+    'resourceId',
+    'resourceName',
+    'configurationItemStatus',
+    'configurationItemCaptureTime',
+]
+
+def is_oversized(invoking_event):
+    return invoking_event.get('messageType') == OVERSIZED_MESSAGE_TYPE
+
+def is_scheduled(invoking_event):
+    return invoking_event.get('messageType') == SCHEDULED_MESSAGE_TYPE
+
+def routing_configuration_item(invoking_event):
+    # oversized notifications carry only a configurationItemSummary
+    configuration_item = invoking_event.get('configurationItem') or invoking_event['configurationItemSummary']
+    return {field: configuration_item.get(field) for field in ROUTING_FIELDS}
+
+def ordering_timestamp(invoking_event):
+    # when Config recorded the configuration item being evaluated, or for periodic rules when it notified us
+    configuration_item = invoking_event.get('configurationItem') or invoking_event.get('configurationItemSummary') or {}
+    return configuration_item.get('configurationItemCaptureTime') or invoking_event.get('notificationCreationTime')
+
+def parse_time(value):
+    # Config notification times, such as 2022-06-01T17:22:43.213Z, or datetimes from the Config API
+    if hasattr(value,'isoformat'):
+        return value
+    return datetime.fromisoformat(value.replace('Z','+00:00'))
+
+def claim_check_key(config_event):
+    digest = hashlib.sha256(json.dumps(config_event,sort_keys=True).encode()).hexdigest()
+    return f'config-events/{config_event["configRuleName"]}/{digest}.json'
+
+def store_config_event(config_event,*,bucket,s3):
+    """Put the raw Config event in S3 and return the ClaimCheck pointer to it."""
+
+    key = claim_check_key(config_event)
+
+    try:
+        s3.put_object(
+            Bucket = bucket,
+            Key = key,
+            Body = json.dumps(config_event),
+        )
+    except ClientError as e:
+        logs.logger.error('ClientError',operation='PutObject',error=str(e))
+        raise
+    else:
+        logs.logger.debug('put object',bucket=bucket,key=key)
+        return {'Bucket': bucket, 'Key': key}
+
+def slim_config_event(config_event,*,claim_check):
+    """The Config event with its invokingEvent cut down to the routing fields, plus the ClaimCheck pointer."""
+
+    invoking_event = json.loads(config_event['invokingEvent'])
+
+    return {
+        **{k: v for k, v in config_event.items() if k != 'invokingEvent'},
+        'invokingEvent': json.dumps({
+            'configurationItem': routing_configuration_item(invoking_event),
+            'notificationCreationTime': invoking_event.get('notificationCreationTime'),
+            'messageType': invoking_event.get('messageType'),
+        }),
+        'ClaimCheck': claim_check,
+    }
+
+def load_config_event(claim_check,*,s3):
+    try:
+        r = s3.get_object(
+            Bucket = claim_check['Bucket'],
+            Key = claim_check['Key'],
+        )
+    except ClientError as e:
+        logs.logger.error('ClientError',operation='GetObject',error=str(e))
+        raise
+    else:
+        return json.loads(r['Body'].read())
+
+def isoformat(timestamp):
+    return timestamp.isoformat() if hasattr(timestamp,'isoformat') else timestamp
+
+def configuration_item_from_history(history_item):
+    # GetResourceConfigHistory names and types differ from those of change notifications
+    return {
+        'configurationItemVersion': history_item.get('version'),
+        'configurationItemCaptureTime': isoformat(history_item.get('configurationItemCaptureTime')),
+        'configurationStateId': history_item.get('configurationStateId'),
+        'awsAccountId': history_item.get('accountId'),
+        'configurationItemStatus': history_item.get('configurationItemStatus'),
+        'resourceType': history_item.get('resourceType'),
+        'resourceId': history_item.get('resourceId'),
+        'resourceName': history_item.get('resourceName'),
+        'ARN': history_item.get('arn'),
+        'awsRegion': history_item.get('awsRegion'),
+        'availabilityZone': history_item.get('availabilityZone'),
+        'configurationStateMd5Hash': history_item.get('configurationItemMD5Hash'),
+        'resourceCreationTime': isoformat(history_item.get('resourceCreationTime')),
+        'tags': history_item.get('tags',{}),
+        'relatedEvents': history_item.get('relatedEvents',[]),
+        'relationships': history_item.get('relationships',[]),
+        'configuration': json.loads(history_item.get('configuration') or 'null'),
+        'supplementaryConfiguration': history_item.get('supplementaryConfiguration',{}),
+    }
+
+def resolve_oversized_invoking_event(invoking_event,*,config):
+    summary = invoking_event['configurationItemSummary']
+
+    try:
+        r = config.get_resource_config_history(
+            resourceType = summary['resourceType'],
+            resourceId = summary['resourceId'],
+            laterTime = summary['configurationItemCaptureTime'],
+            limit = 1,
+        )
+    except ClientError as e:
+        logs.logger.error('ClientError',operation='GetResourceConfigHistory',error=str(e))
+        raise
+    else:
+        return {
+            'configurationItemDiff': None,
+            'configurationItem': configuration_item_from_history(r['configurationItems'][0]),
+            'notificationCreationTime': invoking_event.get('notificationCreationTime'),
+            'messageType': 'ConfigurationItemChangeNotification',
+            'recordVersion': invoking_event.get('recordVersion'),
+        }
+
+def resolve_config_event(config_event,*,s3,config):
+    """The full Config event: fetched from its ClaimCheck, with an oversized configuration item read from its history."""
+
+    if 'ClaimCheck' in config_event:
+        logs.logger.info('resolving claim check',claim_check=config_event['ClaimCheck'])
+        config_event = load_config_event(config_event['ClaimCheck'],s3=s3)
+
+    invoking_event = json.loads(config_event['invokingEvent'])
+
+    if is_oversized(invoking_event):
+        logs.logger.info('resolving oversized configuration item')
+        config_event = {
+            **config_event,
+            'invokingEvent': json.dumps(resolve_oversized_invoking_event(invoking_event,config=config)),
+        }
+
+    return config_event
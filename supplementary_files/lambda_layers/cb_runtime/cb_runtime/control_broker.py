@@ -0,0 +1,52 @@
+import os
+
+from cb_runtime import logs
+
+# SigV4 signing and request envelope shared by the blocking and asyncio Control Broker clients,
+# requests and aws_requests_auth are imported on first use, not when a handler module loads
+
+def cb_input_object(config_event):
+    return {
+        "Context":{
+            "EnvironmentEvaluation":"Prod",
+        },
+        "Input": config_event
+    }
+
+signers = {}
+
+def credentials_fingerprint():
+    # Lambda supplies credentials through the environment, which changes only when they rotate
+    return (
+        os.environ.get('AWS_ACCESS_KEY_ID'),
+        os.environ.get('AWS_SESSION_TOKEN'),
+    )
+
+def get_signer(*,host,region):
+    cached = signers.get(host)
+    if cached and cached[0] == credentials_fingerprint():
+        return cached[1]
+
+    from aws_requests_auth.boto_utils import BotoAWSRequestsAuth
+
+    logs.logger.debug('new signer',host=host)
+    signer = BotoAWSRequestsAuth(
+        aws_host=host,
+        aws_region=region,
+        aws_service='execute-api'
+    )
+    signers[host] = (credentials_fingerprint(),signer)
+    return signer
+
+def signed_headers(*,signer,url,body):
+    # sign as requests would, for clients that send the body themselves
+    import requests
+
+    prepared = requests.Request(
+        'POST',
+        url,
+        data = body,
+        headers = {'Content-Type':'application/json'},
+    ).prepare()
+    signer(prepared)
+    return dict(prepared.headers)
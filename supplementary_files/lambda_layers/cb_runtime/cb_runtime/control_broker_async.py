@@ -0,0 +1,140 @@
+"""Concurrent signed POSTs of Config events to Control Broker over asyncio.
+
+Requests are signed and wrapped exactly as by sign_apigw_request. At most `concurrency` requests are in flight,
+over at most `limit_per_host` pooled connections per host, and at most `max_pending` events are read ahead of
+the responses, so arbitrarily long iterables of events are streamed rather than loaded.
+
+From a batch lambda:
+
+    responses = post_config_events(config_events, full_invoke_url=url, concurrency=16)
+
+From the command line, one Config event per line in, one response per line out, in completion order:
+
+    PYTHONPATH=supplementary_files/lambda_layers/cb_runtime \\
+    python -m cb_runtime.control_broker_async --invoke-url URL --concurrency 64 < config_events.jsonl
+"""
+import argparse
+import asyncio
+import json
+import re
+import sys
+
+import aiohttp
+
+from cb_runtime import clients, control_broker, logs, metrics
+
+def get_host(full_invoke_url):
+    return re.search('https?://([^/]*)/.*',full_invoke_url).group(1)
+
+class AsyncControlBrokerClient:
+
+    def __init__(self,*,full_invoke_url,region=None,concurrency=32,limit_per_host=None,max_pending=None,timeout_seconds=60):
+        self.full_invoke_url = full_invoke_url
+        self.host = get_host(full_invoke_url)
+        self.region = region or clients.region()
+        self.concurrency = concurrency
+        self.limit_per_host = limit_per_host or concurrency
+        self.max_pending = max_pending or 2 * concurrency
+        self.timeout_seconds = timeout_seconds
+
+    async def __aenter__(self):
+        self.semaphore = asyncio.Semaphore(self.concurrency)
+        self.session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=self.limit_per_host,limit_per_host=self.limit_per_host),
+            timeout=aiohttp.ClientTimeout(total=self.timeout_seconds),
+        )
+        return self
+
+    async def __aexit__(self,*exc):
+        await self.session.close()
+
+    async def post_config_event(self,config_event):
+        """The Control Broker response, or False for a non-200 status or a failed request."""
+
+        body = json.dumps(control_broker.cb_input_object(config_event))
+
+        async with self.semaphore:
+            with metrics.timer('SignLatency'):
+                headers = control_broker.signed_headers(
+                    signer = control_broker.get_signer(host=self.host,region=self.region),
+                    url = self.full_invoke_url,
+                    body = body,
+                )
+            try:
+                with metrics.timer('ControlBrokerLatency') as properties:
+                    async with self.session.post(self.full_invoke_url,data=body,headers=headers) as r:
+                        content = await r.read()
+                        status_code = properties['StatusCode'] = r.status
+            except (aiohttp.ClientError,asyncio.TimeoutError) as e:
+                logs.logger.error(type(e).__name__,error=str(e))
+                metrics.emit('ControlBrokerErrors',1)
+                return False
+
+        metrics.emit('ControlBrokerErrors',int(status_code != 200),StatusCode=status_code)
+
+        if status_code != 200:
+            logs.logger.error('Control Broker request failed',status_code=status_code,content=content.decode(errors='replace'))
+            return False
+
+        return json.loads(content)
+
+    async def map_config_events(self,config_events):
+        """Yield (index, response) as responses complete, reading at most max_pending events ahead."""
+
+        config_events = iter(enumerate(config_events))
+        pending = set()
+
+        async def post(index,config_event):
+            return index, await self.post_config_event(config_event)
+
+        while True:
+            for index, config_event in config_events:
+                pending.add(asyncio.ensure_future(post(index,config_event)))
+                if len(pending) >= self.max_pending:
+                    break
+            if not pending:
+                return
+            done, pending = await asyncio.wait(pending,return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                yield task.result()
+
+async def post_config_events_async(config_events,**kwargs):
+    config_events = list(config_events)
+    responses = [None] * len(config_events)
+    async with AsyncControlBrokerClient(**kwargs) as client:
+        async for index, response in client.map_config_events(config_events):
+            responses[index] = response
+    return responses
+
+def post_config_events(config_events,**kwargs):
+    """Blocking entry point: the responses in the order of config_events."""
+    return asyncio.run(post_config_events_async(config_events,**kwargs))
+
+async def main_async(args):
+    async with AsyncControlBrokerClient(
+        full_invoke_url = args.invoke_url,
+        region = args.region,
+        concurrency = args.concurrency,
+        limit_per_host = args.limit_per_host,
+        max_pending = args.max_pending,
+        timeout_seconds = args.timeout_seconds,
+    ) as client:
+        config_events = (json.loads(line) for line in sys.stdin if line.strip())
+        async for index, response in client.map_config_events(config_events):
+            print(json.dumps({'Index':index,'Response':response}))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--invoke-url',required=True,help='Control Broker /ConfigEvent invoke URL')
+    parser.add_argument('--region')
+    parser.add_argument('--concurrency',type=int,default=32)
+    parser.add_argument('--limit-per-host',type=int)
+    parser.add_argument('--max-pending',type=int)
+    parser.add_argument('--timeout-seconds',type=float,default=60)
+    # responses are written to stdout, so logs and metrics go to stderr
+    logs.logger.stream = sys.stderr
+    metrics.stream = sys.stderr
+    asyncio.run(main_async(parser.parse_args()))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+import hashlib
+import json
+import os
+import time
+
+from botocore.exceptions import ClientError
+
+from cb_runtime import clients, logs
+
+def normalize(value):
+    # key order and embedded JSON documents, such as queue policies, are not part of the content
+    if isinstance(value,dict):
+        return {k: normalize(v) for k, v in value.items()}
+    if isinstance(value,list):
+        return [normalize(v) for v in value]
+    if isinstance(value,str) and value[:1] in ('{','['):
+        try:
+            return normalize(json.loads(value))
+        except ValueError:
+            return value
+    return value
+
+def content_hash(*,configuration_item,config_rule_name,policy_version):
+    """sha256 of what the verdict depends on: the normalized configuration, the rule and the policy version.
+
+    Tags and supplementary configuration are included too, so a policy that reads them never gets a stale verdict.
+    """
+    document = {
+        'ResourceType': configuration_item['resourceType'],
+        'Configuration': normalize(configuration_item.get('configuration')),
+        'SupplementaryConfiguration': normalize(configuration_item.get('supplementaryConfiguration')),
+        'Tags': configuration_item.get('tags'),
+        'ConfigRuleName': config_rule_name,
+        'PolicyVersion': policy_version,
+    }
+    return hashlib.sha256(json.dumps(document,sort_keys=True,separators=(',',':')).encode()).hexdigest()
+
+class EvaluationDedup:
+    """Verdicts by content hash, kept in a DynamoDB table for ttl_seconds."""
+
+    def __init__(self,*,table_name,ttl_seconds,policy_version=None,ddb=None,clock=time.time):
+        self.table = (ddb or clients.resource('dynamodb')).Table(table_name)
+        self.ttl_seconds = ttl_seconds
+        self.policy_version = policy_version
+        self.clock = clock
+
+    def content_hash(self,*,configuration_item,config_rule_name):
+        return content_hash(
+            configuration_item = configuration_item,
+            config_rule_name = config_rule_name,
+            policy_version = self.policy_version,
+        )
+
+    def get_verdict(self,content_hash):
+        try:
+            item = self.table.get_item(Key={'ContentHash':content_hash}).get('Item')
+        except ClientError as e:
+            # evaluate as if never seen
+            logs.logger.error('ClientError',operation='GetItem',error=str(e))
+            return None
+        if item and item['ExpiresAt'] > self.clock():
+            return item['IsCompliant']
+        return None
+
+    def put_verdict(self,content_hash,is_compliant):
+        try:
+            self.table.put_item(Item={
+                'ContentHash': content_hash,
+                'IsCompliant': is_compliant,
+                'ExpiresAt': int(self.clock() + self.ttl_seconds),
+            })
+        except ClientError as e:
+            logs.logger.error('ClientError',operation='PutItem',error=str(e))
+
+def from_environment():
+    table_name = os.environ.get('EvaluationDedupTableName')
+    if not table_name:
+        return None
+    return EvaluationDedup(
+        table_name = table_name,
+        ttl_seconds = int(os.environ.get('EvaluationDedupTtlSeconds',86400)),
+        policy_version = os.environ.get('ControlBrokerPolicyVersion'),
+    )
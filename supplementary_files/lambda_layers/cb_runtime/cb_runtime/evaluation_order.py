@@ -0,0 +1,90 @@
+import os
+
+from botocore.exceptions import ClientError
+
+from cb_runtime import clients, config_events, logs, metrics
+from cb_runtime.verdict_store import resource_key
+
+class Claim:
+    """The OrderingTimestamp an evaluation moved its resource to, and the one before it, put back by release()"""
+
+    def __init__(self,*,key=None,ordering_millis=None,previous_millis=None):
+        self.key = key
+        self.ordering_millis = ordering_millis
+        self.previous_millis = previous_millis
+
+class EvaluationOrder:
+    """The OrderingTimestamp of the newest evaluation put per Config rule and resource, in a DynamoDB table.
+
+    Concurrent evaluations of one resource can finish out of order. Each claims its resource before PutEvaluations
+    with a conditional write that only moves the timestamp forward, so the evaluation of an older configuration item
+    than one already put is dropped instead of overwriting the newer verdict. Equal timestamps pass, so a retried
+    put of the same evaluation is not dropped.
+    """
+
+    def __init__(self,*,table_name,ddb=None):
+        self.table = (ddb or clients.resource('dynamodb')).Table(table_name)
+
+    def claim(self,*,config_rule_name,resource_type,resource_id,ordering_timestamp):
+        """False when a newer evaluation of the resource was put already, otherwise the Claim to release if the put fails"""
+
+        key = {
+            'ConfigRuleName': config_rule_name,
+            'ResourceKey': resource_key(resource_type=resource_type,resource_id=resource_id),
+        }
+        ordering_millis = int(config_events.parse_time(ordering_timestamp).timestamp() * 1000)
+
+        try:
+            r = self.table.update_item(
+                Key=key,
+                UpdateExpression='SET OrderingTimestamp = :OrderingTimestamp',
+                ConditionExpression='attribute_not_exists(OrderingTimestamp) OR OrderingTimestamp <= :OrderingTimestamp',
+                ExpressionAttributeValues={':OrderingTimestamp': ordering_millis},
+                ReturnValues='UPDATED_OLD',
+            )
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                # put unguarded, as without the table, so there is nothing to release
+                logs.logger.error('ClientError',operation='UpdateItem',error=str(e))
+                return Claim()
+            logs.logger.warning('stale evaluation dropped',config_rule_name=config_rule_name,resource_id=resource_id,ordering_timestamp=str(ordering_timestamp))
+            metrics.emit('StaleEvaluationDropped',1,ConfigRuleName=config_rule_name)
+            return False
+
+        metrics.emit('StaleEvaluationDropped',0,ConfigRuleName=config_rule_name)
+        return Claim(
+            key = key,
+            ordering_millis = ordering_millis,
+            previous_millis = r.get('Attributes',{}).get('OrderingTimestamp'),
+        )
+
+    def release(self,claim):
+        """Put back the OrderingTimestamp a failed put moved forward, so older evaluations in flight are not dropped"""
+
+        if not claim.key:
+            return
+
+        # only while no newer evaluation claimed the resource since
+        if claim.previous_millis is None:
+            update = {'UpdateExpression':'REMOVE OrderingTimestamp','ExpressionAttributeValues':{':OrderingTimestamp': claim.ordering_millis}}
+        else:
+            update = {
+                'UpdateExpression':'SET OrderingTimestamp = :PreviousOrderingTimestamp',
+                'ExpressionAttributeValues':{':OrderingTimestamp': claim.ordering_millis,':PreviousOrderingTimestamp': claim.previous_millis},
+            }
+
+        try:
+            self.table.update_item(
+                Key=claim.key,
+                ConditionExpression='OrderingTimestamp = :OrderingTimestamp',
+                **update,
+            )
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                logs.logger.error('ClientError',operation='UpdateItem',error=str(e))
+
+def from_environment():
+    table_name = os.environ.get('EvaluationOrderTableName')
+    if not table_name:
+        return None
+    return EvaluationOrder(table_name=table_name)
@@ -0,0 +1,111 @@
+"""Structured logging shared by the handlers, one JSON object per line.
+
+Each record carries its level, message and the request id of the invocation, plus any fields. Payload fields are
+redacted and truncated before they are written: signed headers, session tokens and the signature of presigned URLs
+never reach CloudWatch, and no field is longer than LogPayloadMaxBytes.
+
+LogLevel is the threshold, INFO by default. LogSampleRate is the fraction of invocations logged at DEBUG whatever
+the threshold, so full payloads are still seen for a sample of the traffic:
+
+    log = logs.logger
+
+    def lambda_handler(event,context):
+        log.start_invocation(context)
+        log.debug('event',event=event)
+"""
+import json
+import os
+import random
+import re
+import sys
+import time
+
+LEVELS = {
+    'DEBUG':10,
+    'INFO':20,
+    'WARNING':30,
+    'ERROR':40,
+}
+
+REDACTED = '[REDACTED]'
+
+# header and field names, compared case-insensitively
+SENSITIVE_KEY = re.compile(r'authorization|security-?token|session-?token|task_?token|secret|password|signature|credential',re.IGNORECASE)
+
+# the query string of a presigned URL is a bearer credential
+PRESIGNED_QUERY = re.compile(r'(X-Amz-(?:Signature|Credential|Security-Token)=)[^&"\s]+')
+
+def redact(value):
+    if isinstance(value,dict):
+        return {k: REDACTED if SENSITIVE_KEY.search(str(k)) else redact(v) for k, v in value.items()}
+    if isinstance(value,(list,tuple)):
+        return [redact(v) for v in value]
+    if isinstance(value,str):
+        return PRESIGNED_QUERY.sub(rf'\1{REDACTED}',value)
+    return value
+
+def truncate(value,max_bytes):
+    # payloads short enough are kept as they are, longer ones become a prefix of their JSON
+    encoded = json.dumps(value,default=str)
+    if len(encoded) <= max_bytes:
+        return value
+    return f'{encoded[:max_bytes]}...[truncated {len(encoded) - max_bytes} bytes]'
+
+class Logger:
+
+    def __init__(self,*,level='INFO',sample_rate=0.0,max_payload_bytes=2048,stream=None,random=random.random):
+        if level not in LEVELS:
+            raise ValueError(f'level must be one of {", ".join(LEVELS)}, not {level}')
+        self.level = level
+        self.sample_rate = sample_rate
+        self.max_payload_bytes = max_payload_bytes
+        self.stream = stream
+        self.random = random
+        self.request_id = None
+        self.sampled = False
+
+    def start_invocation(self,context=None):
+        # sampled once per invocation, so a sampled invocation is logged in full from start to end
+        self.request_id = getattr(context,'aws_request_id',None)
+        self.sampled = self.sample_rate > 0 and self.random() < self.sample_rate
+
+    def enabled(self,level):
+        return self.sampled or LEVELS[level] >= LEVELS[self.level]
+
+    def log(self,level,message,**fields):
+        if not self.enabled(level):
+            return
+        record = {
+            'level':level,
+            'message':message,
+            'timestamp':round(time.time(),3),
+        }
+        if self.request_id:
+            record['request_id'] = self.request_id
+        if self.sampled:
+            record['sampled'] = True
+        for k, v in fields.items():
+            record[k] = truncate(redact(v),self.max_payload_bytes)
+        print(json.dumps(record,default=str),file=self.stream or sys.stdout)
+
+    def debug(self,message,**fields):
+        self.log('DEBUG',message,**fields)
+
+    def info(self,message,**fields):
+        self.log('INFO',message,**fields)
+
+    def warning(self,message,**fields):
+        self.log('WARNING',message,**fields)
+
+    def error(self,message,**fields):
+        self.log('ERROR',message,**fields)
+
+def from_environment():
+    return Logger(
+        level = os.environ.get('LogLevel','INFO').upper(),
+        sample_rate = float(os.environ.get('LogSampleRate',0)),
+        max_payload_bytes = int(os.environ.get('LogPayloadMaxBytes',2048)),
+    )
+
+# one logger per execution environment, shared by every module, so sampling applies to the whole invocation
+logger = from_environment()
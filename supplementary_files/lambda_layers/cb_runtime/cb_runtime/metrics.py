@@ -0,0 +1,73 @@
+"""Pipeline metrics as CloudWatch embedded metric format, one JSON document per line of the function's log.
+
+Metrics are declared in metric_definitions.json, which the stack also reads to build the dashboard and the p99
+alarms, so a metric cannot be emitted without being charted:
+
+    with metrics.timer('PutEvaluationsLatency'):
+        config.put_evaluations(...)
+
+    metrics.emit('ControlBrokerErrors',1,StatusCode=502)
+
+Keyword arguments become properties of the document, searchable in Logs Insights but not dimensions.
+Tests collect the documents instead of printing them:
+
+    with metrics.capture() as emitted:
+        ...
+    assert emitted[0]['ControlBrokerErrors'] == 1
+"""
+import contextlib
+import json
+import pathlib
+import sys
+import time
+
+DEFINITIONS_PATH = pathlib.Path(__file__).resolve().parent / 'metric_definitions.json'
+
+with open(DEFINITIONS_PATH) as f:
+    DEFINITIONS = json.load(f)
+
+NAMESPACE = DEFINITIONS['Namespace']
+
+# where documents go, stdout in Lambda, a list while captured
+sink = None
+stream = None
+
+def document(name,value,**properties):
+    definition = DEFINITIONS['Metrics'][name]
+    return {
+        '_aws': {
+            'Timestamp': int(time.time() * 1000),
+            'CloudWatchMetrics': [{
+                'Namespace': NAMESPACE,
+                'Dimensions': [[]],
+                'Metrics': [{'Name': name, 'Unit': definition['Unit']}],
+            }],
+        },
+        name: value,
+        **properties,
+    }
+
+def emit(name,value,**properties):
+    doc = document(name,value,**properties)
+    if sink is not None:
+        sink.append(doc)
+    else:
+        print(json.dumps(doc,default=str),file=stream or sys.stdout)
+
+@contextlib.contextmanager
+def timer(name,**properties):
+    start = time.perf_counter()
+    try:
+        yield properties
+    finally:
+        # properties may be added inside the block, such as the status of a response
+        emit(name,round((time.perf_counter() - start) * 1000,3),**properties)
+
+@contextlib.contextmanager
+def capture():
+    global sink
+    previous, sink = sink, []
+    try:
+        yield sink
+    finally:
+        sink = previous
@@ -0,0 +1,115 @@
+"""Decide from the Config rule's parameters whether a Config event needs Control Broker at all.
+
+Decided in invoked_by_config, before any execution is started:
+
+    decision, reason = prefilter.decide(rule_parameters=rule_parameters,invoking_event=invoking_event)
+
+EVALUATE starts the evaluation as before. NOT_APPLICABLE is put to Config as is, for a resource the rule does not
+cover. SKIP leaves the resource's last evaluation standing, for a change to fields the rule does not read.
+
+Rule parameters are strings, as Config passes them, lists either JSON or comma separated:
+
+    ResourceTypes               AWS::SQS::Queue,AWS::SNS::Topic
+    TagSelector                 {"Environment": ["prod", "staging"], "Owner": "*"}
+    ConfigurationPredicates     [{"Path": "$.configuration.FifoQueue", "Equals": true}]
+    ChangedFieldsOfInterest     Configuration.Policy,Configuration.KmsMasterKeyId,Tags
+
+A tag selector value is the tag's value, a list of allowed values, or "*" for any value. A predicate tests the
+configuration item at Path with Equals, In or Exists. Changed fields are compared with the changedProperties of the
+notification's configurationItemDiff, a field covering every property below it.
+
+Whatever cannot be decided from the event, such as the tags of an oversized notification or the changes of a new
+resource, is evaluated.
+"""
+import json
+import re
+
+EVALUATE = 'EVALUATE'
+NOT_APPLICABLE = 'NOT_APPLICABLE'
+SKIP = 'SKIP'
+
+PATH_TOKEN = re.compile(r'\.([^.\[\]]+)|\[(\d+)\]')
+
+MISSING = object()
+
+def parameter(rule_parameters,name):
+    value = rule_parameters.get(name)
+    if isinstance(value,str):
+        stripped = value.strip()
+        if stripped[:1] in ('[','{'):
+            return json.loads(stripped)
+        if name in ('ResourceTypes','ChangedFieldsOfInterest'):
+            return [v.strip() for v in stripped.split(',') if v.strip()]
+    return value
+
+def get_path(document,path):
+    if not path.startswith('$'):
+        raise ValueError(f'predicate path must start with $, not {path}')
+    value = document
+    for m in PATH_TOKEN.finditer(path[1:]):
+        key = m.group(1) if m.group(1) is not None else int(m.group(2))
+        try:
+            value = value[key]
+        except (KeyError,IndexError,TypeError):
+            return MISSING
+    return value
+
+def tags_match(tags,selector):
+    for key, allowed in selector.items():
+        if key not in tags:
+            return False
+        if allowed in ('*',None):
+            continue
+        if tags[key] not in (allowed if isinstance(allowed,list) else [allowed]):
+            return False
+    return True
+
+def predicate_holds(configuration_item,predicate):
+    value = get_path(configuration_item,predicate['Path'])
+    if 'Exists' in predicate:
+        return (value is not MISSING) == predicate['Exists']
+    if 'Equals' in predicate:
+        return value == predicate['Equals']
+    if 'In' in predicate:
+        return value in predicate['In']
+    raise ValueError(f'predicate on {predicate["Path"]} needs Equals, In or Exists')
+
+def changed_fields_of_interest(changed_properties,fields):
+    # a field covers the properties below it: Configuration.Policy covers Configuration.Policy.Statement.0
+    fields = [f.lower() for f in fields]
+    return [
+        changed for changed in changed_properties
+        if any(changed.lower() == f or changed.lower().startswith(f'{f}.') for f in fields)
+    ]
+
+def decide(*,rule_parameters,invoking_event):
+    """(EVALUATE, NOT_APPLICABLE or SKIP, the reason for it)"""
+
+    configuration_item = invoking_event.get('configurationItem')
+    summary = configuration_item or invoking_event.get('configurationItemSummary') or {}
+
+    resource_types = parameter(rule_parameters,'ResourceTypes')
+    if resource_types and summary.get('resourceType') not in resource_types:
+        return NOT_APPLICABLE, f'resource type {summary.get("resourceType")} is not one of {", ".join(resource_types)}'
+
+    # the rest reads the full configuration item, which oversized notifications leave out
+    if not configuration_item:
+        return EVALUATE, 'no configuration item in the notification'
+
+    tag_selector = parameter(rule_parameters,'TagSelector')
+    if tag_selector and not tags_match(configuration_item.get('tags') or {},tag_selector):
+        return NOT_APPLICABLE, 'tags do not match the tag selector'
+
+    for predicate in parameter(rule_parameters,'ConfigurationPredicates') or []:
+        if not predicate_holds(configuration_item,predicate):
+            return NOT_APPLICABLE, f'predicate on {predicate["Path"]} does not hold'
+
+    fields = parameter(rule_parameters,'ChangedFieldsOfInterest')
+    if fields:
+        diff = invoking_event.get('configurationItemDiff')
+        if not diff or diff.get('changeType') != 'UPDATE':
+            return EVALUATE, 'no previous configuration item to compare with'
+        if not changed_fields_of_interest(diff.get('changedProperties') or {},fields):
+            return SKIP, 'no field of interest changed'
+
+    return EVALUATE, 'in scope'
@@ -0,0 +1,69 @@
+"""Task tokens of executions waiting on a results report, in the ResultsReportWaiters DynamoDB table.
+
+Both sides of the race resume an execution through pop_waiter(): wait_for_results_report when the report already
+exists as it registers, results_report_written on the report's S3 Object Created event. The delete returns the task
+token to only one of them, so the execution is resumed once.
+"""
+import json
+import os
+import time
+
+from botocore.exceptions import ClientError
+
+from cb_runtime import clients, logs
+
+ddb = clients.lazy('dynamodb')
+sfn = clients.lazy('stepfunctions')
+
+# an execution that timed out waiting, or was resumed by the other side already
+NOT_WAITING_ERROR_CODES = ('TaskTimedOut','TaskDoesNotExist','InvalidToken')
+
+def report_key(*,bucket,key):
+    return f'{bucket}/{key}'
+
+def put_waiter(*,report_key,task_token,ttl_seconds):
+    try:
+        ddb.put_item(
+            TableName=os.environ['ResultsReportWaitersTable'],
+            Item={
+                'ReportKey': {'S': report_key},
+                'TaskToken': {'S': task_token},
+                'ExpiresAt': {'N': str(int(time.time()) + ttl_seconds)},
+            }
+        )
+    except ClientError as e:
+        logs.logger.error('ClientError',operation='PutItem',error=str(e))
+        raise
+    else:
+        logs.logger.info('registered waiter',report_key=report_key)
+        return True
+
+def pop_waiter(*,report_key):
+    # delete and return the task token, so only one of waiter and notifier resumes the execution
+    try:
+        r = ddb.delete_item(
+            TableName=os.environ['ResultsReportWaitersTable'],
+            Key={'ReportKey': {'S': report_key}},
+            ReturnValues='ALL_OLD',
+        )
+    except ClientError as e:
+        logs.logger.error('ClientError',operation='DeleteItem',error=str(e))
+        raise
+    else:
+        attributes = r.get('Attributes')
+        return attributes['TaskToken']['S'] if attributes else None
+
+def send_report_ready(*,task_token,report_key):
+    try:
+        sfn.send_task_success(
+            taskToken=task_token,
+            output=json.dumps({'ReportKey': report_key})
+        )
+    except ClientError as e:
+        if e.response['Error']['Code'] in NOT_WAITING_ERROR_CODES:
+            logs.logger.warning('execution no longer waiting',error=str(e))
+            return False
+        raise
+    else:
+        logs.logger.info('sent task success',report_key=report_key)
+        return True
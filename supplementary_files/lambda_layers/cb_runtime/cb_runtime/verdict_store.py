@@ -0,0 +1,110 @@
+import os
+import time
+from datetime import datetime, timezone
+
+from botocore.exceptions import ClientError
+
+from cb_runtime import clients, config_events, logs, metrics
+
+# the previous verdict of a resource evaluated for the first time
+NO_VERDICT = 'NONE'
+
+def resource_key(*,resource_type,resource_id):
+    return f'{resource_type}/{resource_id}'
+
+def timestamp(value):
+    return config_events.parse_time(value).timestamp()
+
+def isoformat(seconds):
+    return datetime.fromtimestamp(seconds,timezone.utc).isoformat(timespec='milliseconds').replace('+00:00','Z')
+
+class VerdictStore:
+    """The current verdict per Config rule and resource, in a DynamoDB table keyed by ConfigRuleName and ResourceKey.
+
+    Every evaluation put to Config refreshes its item: ComplianceType, EvaluatedAt, PolicyVersion and LatencyMs, the
+    time from the Config notification to the verdict. Only a write changing the ComplianceType sets Transition, with
+    PreviousComplianceType and ChangedAt, so the table's stream filtered on Transition is a feed of verdict changes.
+    """
+
+    def __init__(self,*,table_name,policy_version=None,ddb=None,clock=time.time):
+        self.table = (ddb or clients.resource('dynamodb')).Table(table_name)
+        self.policy_version = policy_version
+        self.clock = clock
+
+    def record(self,*,config_rule_name,resource_type,resource_id,compliance_type,notification_creation_time=None):
+        """Write the verdict, returning whether it changed, or None when it could not be written"""
+
+        now = self.clock()
+
+        fields = {
+            'ResourceType': resource_type,
+            'ResourceId': resource_id,
+            'ComplianceType': compliance_type,
+            'EvaluatedAt': isoformat(now),
+        }
+        if self.policy_version:
+            fields['PolicyVersion'] = self.policy_version
+        if notification_creation_time:
+            fields['LatencyMs'] = round((now - timestamp(notification_creation_time)) * 1000)
+            metrics.emit('VerdictLatency',fields['LatencyMs'],ConfigRuleName=config_rule_name)
+
+        key = {
+            'ConfigRuleName': config_rule_name,
+            'ResourceKey': resource_key(resource_type=resource_type,resource_id=resource_id),
+        }
+
+        # the same verdict as before, the common case, is one conditional write
+        try:
+            self._update(
+                key,
+                {**fields,'Transition':False},
+                condition='#ComplianceType = :ComplianceType',
+            )
+            return False
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                logs.logger.error('ClientError',operation='UpdateItem',error=str(e))
+                return None
+
+        try:
+            self._update(
+                key,
+                {**fields,'Transition':True,'ChangedAt':fields['EvaluatedAt']},
+                condition='attribute_not_exists(#ComplianceType) OR #ComplianceType <> :ComplianceType',
+                previous=True,
+            )
+        except ClientError as e:
+            if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+                # a concurrent evaluation wrote the same verdict in between, so the transition is its
+                return False
+            logs.logger.error('ClientError',operation='UpdateItem',error=str(e))
+            return None
+
+        logs.logger.info('verdict changed',config_rule_name=config_rule_name,resource_id=resource_id,compliance_type=compliance_type)
+        return True
+
+    def _update(self,key,fields,*,condition,previous=False):
+        assignments = [f'#{name} = :{name}' for name in fields]
+        names = {f'#{name}': name for name in fields}
+        values = {f':{name}': value for name, value in fields.items()}
+        if previous:
+            # read before the update, so the verdict being replaced
+            assignments.append('#PreviousComplianceType = if_not_exists(#ComplianceType, :NoVerdict)')
+            names['#PreviousComplianceType'] = 'PreviousComplianceType'
+            values[':NoVerdict'] = NO_VERDICT
+        self.table.update_item(
+            Key=key,
+            UpdateExpression='SET ' + ', '.join(assignments),
+            ConditionExpression=condition,
+            ExpressionAttributeNames=names,
+            ExpressionAttributeValues=values,
+        )
+
+def from_environment():
+    table_name = os.environ.get('VerdictStoreTableName')
+    if not table_name:
+        return None
+    return VerdictStore(
+        table_name = table_name,
+        policy_version = os.environ.get('ControlBrokerPolicyVersion'),
+    )
@@ -0,0 +1,273 @@
+import importlib.util
+import json
+import os
+import pathlib
+import time
+
+from cb_runtime import clients, config_events, logs
+
+try:
+    from cb_runtime import control_broker_async
+except ImportError:
+    # without the aiohttp layer, batches are posted to Control Broker one event at a time
+    control_broker_async = None
+
+# the whole lambdas directory is this function's asset,
+# so the per-state handlers are imported from their own directories as plain libraries
+
+LAMBDA_FUNCTIONS = pathlib.Path(__file__).resolve().parent.parent
+
+def load_handler_module(name):
+    spec = importlib.util.spec_from_file_location(
+        f'{name}_lambda_function',
+        LAMBDA_FUNCTIONS / name / 'lambda_function.py'
+    )
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+sign_apigw_request = load_handler_module('sign_apigw_request')
+get_resource_config_compliance = load_handler_module('get_resource_config_compliance')
+requests_get = load_handler_module('requests_get')
+put_evaluations = load_handler_module('put_evaluations')
+
+# one Config client, memoized by cb_runtime.clients, and one keep-alive HTTP session shared by every stage
+
+config = clients.lazy('config')
+
+log = logs.logger
+
+# and one compliance cache, so our own PutEvaluations invalidate its entries in memory too
+
+put_evaluations.cache = get_resource_config_compliance.cache
+
+http = sign_apigw_request.http
+
+# the only field of the results report read by the following stages
+
+RESULTS_REPORT_PROJECTION = [
+    'EvalEngineLambdalith.Evaluation.IsCompliant',
+]
+
+# Control Broker requests in flight at once for a batch
+
+CONTROL_BROKER_CONCURRENCY = int(os.environ.get('ControlBrokerConcurrency',16))
+
+class ControlBrokerRequestFailedException(Exception):
+    pass
+
+class ResultsReportDoesNotYetExist(Exception):
+    pass
+
+class ComplianceStatusIsAsExpectedFalse(Exception):
+    pass
+
+class ConfigEventsFailedException(Exception):
+    pass
+
+def get_is_compliant(*,url,interval_seconds=1,max_attempts=8,backoff_rate=2.0):
+
+    # same schedule as the GetIsCompliant Retry on StatusCodeNot200Exception
+
+    for attempt in range(max_attempts + 1):
+
+        response = requests_get.requests_get(url,http=http,projection=RESULTS_REPORT_PROJECTION)
+
+        # False until the report exists, any document after that
+        if response is not False:
+            return response
+
+        if attempt < max_attempts:
+            time.sleep(interval_seconds * backoff_rate ** attempt)
+
+    raise ResultsReportDoesNotYetExist(url)
+
+def evaluate_config_event(config_event,*,cb_endpoint_response=None):
+
+    invoking_event = json.loads(config_event["invokingEvent"])
+
+    configuration_item = invoking_event["configurationItem"]
+
+    resource_type = configuration_item["resourceType"]
+    resource_id = configuration_item["resourceId"]
+    config_rule_name = config_event["configRuleName"]
+
+    log.info('evaluate config event',config_rule_name=config_rule_name,resource_type=resource_type,resource_id=resource_id)
+
+    # SignApigwRequest, unless already posted with the rest of its batch
+
+    if cb_endpoint_response is None:
+        cb_endpoint_response = sign_apigw_request.post_config_event(
+            config_event = config_events.resolve_config_event(config_event,s3=sign_apigw_request.s3,config=config),
+            http = http,
+        )
+
+    if not cb_endpoint_response:
+        raise ControlBrokerRequestFailedException(resource_id)
+
+    # GetResourceConfigComplianceInitial
+
+    initial_compliance = get_resource_config_compliance.get_resource_config_compliance_by_resource(
+        resource_type = resource_type,
+        resource_id = resource_id,
+        config_rule_name = config_rule_name,
+    )
+
+    # GetIsCompliant
+
+    results_report = get_is_compliant(
+        url = cb_endpoint_response['Response']['ControlBrokerEvaluation']['OutputHandlers']['OPA']['PresignedUrl']
+    )
+
+    is_compliant = results_report['EvalEngineLambdalith']['Evaluation']['IsCompliant']
+
+    return {
+        'ConfigRuleName': config_rule_name,
+        'ResourceType': resource_type,
+        'ResourceId': resource_id,
+        'InitialCompliance': initial_compliance,
+        'IsCompliant': is_compliant,
+        'Compliance': put_evaluations.ConfigCompliance(
+            ResourceType = resource_type,
+            ResourceId = resource_id,
+            ResultToken = config_event['resultToken'],
+            Compliant = is_compliant,
+            ConfigRuleName = config_rule_name,
+            ContentHash = config_event.get('EvaluationContentHash'),
+            NotificationCreationTime = invoking_event.get('notificationCreationTime'),
+            OrderingTimestamp = config_events.ordering_timestamp(invoking_event),
+        ),
+    }
+
+def verify_config_event(evaluated,*,evaluation_completion_status):
+
+    # dropped in favour of a newer evaluation of the resource, whose verdict Config holds instead
+
+    if evaluated['Compliance'].superseded:
+        log.info('superseded',resource_id=evaluated['ResourceId'])
+        return {
+            'ResourceType': evaluated['ResourceType'],
+            'ResourceId': evaluated['ResourceId'],
+            'InitialCompliance': evaluated['InitialCompliance'],
+            'IsCompliant': evaluated['IsCompliant'],
+            'EvaluationCompletionStatus': evaluation_completion_status,
+            'Superseded': True,
+        }
+
+    # GetResourceConfigComplianceFinal
+
+    final_compliance = get_resource_config_compliance.get_resource_config_compliance_by_resource(
+        resource_type = evaluated['ResourceType'],
+        resource_id = evaluated['ResourceId'],
+        config_rule_name = evaluated['ConfigRuleName'],
+        use_cache = False,
+    )
+
+    processed = {
+        'ResourceType': evaluated['ResourceType'],
+        'ResourceId': evaluated['ResourceId'],
+        'InitialCompliance': evaluated['InitialCompliance'],
+        'IsCompliant': evaluated['IsCompliant'],
+        'EvaluationCompletionStatus': evaluation_completion_status,
+        'FinalCompliance': final_compliance,
+    }
+
+    log.info('processed',processed=processed)
+
+    if final_compliance != evaluated['IsCompliant']:
+        raise ComplianceStatusIsAsExpectedFalse(evaluated['ResourceId'])
+
+    return processed
+
+def process_config_event(config_event):
+
+    evaluated = evaluate_config_event(config_event)
+
+    # PutEvaluations
+
+    evaluation_completion_status = evaluated['Compliance'].put_compliant_status()
+
+    return verify_config_event(evaluated,evaluation_completion_status=evaluation_completion_status)
+
+def post_config_events_concurrently(batch):
+
+    # None for an event that could not be resolved, it is then posted and fails on its own
+
+    resolved = []
+
+    for config_event in batch:
+        try:
+            resolved.append(config_events.resolve_config_event(config_event,s3=sign_apigw_request.s3,config=config))
+        except Exception as e:
+            log.error(type(e).__name__,stage='ResolveConfigEvent',error=str(e))
+            resolved.append(None)
+
+    responses = control_broker_async.post_config_events(
+        [i for i in resolved if i is not None],
+        full_invoke_url = sign_apigw_request.full_invoke_url,
+        region = sign_apigw_request.region,
+        concurrency = CONTROL_BROKER_CONCURRENCY,
+    )
+
+    responses = iter(responses)
+
+    return [None if i is None else next(responses) for i in resolved]
+
+def config_event_resource_id(config_event):
+    return config_events.routing_configuration_item(json.loads(config_event['invokingEvent']))['resourceId']
+
+def process_config_events(batch):
+
+    # evaluate every event, put all their evaluations in as few calls as the result tokens allow, then verify
+
+    if control_broker_async and len(batch) > 1:
+        cb_endpoint_responses = post_config_events_concurrently(batch)
+    else:
+        cb_endpoint_responses = [None] * len(batch)
+
+    evaluated, failed = [], []
+
+    for config_event, cb_endpoint_response in zip(batch,cb_endpoint_responses):
+        try:
+            evaluated.append(evaluate_config_event(config_event,cb_endpoint_response=cb_endpoint_response))
+        except Exception as e:
+            log.error(type(e).__name__,stage='EvaluateConfigEvent',error=str(e))
+            failed.append(config_event_resource_id(config_event))
+
+    # PutEvaluations
+
+    failed_evaluations = put_evaluations.put_evaluations_batch([i['Compliance'] for i in evaluated])
+
+    failed_resources = {
+        (i['Evaluation']['ComplianceResourceType'],i['Evaluation']['ComplianceResourceId'])
+        for i in failed_evaluations
+    }
+
+    processed = []
+
+    for i in evaluated:
+        if (i['ResourceType'],i['ResourceId']) in failed_resources:
+            failed.append(i['ResourceId'])
+            continue
+        try:
+            processed.append(verify_config_event(i,evaluation_completion_status=True))
+        except Exception as e:
+            log.error(type(e).__name__,stage='VerifyConfigEvent',error=str(e))
+            failed.append(i['ResourceId'])
+
+    log.info('processed batch',processed=len(processed),failed=len(failed),failed_resource_ids=failed)
+
+    if failed:
+        raise ConfigEventsFailedException(f'{len(failed)} of {len(batch)} config events failed: {", ".join(failed)}')
+
+    return processed
+
+def lambda_handler(event,context):
+
+    log.start_invocation(context)
+    log.debug('event',event=event)
+
+    if 'ConfigEvents' not in event:
+        return process_config_event(event)
+
+    return process_config_events(event['ConfigEvents'])
@@ -1,98 +1,128 @@
 import json
-import boto3
 import os
 from botocore.exceptions import ClientError
+from cb_runtime import clients, compliance_cache, logs, metrics
 
-config = boto3.client('config')
+log = logs.logger
+
+config = clients.lazy('config')
+
+cache = compliance_cache.from_environment()
 
 class NoMatchingEvaluationResults(Exception):
-    print('NoMatchingEvaluationResults')
     pass
 
-def get_resource_config_compliance_by_resource(*,resource_type,resource_id, config_rule_name):
-    
-    print('begin get_resource_config_compliance_by_resource')
-    
-    try:
-        r = config.get_compliance_details_by_resource(
-            ResourceType=resource_type,
-            ResourceId=resource_id,
-            ComplianceTypes=[
-                'COMPLIANT',
-                'NON_COMPLIANT',
-                # 'NOT_APPLICABLE',
-                # 'INSUFFICIENT_DATA',
-            ],
-        )
-    except ClientError as e:
-        print(f"ClientError\n{e}")
-        raise
-    else:
-        print(r)
-        
-        evaluation_results = r['EvaluationResults']
-        
-        print(f'evaluation_results\n{evaluation_results}')
+def get_resource_config_compliance_by_resource(*,resource_type,resource_id, config_rule_name, use_cache=True):
+    
+    # a verifying read skips the cache but still refreshes it
+    
+    key = compliance_cache.cache_key(
+        resource_type = resource_type,
+        resource_id = resource_id,
+        config_rule_name = config_rule_name,
+    )
+    
+    if use_cache:
+        compliance = cache.get(key)
+        if compliance is not compliance_cache.MISS:
+            return compliance
+    
+    compliance = fetch_resource_config_compliance_by_resource(
+        resource_type = resource_type,
+        resource_id = resource_id,
+        config_rule_name = config_rule_name,
+    )
+    
+    cache.put(key,compliance)
+    
+    return compliance
+
+def fetch_resource_config_compliance_by_resource(*,resource_type,resource_id, config_rule_name):
+    
+    # follow NextToken until the rule's evaluation result turns up, a resource with many rules spans pages
+    
+    with metrics.timer('ComplianceReadLatency'):
         
-        evaluation_results = [i['ComplianceType'] for i in evaluation_results if i['EvaluationResultIdentifier']['EvaluationResultQualifier']['ConfigRuleName'] == config_rule_name]
+        kwargs = {}
+    
+        while True:
         
-        try:
+            try:
+                r = config.get_compliance_details_by_resource(
+                    ResourceType=resource_type,
+                    ResourceId=resource_id,
+                    ComplianceTypes=[
+                        'COMPLIANT',
+                        'NON_COMPLIANT',
+                        # 'NOT_APPLICABLE',
+                        # 'INSUFFICIENT_DATA',
+                    ],
+                    **kwargs
+                )
+            except ClientError as e:
+                log.error('ClientError',operation='GetComplianceDetailsByResource',error=str(e))
+                raise
+            else:
+                evaluation_results = r['EvaluationResults']
             
-            evaluation_result = evaluation_results[0]
-        
-        except IndexError:
+                log.debug('evaluation results',evaluation_results=evaluation_results)
             
-            print('NoMatchingEvaluationResults')
-            return None
-            # raise NoMatchingEvaluationResults
-        
-        else:
+                for i in evaluation_results:
+                
+                    if i['EvaluationResultIdentifier']['EvaluationResultQualifier']['ConfigRuleName'] == config_rule_name:
+                    
+                        evaluation_result = i['ComplianceType']
+                    
+                        return evaluation_result == 'COMPLIANT'
             
-            print(f'evaluation_result:\n{evaluation_result}')
-    
-            return evaluation_result == 'COMPLIANT'
+                if not r.get('NextToken'):
+                
+                    log.info('no matching evaluation results',resource_id=resource_id,config_rule_name=config_rule_name)
+                    return None
+                    # raise NoMatchingEvaluationResults
+            
+                kwargs['NextToken'] = r['NextToken']
 
-# def get_resource_config_compliance_by_rule(*,resource_id, config_rule_name):
-    
-#     print('begin get_resource_config_compliance_by_rule')
-    
-#     try:
-#         r = config.get_compliance_details_by_config_rule(
-#             ConfigRuleName = config_rule_name,
-#             ComplianceTypes=[
-#                 'COMPLIANT',
-#                 'NON_COMPLIANT',
-#                 'NOT_APPLICABLE'
-#             ],
-#             Limit = 100 #Max
-#         )
-#     except ClientError as e:
-#         print(f"ClientError\n{e}")
-#         raise
-#     else:
-#         print(r)
-        
-#         evaluation_results = r['EvaluationResults']
-        
-#         print(f'evaluation_results\n{evaluation_results}')
-        
-#         evaluation_results = [i['ComplianceType'] for i in evaluation_results if i['EvaluationResultIdentifier']['EvaluationResultQualifier']['ResourceId'] == resource_id]
+def get_resource_config_compliance_by_rule(*,config_rule_name):
+    
+    # one paginated sweep over every resource evaluated by the rule, indexed by ResourceId
+    
+    compliance_by_resource_id = {}
+    pages = 0
+    kwargs = {}
+    
+    while True:
         
-#         try:
+        try:
+            r = config.get_compliance_details_by_config_rule(
+                ConfigRuleName = config_rule_name,
+                ComplianceTypes=[
+                    'COMPLIANT',
+                    'NON_COMPLIANT',
+                ],
+                Limit = 100, #Max
+                **kwargs
+            )
+        except ClientError as e:
+            log.error('ClientError',operation='GetComplianceDetailsByConfigRule',error=str(e))
+            raise
+        else:
+            pages += 1
             
-#             evaluation_result = evaluation_results[0]
-        
-#         except IndexError:
+            for i in r['EvaluationResults']:
+                
+                resource_id = i['EvaluationResultIdentifier']['EvaluationResultQualifier']['ResourceId']
+                
+                compliance_by_resource_id[resource_id] = i['ComplianceType'] == 'COMPLIANT'
             
-#             print('NoMatchingEvaluationResults')
-#             return None
-#             # raise NoMatchingEvaluationResults
-        
-#         else:
+            if not r.get('NextToken'):
+                break
             
-#             print(f'evaluation_result:\n{evaluation_result}')
+            kwargs['NextToken'] = r['NextToken']
+    
+    log.info('compliance by rule',config_rule_name=config_rule_name,resources=len(compliance_by_resource_id),pages=pages)
     
-#             return evaluation_result == 'COMPLIANT'
+    return compliance_by_resource_id
 
 
 def lambda_handler(event, context):
@@ -100,7 +130,14 @@ def lambda_handler(event, context):
     # class ConfigComplianceStatusIsNotAsExpectedException(Exception):
     #     pass
 
-    print(event)
+    log.start_invocation(context)
+    log.debug('event',event=event)
+    
+    if 'ConfigEvent' not in event:
+        
+        # bulk: {"ConfigRuleName": ...} returns the compliance of every resource evaluated by the rule
+        
+        return get_resource_config_compliance_by_rule(config_rule_name = event['ConfigRuleName'])
     
     config_event = event['ConfigEvent']
     
@@ -112,19 +149,16 @@ def lambda_handler(event, context):
     
     config_rule_name = config_event['configRuleName']
     
+    expected_compliance_status = event['ExpectedComplianceStatus']
+    
     compliance =  get_resource_config_compliance_by_resource(
         resource_type = resource_type,
         resource_id = resource_id,
         config_rule_name = config_rule_name,
+        use_cache = expected_compliance_status is None,
     )
     
-    print(f'compliance:\n{compliance}')
-    
-    # get_resource_config_compliance_by_rule(resource_id = resource_id,config_rule_name = config_rule_name)
-    
-    expected_compliance_status = event['ExpectedComplianceStatus']
-    
-    print(f'expected_compliance_status:\n{expected_compliance_status}')
+    log.info('compliance',resource_id=resource_id,compliance=compliance,expected_compliance_status=expected_compliance_status)
     
     if expected_compliance_status is None:
         
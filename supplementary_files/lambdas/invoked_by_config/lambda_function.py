@@ -1,72 +1,318 @@
 import json
 import os
-import re
 
-import boto3
 from botocore.exceptions import ClientError
 
-import requests
-from aws_requests_auth.boto_utils import BotoAWSRequestsAuth
+from cb_runtime import clients, config_events, evaluation_dedup, evaluation_order, logs, metrics, prefilter, verdict_store
 
-session = boto3.session.Session()
-region = session.region_name
-account_id = boto3.client('sts').get_caller_identity().get('Account')
+log = logs.logger
 
-sfn = boto3.client("stepfunctions")
+# created on first use, so each invocation builds only the clients of its own path
+
+sfn = clients.lazy("stepfunctions")
+sqs = clients.lazy("sqs")
+awslambda = clients.lazy("lambda")
+s3 = clients.lazy("s3")
+config = clients.lazy("config")
+
+# verdicts of previously evaluated content, replayed instead of asking Control Broker again
+dedup = evaluation_dedup.from_environment()
+
+# the current verdict per rule and resource, for the evaluations put here rather than by PutEvaluations
+verdicts = verdict_store.from_environment()
+
+# evaluations of an older configuration item than one already put for the resource are dropped
+order = evaluation_order.from_environment()
+
+# StartExecution and asynchronous Invoke input limit
+MAX_EXECUTION_INPUT_BYTES = 256 * 1024
+
+class SyncExecutionFailedException(Exception):
+    def __init__(self, *, status, error=None, cause=None):
+        super().__init__(f"{status}: {error}: {cause}")
+        self.status = status
+        self.error = error
+        self.cause = cause
 
 def async_sfn(*, sfn_arn, input: dict):
     try:
         r = sfn.start_execution(stateMachineArn=sfn_arn, input=json.dumps(input))
     except ClientError as e:
-        print(f"ClientError\n{e}")
+        log.error("ClientError", operation="StartExecution", error=str(e))
+        raise
+    else:
+        log.info("started execution", sfn_arn=sfn_arn, execution_arn=r["executionArn"])
+        log.debug("execution input", input=input)
+        return r["executionArn"]
+
+def sync_sfn(*, sfn_arn, input: dict):
+    try:
+        r = sfn.start_sync_execution(stateMachineArn=sfn_arn, input=json.dumps(input))
+    except ClientError as e:
+        log.error("ClientError", operation="StartSyncExecution", error=str(e))
         raise
     else:
-        print(f'no ClientError start_execution:\nsfn_arn:\n{sfn_arn}\ninput:\n{input}')
+        log.info("finished sync execution", sfn_arn=sfn_arn, status=r["status"])
+        if r["status"] != "SUCCEEDED":
+            # fail the invocation, so Lambda's asynchronous retries, or in batch mode SQS redelivery, run it again
+            log.error("sync execution failed", execution_arn=r["executionArn"], status=r["status"], error=r.get("error"), cause=r.get("cause"))
+            raise SyncExecutionFailedException(status=r["status"], error=r.get("error"), cause=r.get("cause"))
         return r["executionArn"]
 
+def start_sfn(*, sfn_arn, input: dict):
+    # EXPRESS executions are awaited, STANDARD executions are fire and forget
+    if os.environ.get("ConfigEventProcessingSfnType") == "EXPRESS":
+        return sync_sfn(sfn_arn=sfn_arn, input=input)
+    return async_sfn(sfn_arn=sfn_arn, input=input)
+
+def async_lambda(*, function_name, input: dict):
+    try:
+        r = awslambda.invoke(FunctionName=function_name, InvocationType="Event", Payload=json.dumps(input))
+    except ClientError as e:
+        log.error("ClientError", operation="Invoke", error=str(e))
+        raise
+    else:
+        log.info("invoked", function_name=function_name)
+        return r["StatusCode"]
+
+def start_evaluation(input: dict):
+    # Lambdalith topology: the evaluation pipeline lambda, otherwise the ConfigEventProcessing state machine
+    function_name = os.environ.get("EvaluationPipelineFunctionName")
+    if function_name:
+        return async_lambda(function_name=function_name, input=input)
+    return start_sfn(sfn_arn=os.environ["ConfigEventProcessingSfnArn"], input=input)
+
+def put_evaluation(*, config_event: dict, invoking_event: dict, configuration_item: dict, compliance_type, annotation=None):
+    ordering_timestamp = config_events.parse_time(config_events.ordering_timestamp(invoking_event))
+    claim = order and order.claim(
+        config_rule_name=config_event["configRuleName"],
+        resource_type=configuration_item["resourceType"],
+        resource_id=configuration_item["resourceId"],
+        ordering_timestamp=ordering_timestamp,
+    )
+    if order and not claim:
+        return True
+    evaluation = {
+        "ComplianceResourceType": configuration_item["resourceType"],
+        "ComplianceResourceId": configuration_item["resourceId"],
+        "ComplianceType": compliance_type,
+        "OrderingTimestamp": ordering_timestamp,
+    }
+    if annotation:
+        evaluation["Annotation"] = annotation[:256]
+    try:
+        config.put_evaluations(
+            Evaluations=[evaluation],
+            ResultToken=config_event["resultToken"],
+        )
+    except ClientError as e:
+        log.error("ClientError", operation="PutEvaluations", error=str(e))
+        if claim:
+            order.release(claim)
+        raise
+    else:
+        log.info("put evaluation", compliance_type=compliance_type)
+        if verdicts:
+            verdicts.record(
+                config_rule_name=config_event["configRuleName"],
+                resource_type=configuration_item["resourceType"],
+                resource_id=configuration_item["resourceId"],
+                compliance_type=compliance_type,
+                notification_creation_time=invoking_event.get("notificationCreationTime"),
+            )
+        return True
+
+def replay_verdict(*, config_event: dict, invoking_event: dict, configuration_item: dict, is_compliant):
+    return put_evaluation(
+        config_event=config_event,
+        invoking_event=invoking_event,
+        configuration_item=configuration_item,
+        compliance_type="COMPLIANT" if is_compliant else "NON_COMPLIANT",
+    )
+
+def buffer_config_event(*, queue_url, config_event: dict):
+    try:
+        r = sqs.send_message(QueueUrl=queue_url, MessageBody=json.dumps(config_event))
+    except ClientError as e:
+        log.error("ClientError", operation="SendMessage", error=str(e))
+        raise
+    else:
+        log.debug("sent message", queue_url=queue_url)
+        return r["MessageId"]
+
+def chunk_config_events(config_events: list, max_input_bytes=MAX_EXECUTION_INPUT_BYTES):
+    # split a drained batch only where one execution input would exceed the StartExecution limit
+    chunk, chunk_bytes = [], len(json.dumps({"ConfigEvents": []}))
+    for config_event in config_events:
+        event_bytes = len(json.dumps(config_event)) + 2
+        if chunk and chunk_bytes + event_bytes > max_input_bytes:
+            yield chunk
+            chunk, chunk_bytes = [], len(json.dumps({"ConfigEvents": []}))
+        chunk.append(config_event)
+        chunk_bytes += event_bytes
+    if chunk:
+        yield chunk
+
+def config_events_succeeded(e: SyncExecutionFailedException, count):
+    # the batch definition fails with whether each of its Config events succeeded as the cause
+    try:
+        succeeded = json.loads(e.cause or "")
+    except ValueError:
+        succeeded = None
+    if not isinstance(succeeded, list) or len(succeeded) != count:
+        return [False] * count
+    return succeeded
+
+def drain_config_event_buffer(*, records: list):
+    """Start the evaluation of the buffered Config events, returning the records that failed."""
+    config_events = [json.loads(record["body"]) for record in records]
+    log.info("draining buffered config events", count=len(config_events))
+    failed = []
+    start = 0
+    for chunk in chunk_config_events(config_events):
+        chunk_records = records[start:start + len(chunk)]
+        start += len(chunk)
+        try:
+            start_evaluation({"ConfigEvents": chunk})
+        except SyncExecutionFailedException as e:
+            succeeded = config_events_succeeded(e, len(chunk))
+            failed += [record for record, ok in zip(chunk_records, succeeded) if not ok]
+        except ClientError:
+            failed += chunk_records
+    return failed
+
 def lambda_handler(event, context):
 
-    print(event)
+    log.start_invocation(context)
+    log.debug("event", event=event)
+    
+    if "Records" in event:
+        
+        # batch of Config events drained from the ConfigEventBuffer queue
+        
+        failed = drain_config_event_buffer(
+            records=event["Records"]
+        )
+        
+        log.info("processed", records=len(event["Records"]), failed=len(failed))
+        
+        # only the failed messages are redelivered
+        
+        return {"batchItemFailures": [{"itemIdentifier": record["messageId"]} for record in failed]}
 
     invoking_event = json.loads(event["invokingEvent"])
-    print(f"invoking_event:\n{invoking_event}")
 
-    rule_parameters = event.get("ruleParameters")
+    rule_parameters = json.loads(event.get("ruleParameters") or "{}")
     if rule_parameters:
-        rule_parameters = json.loads(rule_parameters)
-        print(f"rule_parameters:\n{rule_parameters}")
+        log.debug("rule parameters", rule_parameters=rule_parameters)
+
+    if config_events.is_scheduled(invoking_event):
+        # no resource to evaluate, tools/reevaluate_resources sweeps the rule's resources instead
+        log.info("skipped scheduled notification", config_rule_name=event["configRuleName"])
+        return True
 
-    configuration_item = invoking_event["configurationItem"]
-    print(f"configuration_item:\n{configuration_item}")
+    # oversized notifications carry only a summary, resolved through GetResourceConfigHistory when needed
+    configuration_item = config_events.routing_configuration_item(invoking_event)
 
     item_status = configuration_item["configurationItemStatus"]
-    print(f"item_status:\n{item_status}")
+    resource_type = configuration_item["resourceType"]
+    resource_id = configuration_item["resourceId"]
+    config_rule_name = event["configRuleName"]
+
+    log.info(
+        "config event",
+        config_rule_name=config_rule_name,
+        resource_type=resource_type,
+        resource_id=resource_id,
+        item_status=item_status,
+        message_type=invoking_event.get("messageType"),
+    )
     
     if item_status == 'ResourceDeleted':
         return True
 
-    resource_type = configuration_item["resourceType"]
-    print(f"resource_type:\n{resource_type}")
-
-    resource_configuration = configuration_item["configuration"]
-    print(f"resource_configuration:\n{resource_configuration}")
-
-    resource_id = configuration_item["resourceId"]
-    print(f"resource_id:\n{resource_id}")
+    # prefilter: out of the rule's scope, or no field the rule reads has changed
+    
+    decision, reason = prefilter.decide(rule_parameters=rule_parameters, invoking_event=invoking_event)
+    
+    metrics.emit("PrefilterNotApplicable", int(decision == prefilter.NOT_APPLICABLE), ConfigRuleName=config_rule_name)
+    metrics.emit("PrefilterSkipped", int(decision == prefilter.SKIP), ConfigRuleName=config_rule_name)
+    
+    if decision != prefilter.EVALUATE:
+        log.info("prefiltered", decision=decision, reason=reason)
+    
+    if decision == prefilter.NOT_APPLICABLE:
+        return put_evaluation(
+            config_event=event,
+            invoking_event=invoking_event,
+            configuration_item=configuration_item,
+            compliance_type="NOT_APPLICABLE",
+            annotation=reason,
+        )
+    
+    if decision == prefilter.SKIP:
+        return True
 
-    result_token = event["resultToken"]
-    print(f"result_token:\n{result_token}")
+    # dedup: the same content was evaluated against the same rule and policy version before
     
-    config_rule_name = event["configRuleName"]
-    print(f"config_rule_name:\n{config_rule_name}")
+    if dedup:
+        
+        content_hash = None
+        
+        if "configurationItem" in invoking_event:
+            
+            content_hash = dedup.content_hash(
+                configuration_item=invoking_event["configurationItem"],
+                config_rule_name=config_rule_name
+            )
+            
+            verdict = dedup.get_verdict(content_hash)
+            
+            metrics.emit("EvaluationDedupHit", int(verdict is not None), ConfigRuleName=config_rule_name)
+            
+            if verdict is not None:
+                
+                return replay_verdict(
+                    config_event=event,
+                    invoking_event=invoking_event,
+                    configuration_item=configuration_item,
+                    is_compliant=verdict
+                )
+        
+        # recorded with the verdict by PutEvaluations
+        event = {**event, "EvaluationContentHash": content_hash}
+    
+    # claim check: pass an S3 pointer and the routing fields instead of the whole event
+    
+    if os.environ.get("ConfigEventClaimCheck") == "true" or config_events.is_oversized(invoking_event):
+        
+        claim_check = config_events.store_config_event(
+            event,
+            bucket=os.environ["ConfigEventsRawInputBucket"],
+            s3=s3
+        )
+        
+        event = config_events.slim_config_event(event, claim_check=claim_check)
+        
+        log.info("claim checked", claim_check=claim_check)
 
     # process
     
-    processed = async_sfn(
-        sfn_arn=os.environ["ConfigEventProcessingSfnArn"],
-        input=event
-    )
+    buffer_queue_url = os.environ.get("ConfigEventBufferQueueUrl")
+    
+    if buffer_queue_url:
+        
+        buffered = buffer_config_event(
+            queue_url=buffer_queue_url,
+            config_event=event
+        )
+        
+        log.info("buffered for batch evaluation", message_id=buffered)
+        
+        return True
+    
+    processed = start_evaluation(event)
 
-    print(f'processed by sfn:\n{processed}')
+    log.info("processed", processed=processed)
     
     return True
\ No newline at end of file
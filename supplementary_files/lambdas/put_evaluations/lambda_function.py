@@ -1,87 +1,228 @@
 import json
-import boto3
-import os
+import random
+import time
 from botocore.exceptions import ClientError
-from datetime import datetime
+from cb_runtime import clients, compliance_cache, config_events, evaluation_dedup, evaluation_order, logs, metrics, verdict_store
+from datetime import datetime, timezone
 
-config = boto3.client("config")
+config = clients.lazy("config")
+
+log = logs.logger
+
+# compliance lookups cached by get_resource_config_compliance are invalidated by our own writes
+cache = compliance_cache.from_environment()
+
+# verdicts by content hash, replayed by invoked_by_config for identical configuration items
+dedup = evaluation_dedup.from_environment()
+
+# the current verdict per rule and resource, written alongside our evaluations
+verdicts = verdict_store.from_environment()
+
+# evaluations of an older configuration item than one already put for the resource are dropped
+order = evaluation_order.from_environment()
+
+# PutEvaluations accepts at most 100 evaluations per call, all for one ResultToken
+MAX_EVALUATIONS_PER_CALL = 100
+
+THROTTLING_ERROR_CODES = (
+    "ThrottlingException",
+    "Throttling",
+    "TooManyRequestsException",
+)
+
+class PutEvaluationsFailedException(Exception):
+    pass
 
 class ConfigCompliance:
-    def __init__(self, *, ResourceType, ResourceId, ResultToken, Compliant):
+    def __init__(self, *, ResourceType, ResourceId, ResultToken, Compliant, ConfigRuleName=None, ContentHash=None, NotificationCreationTime=None, OrderingTimestamp=None):
 
         self.resource_type = ResourceType
         self.resource_id = ResourceId
         self.result_token = ResultToken
         self.compliant = Compliant
+        self.config_rule_name = ConfigRuleName
+        self.content_hash = ContentHash
+        self.notification_creation_time = NotificationCreationTime
+        # when Config recorded the configuration item evaluated, ordering the evaluations of the resource
+        self.ordering_timestamp = config_events.parse_time(
+            OrderingTimestamp or NotificationCreationTime or datetime.now(timezone.utc)
+        )
+        # dropped before PutEvaluations, a newer evaluation of the resource having been put
+        self.superseded = False
+        # the resource's OrderingTimestamp moved forward for this evaluation, released if its put fails
+        self.claim = None
 
-    def evaluate_compliant(self):
-        print(
-            f"begin put_evaluations COMPLIANT\n{self.resource_type}\n{self.resource_id}"
+    def evaluation(self):
+        return {
+            "ComplianceResourceType": self.resource_type,
+            "ComplianceResourceId": self.resource_id,
+            "ComplianceType": "COMPLIANT" if self.compliant else "NON_COMPLIANT",
+            # 'Annotation': 'string', #TODO add useful metadata
+            "OrderingTimestamp": self.ordering_timestamp,
+        }
+
+    def put_compliant_status(self):
+        log.info(
+            "put evaluation",
+            compliance_type=self.evaluation()["ComplianceType"],
+            resource_type=self.resource_type,
+            resource_id=self.resource_id,
         )
-        try:
-            r = config.put_evaluations(
-                Evaluations=[
-                    {
-                        "ComplianceResourceType": self.resource_type,
-                        "ComplianceResourceId": self.resource_id,
-                        "ComplianceType": "COMPLIANT",
-                        # 'Annotation': 'string', #TODO add useful metadata
-                        "OrderingTimestamp": datetime(2015, 1, 1),  # FIXME
-                    },
-                ],
-                ResultToken=self.result_token,
+
+        failed = put_evaluations_batch([self])
+
+        if failed:
+            raise PutEvaluationsFailedException(failed)
+
+        return True
+
+def put_evaluations_chunk(*, result_token, evaluations, max_attempts=6, base_delay=0.2, max_delay=10):
+    # full jitter backoff on throttling, any other ClientError fails the chunk
+    with metrics.timer("PutEvaluationsLatency", Evaluations=len(evaluations)):
+        for attempt in range(max_attempts):
+            try:
+                r = config.put_evaluations(
+                    Evaluations=evaluations,
+                    ResultToken=result_token,
+                )
+            except ClientError as e:
+                code = e.response["Error"]["Code"]
+                if code in THROTTLING_ERROR_CODES and attempt < max_attempts - 1:
+                    delay = random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+                    log.warning("throttled, retrying", code=code, delay_seconds=round(delay, 2))
+                    time.sleep(delay)
+                    continue
+                log.error("ClientError", operation="PutEvaluations", error=str(e))
+                return [
+                    {"Evaluation": evaluation, "ErrorCode": code}
+                    for evaluation in evaluations
+                ]
+            else:
+                return [
+                    {"Evaluation": evaluation, "ErrorCode": "FailedEvaluation"}
+                    for evaluation in r.get("FailedEvaluations", [])
+                ]
+
+class EvaluationAccumulator:
+    """Collect ConfigCompliance evaluations and put them with as few PutEvaluations calls as possible.
+
+    Evaluations are grouped by ResultToken; a group is put as soon as it holds MAX_EVALUATIONS_PER_CALL,
+    the rest on flush(). Failed items are kept with their ResultToken, Evaluation and ErrorCode.
+    """
+
+    def __init__(self):
+        self.pending = {}
+        self.failed = []
+        self.superseded = []
+        self.calls = 0
+
+    def add(self, compliance):
+        if order and compliance.config_rule_name:
+            compliance.claim = order.claim(
+                config_rule_name=compliance.config_rule_name,
+                resource_type=compliance.resource_type,
+                resource_id=compliance.resource_id,
+                ordering_timestamp=compliance.ordering_timestamp,
             )
-        except ClientError as e:
-            print(f"ClientError\n{e}")
-            raise
-        else:
-            return True
-
-    def evaluate_noncompliant(self):
-        print(
-            f"begin put_evaluations NON_COMPLIANT\n{self.resource_type}\n{self.resource_id}"
+            if not compliance.claim:
+                compliance.superseded = True
+                self.superseded.append(compliance)
+                return
+        compliances = self.pending.setdefault(compliance.result_token, [])
+        compliances.append(compliance)
+        if len(compliances) == MAX_EVALUATIONS_PER_CALL:
+            self._put(compliance.result_token)
+
+    def _put(self, result_token):
+        compliances = self.pending.pop(result_token)
+        self.calls += 1
+        failed = put_evaluations_chunk(
+            result_token=result_token,
+            evaluations=[compliance.evaluation() for compliance in compliances],
         )
-        try:
-            r = config.put_evaluations(
-                Evaluations=[
-                    {
-                        "ComplianceResourceType": self.resource_type,
-                        "ComplianceResourceId": self.resource_id,
-                        "ComplianceType": "NON_COMPLIANT",
-                        # 'Annotation': 'string',
-                        "OrderingTimestamp": datetime(2015, 1, 1),  # FIXME
-                    },
-                ],
-                ResultToken=self.result_token,
-            )
-        except ClientError as e:
-            print(f"ClientError\n{e}")
-            raise
-        else:
-            return True
+        self.failed += [{"ResultToken": result_token, **failure} for failure in failed]
+        failed_resources = {
+            (failure["Evaluation"]["ComplianceResourceType"], failure["Evaluation"]["ComplianceResourceId"])
+            for failure in failed
+        }
+        for compliance in compliances:
+            put = (compliance.resource_type, compliance.resource_id) not in failed_resources
+            if compliance.claim and not put:
+                order.release(compliance.claim)
+            if dedup and compliance.content_hash and put:
+                dedup.put_verdict(compliance.content_hash, compliance.compliant)
+            if verdicts and compliance.config_rule_name and put:
+                verdicts.record(
+                    config_rule_name=compliance.config_rule_name,
+                    resource_type=compliance.resource_type,
+                    resource_id=compliance.resource_id,
+                    compliance_type=compliance.evaluation()["ComplianceType"],
+                    notification_creation_time=compliance.notification_creation_time,
+                )
+            if compliance.config_rule_name:
+                cache.invalidate(compliance_cache.cache_key(
+                    resource_type=compliance.resource_type,
+                    resource_id=compliance.resource_id,
+                    config_rule_name=compliance.config_rule_name,
+                ))
 
-    def put_compliant_status(self):
-        if self.compliant:
-            evaluation_completion_status = self.evaluate_compliant()
-        else:
-            evaluation_completion_status= self.evaluate_noncompliant()
-        
-        return evaluation_completion_status
+    def flush(self):
+        for result_token in list(self.pending):
+            self._put(result_token)
+        return self.failed
 
-def lambda_handler(event, context):
+def put_evaluations_batch(compliances):
+    accumulator = EvaluationAccumulator()
+    for compliance in compliances:
+        accumulator.add(compliance)
+    failed = accumulator.flush()
 
-    print(event)
-    
-    c = ConfigCompliance(
+    log.info(
+        "put evaluations",
+        evaluations=len(compliances),
+        calls=accumulator.calls,
+        failed=len(failed),
+        superseded=len(accumulator.superseded),
+    )
+
+    return failed
+
+def config_compliance(event):
+    return ConfigCompliance(
         ResourceType=event['ResourceType'],
         ResourceId=event['ResourceId'],
         ResultToken=event['ConfigResultToken'],
         Compliant=event['Compliance'],
+        ConfigRuleName=event.get('ConfigRuleName'),
+        ContentHash=event.get('EvaluationContentHash'),
+        NotificationCreationTime=event.get('NotificationCreationTime'),
+        OrderingTimestamp=event.get('OrderingTimestamp'),
     )
+
+def lambda_handler(event, context):
+
+    log.start_invocation(context)
+    log.debug("event", event=event)
+    
+    if "Evaluations" in event:
+        
+        compliances = [config_compliance(i) for i in event["Evaluations"]]
+        
+        failed = put_evaluations_batch(compliances)
+        
+        return {
+            "EvaluationCompletionStatus": not failed,
+            "FailedEvaluations": json.loads(json.dumps(failed, default=str)),
+            "SupersededEvaluations": json.loads(json.dumps([c.evaluation() for c in compliances if c.superseded], default=str)),
+        }
+    
+    c = config_compliance(event)
     
     evaluation_completion_status = c.put_compliant_status()
-    print(f"evaluation_completion_status\n{evaluation_completion_status}")
+    log.debug("evaluation completion status", evaluation_completion_status=evaluation_completion_status)
     
     return {
-        "EvaluationCompletionStatus": evaluation_completion_status
-    }
\ No newline at end of file
+        "EvaluationCompletionStatus": evaluation_completion_status,
+        # nothing was put, so there is nothing for GetResourceConfigComplianceFinal to verify
+        "Superseded": c.superseded,
+    }
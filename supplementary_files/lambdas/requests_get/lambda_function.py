@@ -1,17 +1,230 @@
-from time import sleep
+import codecs
 import json
-import requests
+import os
+import re
+from cb_runtime import logs, metrics
 
-def requests_get(url):
-    print(f'url:\n{url}')
-    r = requests.get(url)
+log = logs.logger
+
+# streaming mode reads at most this many bytes of the report
+MAX_RESPONSE_BYTES = int(os.environ.get('MaxResponseBytes',16 * 1024 * 1024))
+
+CHUNK_SIZE = 64 * 1024
+
+class ResponseTooLargeException(Exception):
+    pass
+
+class ProjectionNotFound(Exception):
+    pass
+
+class JsonProjection:
+    """Incrementally scan a JSON document for a few dotted key paths.
+
+    Only the values at the requested paths are built; everything else is skipped as it streams past,
+    and reading stops once every path has been found.
+    """
+
+    _STRING_BODY = re.compile(r'[^"\\]*(?:\\.[^"\\]*)*')
+    _LITERAL = re.compile(r'[^,}\]\s]*')
+    _WHITESPACE = re.compile(r'\s*')
+    _STRUCTURE = re.compile(r'(?:[^"{}\[\]]+|"[^"\\]*(?:\\.[^"\\]*)*")*')
+
+    class _Done(Exception):
+        pass
+
+    def __init__(self,*,chunks,paths,max_bytes):
+        self.chunks = iter(chunks)
+        self.targets = {tuple(path.split('.')) for path in paths}
+        self.prefixes = {target[:i] for target in self.targets for i in range(len(target))}
+        self.max_bytes = max_bytes
+        self.read_bytes = 0
+        self.decoder = codecs.getincrementaldecoder('utf-8')()
+        self.buf = ''
+        self.pos = 0
+        self.found = {}
+
+    def _fill(self):
+        chunk = next(self.chunks,None)
+        if chunk is None:
+            return False
+        self.read_bytes += len(chunk)
+        if self.read_bytes > self.max_bytes:
+            raise ResponseTooLargeException(f'more than {self.max_bytes} bytes')
+        self.buf = self.buf[self.pos:] + self.decoder.decode(chunk)
+        self.pos = 0
+        return True
+
+    def _peek(self):
+        while True:
+            self.pos = self._WHITESPACE.match(self.buf,self.pos).end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                raise ValueError('truncated JSON document')
+
+    def _expect(self,char):
+        if self._peek() != char:
+            raise ValueError(f'expected {char!r} at {self.buf[self.pos:self.pos + 20]!r}')
+        self.pos += 1
+
+    def _string(self,keep=True):
+        self._expect('"')
+        parts = []
+        while True:
+            end = self._STRING_BODY.match(self.buf,self.pos).end()
+            if keep:
+                parts.append(self.buf[self.pos:end])
+            self.pos = end
+            if end < len(self.buf) and self.buf[end] == '"':
+                self.pos += 1
+                return json.loads(f'"{"".join(parts)}"') if keep else None
+            if not self._fill():
+                raise ValueError('truncated JSON string')
+
+    def _literal(self):
+        self._peek()
+        parts = []
+        while True:
+            end = self._LITERAL.match(self.buf,self.pos).end()
+            parts.append(self.buf[self.pos:end])
+            self.pos = end
+            if end < len(self.buf) or not self._fill():
+                return json.loads(''.join(parts))
+
+    def _members(self,open_,close,member):
+        self._expect(open_)
+        if self._peek() == close:
+            self.pos += 1
+            return
+        while True:
+            member()
+            if self._peek() == ',':
+                self.pos += 1
+                continue
+            self._expect(close)
+            return
+
+    def _build(self):
+        char = self._peek()
+        if char == '{':
+            value = {}
+            def member():
+                key = self._string()
+                self._expect(':')
+                value[key] = self._build()
+            self._members('{','}',member)
+            return value
+        if char == '[':
+            value = []
+            self._members('[',']',lambda: value.append(self._build()))
+            return value
+        if char == '"':
+            return self._string()
+        return self._literal()
+
+    def _skip(self):
+        char = self._peek()
+        if char in '{[':
+            # jump over complete strings and scalars to the next bracket, counting depth
+            depth = 0
+            while True:
+                end = self._STRUCTURE.match(self.buf,self.pos).end()
+                self.pos = end
+                if end == len(self.buf):
+                    if not self._fill():
+                        raise ValueError('truncated JSON document')
+                    continue
+                char = self.buf[end]
+                if char == '"':
+                    self._string(keep=False)
+                    continue
+                self.pos += 1
+                depth += 1 if char in '{[' else -1
+                if depth == 0:
+                    return
+        elif char == '"':
+            self._string(keep=False)
+        else:
+            self._literal()
+
+    def _value(self,path):
+        if path in self.targets:
+            self.found[path] = self._build()
+            if len(self.found) == len(self.targets):
+                raise self._Done
+        elif path in self.prefixes and self._peek() == '{':
+            def member():
+                key = self._string()
+                self._expect(':')
+                self._value(path + (key,))
+            self._members('{','}',member)
+        else:
+            self._skip()
+
+    def project(self):
+        try:
+            self._value(())
+        except self._Done:
+            pass
+        projection = {}
+        for path, value in self.found.items():
+            parent = projection
+            for key in path[:-1]:
+                parent = parent.setdefault(key,{})
+            parent[path[-1]] = value
+        return projection
+
+def requests_get(url,http=None,projection=None,max_response_bytes=MAX_RESPONSE_BYTES):
+    # the signature of a presigned url is redacted
+    log.debug('requests_get',url=url)
+
+    if http is None:
+        # imported by the first fetch rather than at import, to keep it out of the cold start
+        import requests
+        http = requests
+
+    # one attempt of the poll, whether the state machine or the pipeline retries it
+    with metrics.timer('ReportFetchLatency'):
+        response_content = get_report(url,http=http,projection=projection,max_response_bytes=max_response_bytes)
+
+    metrics.emit('ReportPollAttempts',1)
+    metrics.emit('ReportNotReady',int(response_content is False))
+
+    return response_content
+
+def get_report(url,*,http,projection,max_response_bytes):
+
+    if projection:
+
+        # stream the report, keeping only the projected fields
+
+        r = http.get(url,stream=True)
+        try:
+            if r.status_code != 200:
+                return False
+            projector = JsonProjection(
+                chunks=r.iter_content(chunk_size=CHUNK_SIZE),
+                paths=projection,
+                max_bytes=max_response_bytes,
+            )
+            response_content = projector.project()
+        finally:
+            r.close()
+        # the report exists, so a missing field will not appear by polling again
+        missing = [path for path in projection if tuple(path.split('.')) not in projector.found]
+        if missing:
+            raise ProjectionNotFound(f'{", ".join(missing)} not in the report')
+        log.debug('projected response content',response_content=response_content)
+        return response_content
+
+    r = http.get(url)
     try:
         assert r.status_code == 200
     except AssertionError:
         return False
     else:
         response_content = json.loads(r.content)
-        print(f'response_content:\n{response_content}')
+        log.debug('response content',response_content=response_content)
         return response_content
 
 def lambda_handler(event,context):
@@ -19,13 +232,18 @@ def lambda_handler(event,context):
     class StatusCodeNot200Exception(Exception):
         pass
     
-    print(f'event:\n{event}\ncontext:\n{context}')
+    log.start_invocation(context)
+    log.debug('event',event=event)
     
     url = event['Url']
     
-    response = requests_get(url)
+    response = requests_get(
+        url,
+        projection=event.get('Projection'),
+        max_response_bytes=event.get('MaxResponseBytes',MAX_RESPONSE_BYTES),
+    )
     
-    if not response:
+    if response is False:
         raise StatusCodeNot200Exception
     else:
-        return response
\ No newline at end of file
+        return response
@@ -0,0 +1,21 @@
+from cb_runtime import logs
+from cb_runtime.results_report_waiters import pop_waiter, send_report_ready
+
+log = logs.logger
+
+def lambda_handler(event,context):
+    
+    # S3 Object Created event from EventBridge
+    
+    log.start_invocation(context)
+    log.debug('event',event=event)
+    
+    report_key = f"{event['detail']['bucket']['name']}/{event['detail']['object']['key']}"
+    
+    task_token = pop_waiter(report_key=report_key)
+    
+    if not task_token:
+        log.info('no execution waiting',report_key=report_key)
+        return False
+    
+    return send_report_ready(task_token=task_token,report_key=report_key)
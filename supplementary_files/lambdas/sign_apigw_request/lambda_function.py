@@ -1,23 +1,65 @@
+import functools
 import json
 import re
 import os
 
-import boto3
 from botocore.exceptions import ClientError
 
-import requests
-from aws_requests_auth.boto_utils import BotoAWSRequestsAuth
+from cb_runtime import clients, config_events, control_broker, logs, metrics
+from cb_runtime.control_broker import cb_input_object
 
-session = boto3.session.Session()
-region = session.region_name
-account_id = boto3.client('sts').get_caller_identity().get('Account')
+log = logs.logger
 
-s3 = boto3.client("s3")
+region = clients.region()
 
+s3 = clients.lazy("s3")
+config = clients.lazy("config")
+
+@functools.lru_cache(maxsize=None)
 def get_host(*,full_invoke_url):
-    m = re.search('https://(.*)/.*',full_invoke_url)
+    m = re.search('https?://([^/]*)/.*',full_invoke_url)
     return m.group(1)
 
+# resolved once per execution environment and reused by every warm invocation
+
+full_invoke_url = os.environ.get('ControlBrokerInvokeUrl')
+
+# the endpoints a fanned out execution may name, by name
+endpoints = json.loads(os.environ.get('ControlBrokerEndpoints') or '{}')
+
+for url in filter(None,[full_invoke_url,*endpoints.values()]):
+    get_host(full_invoke_url=url)
+
+class ControlBrokerRequestFailed(Exception):
+    pass
+
+def new_http_session(*,pool_connections=4,pool_maxsize=16):
+    # keep-alive connections to the Control Broker API, reused across invocations
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    http = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_connections,pool_maxsize=pool_maxsize)
+    http.mount('https://',adapter)
+    http.mount('http://',adapter)
+    return http
+
+@functools.lru_cache(maxsize=None)
+def get_http():
+    return new_http_session(
+        pool_connections=int(os.environ.get('HttpPoolConnections',4)),
+        pool_maxsize=int(os.environ.get('HttpPoolMaxsize',16)),
+    )
+
+def __getattr__(name):
+    # the session, and requests with it, is created by the first request rather than at import
+    if name == 'http':
+        return get_http()
+    raise AttributeError(name)
+
+def get_signer(*,host):
+    return control_broker.get_signer(host=host,region=region)
+
 def put_object(bucket,key,object_:dict):
     try:
         r = s3.put_object(
@@ -26,64 +68,42 @@ def put_object(bucket,key,object_:dict):
             Body = json.dumps(object_)
         )
     except ClientError as e:
-        print(f'ClientError:\n{e}')
+        log.error('ClientError',operation='PutObject',error=str(e))
         raise
     else:
-        print(f'no ClientError put_object\nbucket:\n{bucket}\nKey:\n{key}')
+        log.debug('put object',bucket=bucket,key=key)
         return True
     
-def lambda_handler(event,context):
+def post_config_event(*,config_event,full_invoke_url=full_invoke_url,http=None):
     
-    invoke_url = os.environ['ControlBrokerInvokeUrl']
+    import requests
     
-    invoking_event = json.loads(event["invokingEvent"])
-    print(f"invoking_event:\n{invoking_event}")
-
-    configuration_item = invoking_event["configurationItem"]
-    print(f"configuration_item:\n{configuration_item}")
-
-    resource_type = configuration_item["resourceType"]
-    print(f"resource_type:\n{resource_type}")
-
-    resource_id = configuration_item["resourceId"]
-    print(f"resource_id:\n{resource_id}")
-
-    result_token = event["resultToken"]
-    print(f"result_token:\n{result_token}")
+    http = http or get_http()
     
-    config_rule_name = event["configRuleName"]
-    print(f"config_rule_name:\n{config_rule_name}")
+    host = get_host(full_invoke_url=full_invoke_url)
     
-    invoked_by_key = f'{config_rule_name}-{resource_type}-{resource_id}-{invoking_event["notificationCreationTime"]}'
-
-    cb_input_object = {
-        "Context":{
-            "EnvironmentEvaluation":"Prod",
-        },
-        "Input": event
-    }
+    # prepared and sent separately, so signing and the round trip are timed apart
     
-    def get_host(full_invoke_url):
-        m = re.search('https://(.*)/.*',full_invoke_url)
-        return m.group(1)
+    with metrics.timer('SignLatency'):
+        prepared = http.prepare_request(requests.Request(
+            'POST',
+            full_invoke_url,
+            auth = get_signer(host=host),
+            json = cb_input_object(config_event)
+        ))
     
-    full_invoke_url=os.environ['ControlBrokerInvokeUrl']
+    try:
+        with metrics.timer('ControlBrokerLatency') as properties:
+            r = http.send(prepared,**http.merge_environment_settings(prepared.url,{},None,None,None))
+            properties['StatusCode'] = r.status_code
+    except requests.RequestException:
+        metrics.emit('ControlBrokerErrors',1)
+        raise
     
-    host = get_host(full_invoke_url)
-        
-    auth = BotoAWSRequestsAuth(
-        aws_host= host,
-        aws_region=region,
-        aws_service='execute-api'
-    )
+    metrics.emit('ControlBrokerErrors',int(r.status_code != 200),StatusCode=r.status_code)
     
-    r = requests.post(
-        full_invoke_url,
-        auth = auth,
-        json = cb_input_object
-    )
-    
-    print(f'headers:\n{dict(r.request.headers)}\n')
+    # the signed Authorization and session token headers are redacted
+    log.debug('request headers',headers=dict(r.request.headers))
     
     cb_endpoint_response = json.loads(r.content)
     
@@ -94,9 +114,59 @@ def lambda_handler(event,context):
         'Content': cb_endpoint_response
     }
     
-    print(f'\napigw_formatted_response:\n{apigw_formatted_response}')
+    log.debug('apigw formatted response',response=apigw_formatted_response)
     
     if status_code != 200:
+        log.error('Control Broker request failed',status_code=status_code,content=cb_endpoint_response)
         return False
     
-    return cb_endpoint_response
\ No newline at end of file
+    log.info('Control Broker request',status_code=status_code)
+    
+    return cb_endpoint_response
+    
+def lambda_handler(event,context):
+    
+    log.start_invocation(context)
+    
+    # fanned out, the event names an endpoint and output handler beside the Config event
+    
+    fan_out = 'Endpoint' in event
+    
+    # the only state that needs the full payload, so claim checks are resolved here
+    
+    config_event = config_events.resolve_config_event(event['ConfigEvent'] if fan_out else event,s3=s3,config=config)
+    
+    invoking_event = json.loads(config_event["invokingEvent"])
+
+    configuration_item = invoking_event["configurationItem"]
+    log.debug('configuration item',configuration_item=configuration_item)
+
+    resource_type = configuration_item["resourceType"]
+    resource_id = configuration_item["resourceId"]
+    config_rule_name = config_event["configRuleName"]
+    
+    log.info('config event',config_rule_name=config_rule_name,resource_type=resource_type,resource_id=resource_id)
+    
+    invoked_by_key = f'{config_rule_name}-{resource_type}-{resource_id}-{invoking_event["notificationCreationTime"]}'
+    
+    if not fan_out:
+        return post_config_event(
+            config_event = config_event,
+        )
+    
+    response = post_config_event(
+        config_event = config_event,
+        full_invoke_url = endpoints[event['Endpoint']],
+    )
+    
+    if not response:
+        # raised rather than returned, so the fan out fails as a whole instead of reading a missing report
+        raise ControlBrokerRequestFailed(event['Endpoint'])
+    
+    output_handler = event['OutputHandler']
+    
+    return {
+        'Endpoint': event['Endpoint'],
+        'OutputHandler': output_handler,
+        'PresignedUrl': response['Response']['ControlBrokerEvaluation']['OutputHandlers'][output_handler]['PresignedUrl'],
+    }
@@ -0,0 +1,86 @@
+import json
+
+from boto3.dynamodb.types import TypeDeserializer
+from botocore.exceptions import ClientError
+
+from cb_runtime import clients, logs, metrics
+
+log = logs.logger
+
+events = clients.lazy('events')
+
+# PutEvents accepts at most 10 entries per call
+MAX_ENTRIES_PER_CALL = 10
+
+SOURCE = 'control-broker.config-consumer'
+
+DETAIL_TYPE = 'Compliance Verdict Changed'
+
+# the fields of a verdict store item published with its change
+DETAIL_FIELDS = [
+    'ConfigRuleName',
+    'ResourceType',
+    'ResourceId',
+    'ComplianceType',
+    'PreviousComplianceType',
+    'ChangedAt',
+    'PolicyVersion',
+    'LatencyMs',
+]
+
+deserializer = TypeDeserializer()
+
+def new_verdict(record):
+    image = record['dynamodb'].get('NewImage')
+    return {k: deserializer.deserialize(v) for k, v in image.items()} if image else None
+
+def change_entry(verdict):
+    return {
+        'Source': SOURCE,
+        'DetailType': DETAIL_TYPE,
+        # numbers come out of the stream as Decimal
+        'Detail': json.dumps({k: verdict[k] for k in DETAIL_FIELDS if k in verdict},default=int),
+    }
+
+def put_change_events(entries):
+    """Sequence numbers of the records whose change event was not put"""
+    failed = []
+    for i in range(0,len(entries),MAX_ENTRIES_PER_CALL):
+        chunk = entries[i:i + MAX_ENTRIES_PER_CALL]
+        try:
+            r = events.put_events(Entries=[entry for _, entry in chunk])
+        except ClientError as e:
+            log.error('ClientError',operation='PutEvents',error=str(e))
+            failed += [sequence_number for sequence_number, _ in chunk]
+        else:
+            failed += [
+                sequence_number
+                for (sequence_number, _), result in zip(chunk,r['Entries'])
+                if result.get('ErrorCode')
+            ]
+    return failed
+
+def lambda_handler(event,context):
+
+    # verdict store stream records, filtered on Transition by the event source mapping
+
+    log.start_invocation(context)
+    log.debug('event',event=event)
+
+    entries = []
+
+    for record in event['Records']:
+        verdict = new_verdict(record)
+        # refreshes of an unchanged verdict are no change, whatever reaches this function
+        if verdict and verdict.get('Transition'):
+            entries.append((record['dynamodb']['SequenceNumber'],change_entry(verdict)))
+
+    failed = put_change_events(entries)
+
+    metrics.emit('VerdictTransitions',len(entries) - len(failed))
+    log.info('verdict changes',records=len(event['Records']),changes=len(entries),failed=len(failed))
+
+    # retried from the first failed record
+    return {
+        'batchItemFailures': [{'itemIdentifier': sequence_number} for sequence_number in failed]
+    }
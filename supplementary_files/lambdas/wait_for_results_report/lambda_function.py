@@ -0,0 +1,53 @@
+import os
+import re
+from urllib.parse import unquote, urlparse
+
+import requests
+from cb_runtime import logs
+from cb_runtime.results_report_waiters import pop_waiter, put_waiter, report_key, send_report_ready
+
+log = logs.logger
+
+http = requests.Session()
+
+def presigned_url_to_bucket_key(*,url):
+    parsed = urlparse(url)
+    path = unquote(parsed.path.lstrip('/'))
+    m = re.match(r'(.+)\.s3[.-]', parsed.netloc)
+    if m:
+        # virtual-hosted style: https://bucket.s3.region.amazonaws.com/key
+        return m.group(1), path
+    # path style: https://s3.region.amazonaws.com/bucket/key
+    bucket, _, key = path.partition('/')
+    return bucket, key
+
+def report_exists(*,url):
+    r = http.get(url,stream=True)
+    r.close()
+    return r.status_code == 200
+
+def lambda_handler(event,context):
+    
+    log.start_invocation(context)
+    log.debug('event',event=event)
+    
+    bucket, key = presigned_url_to_bucket_key(url=event['Url'])
+    
+    waiter_key = report_key(bucket=bucket,key=key)
+    
+    put_waiter(
+        report_key=waiter_key,
+        task_token=event['TaskToken'],
+        ttl_seconds=int(os.environ.get('WaiterTtlSeconds',3600)),
+    )
+    
+    # the report may have been written before the waiter was registered
+    
+    if report_exists(url=event['Url']):
+        
+        task_token = pop_waiter(report_key=waiter_key)
+        
+        if task_token:
+            send_report_ready(task_token=task_token,report_key=waiter_key)
+    
+    return True
@@ -0,0 +1,33 @@
+import json
+import os
+import sys
+
+import pytest
+
+from utils import paths
+
+# the cb_runtime layer, importable by the tests of its modules as by the handlers
+sys.path.append(str(paths.LAMBDA_LAYERS / "cb_runtime"))
+
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+os.environ.setdefault("AWS_ACCESS_KEY_ID", "testing")
+os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "testing")
+os.environ.setdefault("JSII_SILENCE_WARNING_DEPRECATED_NODE_VERSION", "1")
+
+TOGGLED_BOOLEAN_PATH = paths.REPO_ROOT / "dev/tracked_by_config/toggled_boolean.json"
+
+
+@pytest.fixture(autouse=True, scope="session")
+def preserve_toggled_boolean():
+    # synthesizing the stack flips dev/tracked_by_config/toggled_boolean.json
+    with open(TOGGLED_BOOLEAN_PATH) as f:
+        toggled_boolean = f.read()
+    yield
+    with open(TOGGLED_BOOLEAN_PATH, "w") as f:
+        f.write(toggled_boolean)
+
+
+@pytest.fixture
+def config_event():
+    with open(paths.REPO_ROOT / "tests/fixtures/config_event.json") as f:
+        return json.load(f)
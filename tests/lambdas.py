@@ -0,0 +1,25 @@
+import importlib.util
+import sys
+
+from utils import paths
+
+# layers built from source in this repository, importable by the handlers as in Lambda
+sys.path.append(str(paths.LAMBDA_LAYERS / "cb_runtime"))
+
+from cb_runtime import clients  # noqa: E402
+
+
+def load_lambda(name):
+    """Import supplementary_files/lambdas/<name>/lambda_function.py as its own module.
+
+    Each load starts from a fresh execution environment, so clients stubbed by
+    one test are not reused by the next.
+    """
+    clients.reset()
+    spec = importlib.util.spec_from_file_location(
+        f"{name}_lambda_function",
+        paths.LAMBDA_FUNCTIONS / name / "lambda_function.py",
+    )
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
@@ -0,0 +1,218 @@
+import pytest
+
+from utils import asl
+
+FUNCTION = "arn:aws:lambda:us-east-1:123456789012:function:Handler"
+
+
+def task(**state):
+    return {
+        "Type": "Task",
+        "Resource": asl.LAMBDA_INVOKE,
+        "Parameters": {"FunctionName": FUNCTION, "Payload.$": "$"},
+        **state,
+    }
+
+
+def run(definition, input, handler, **kwargs):
+    return asl.Execution(definition, tasks={FUNCTION: handler}, sleep=lambda seconds: None, **kwargs).run(input)
+
+
+def test_paths_and_result_selector():
+    definition = {
+        "StartAt": "Task",
+        "States": {
+            "Task": task(
+                InputPath="$.Event",
+                ResultSelector={"Doubled.$": "$.Payload"},
+                ResultPath="$.Task",
+                OutputPath="$.Task",
+                End=True,
+            ),
+        },
+    }
+
+    execution = run(definition, {"Event": {"Value": 2}}, lambda event, context: event["Value"] * 2)
+
+    assert execution.status == "SUCCEEDED"
+    assert execution.output == {"Doubled": 4}
+    assert [entry["State"] for entry in execution.history] == ["Task"]
+
+
+def test_retry_then_catch():
+    attempts = []
+
+    def handler(event, context):
+        attempts.append(event)
+        raise ValueError("not yet")
+
+    definition = {
+        "StartAt": "Task",
+        "States": {
+            "Task": task(
+                Retry=[{"ErrorEquals": ["ValueError"], "MaxAttempts": 2}],
+                Catch=[{"ErrorEquals": ["States.ALL"], "ResultPath": "$.Error", "Next": "Failed"}],
+                End=True,
+            ),
+            "Failed": {"Type": "Pass", "End": True},
+        },
+    }
+
+    execution = run(definition, {}, handler)
+
+    assert len(attempts) == 3
+    assert execution.history[0]["Attempts"] == 3
+    assert execution.output == {"Error": {"Error": "ValueError", "Cause": "not yet"}}
+
+
+def test_missing_path_is_not_caught():
+    definition = {
+        "StartAt": "Task",
+        "States": {
+            "Task": task(
+                InputPath="$.Missing",
+                Catch=[{"ErrorEquals": ["States.ALL"], "Next": "Failed"}],
+                End=True,
+            ),
+            "Failed": {"Type": "Pass", "End": True},
+        },
+    }
+
+    execution = run(definition, {}, lambda event, context: event)
+
+    assert execution.status == "FAILED"
+    assert execution.error == "States.Runtime"
+
+
+def test_choice_and_intrinsics():
+    definition = {
+        "StartAt": "Parse",
+        "States": {
+            "Parse": {
+                "Type": "Pass",
+                "Parameters": {
+                    "Event.$": "States.StringToJson($.Event)",
+                    "Greeting.$": "States.Format('hello {}', $.Name)",
+                },
+                "Next": "Choice",
+            },
+            "Choice": {
+                "Type": "Choice",
+                "Choices": [{"Variable": "$.Event.Compliant", "BooleanEquals": True, "Next": "Compliant"}],
+                "Default": "NonCompliant",
+            },
+            "Compliant": {"Type": "Succeed"},
+            "NonCompliant": {"Type": "Fail", "Error": "NonCompliant"},
+        },
+    }
+
+    succeeded = run(definition, {"Event": '{"Compliant": true}', "Name": "queue"}, None)
+    failed = run(definition, {"Event": '{"Compliant": false}', "Name": "queue"}, None)
+
+    assert succeeded.output == {"Event": {"Compliant": True}, "Greeting": "hello queue"}
+    assert (failed.status, failed.error) == ("FAILED", "NonCompliant")
+
+
+def test_map_runs_the_iterator_per_item():
+    definition = {
+        "StartAt": "Map",
+        "States": {
+            "Map": {
+                "Type": "Map",
+                "ItemsPath": "$.Items",
+                "MaxConcurrency": 2,
+                "ResultPath": "$.Results",
+                "Iterator": {"StartAt": "Task", "States": {"Task": task(OutputPath="$.Payload", End=True)}},
+                "Next": "AnyFalse",
+            },
+            "AnyFalse": {
+                "Type": "Pass",
+                "Parameters": {"AnyFalse.$": "States.ArrayContains($.Results, false)"},
+                "End": True,
+            },
+        },
+    }
+
+    execution = run(definition, {"Items": [1, 2, 3]}, lambda event, context: event != 2)
+
+    assert execution.output == {"AnyFalse": True}
+
+
+def test_unanswered_task_token_times_out():
+    definition = {
+        "StartAt": "Task",
+        "States": {
+            "Task": task(
+                Resource=asl.LAMBDA_INVOKE_WAIT_FOR_TASK_TOKEN,
+                Parameters={"FunctionName": FUNCTION, "Payload": {"TaskToken.$": "$$.Task.Token"}},
+                TimeoutSeconds=60,
+                End=True,
+            ),
+        },
+    }
+    execution = asl.Execution(definition, tasks={})
+
+    def handler(event, context):
+        execution.send_task_success(event["TaskToken"], {"IsCompliant": True})
+
+    execution.tasks[FUNCTION] = handler
+    assert execution.run({}).output == {"IsCompliant": True}
+
+    execution = run(definition, {}, lambda event, context: None)
+    assert execution.error == "States.Timeout"
+
+
+@pytest.mark.parametrize("path", ["$.a..b", "$.a[x]", "a.a"])
+def test_invalid_paths(path):
+    with pytest.raises(asl.StatesError):
+        asl.get_path({"a": {"b": 1}}, path)
+
+
+def test_validate_reports_each_problem():
+    definition = {
+        "StartAt": "Parse",
+        "States": {
+            "Parse": {
+                "Type": "Pass",
+                "Parameters": {"Event.$": "States.StringToJsn($.Event)", "Name.$": "$.a..b"},
+                "Next": "Choice",
+            },
+            "Choice": {
+                "Type": "Choice",
+                "Choices": [{"Variable": "$.Event", "BooleanEquals": True, "Next": "Missing"}],
+            },
+            "Task": task(Retry=[{"ErrorEquals": ["States.ALL", "ValueError"]}], End=True, Next="Choice"),
+        },
+    }
+
+    assert asl.validate(definition) == [
+        "Parse: unsupported intrinsic function States.StringToJsn",
+        "Parse: invalid path $.a..b",
+        "Choice: transitions to missing state Missing",
+        "Task: needs either End or Next",
+        "Task: States.ALL must be alone in the last Retry",
+        "Task: unreachable from Parse",
+    ]
+
+
+def test_validate_reports_state_names_reused_inside_an_iterator():
+    definition = {
+        "StartAt": "Map",
+        "States": {
+            "Map": {
+                "Type": "Map",
+                "Iterator": {
+                    "StartAt": "Task",
+                    "States": {
+                        "Task": task(Catch=[{"ErrorEquals": ["States.ALL"], "Next": "Failed"}], End=True),
+                        "Failed": {"Type": "Fail"},
+                    },
+                },
+                "Catch": [{"ErrorEquals": ["States.ALL"], "Next": "Failed"}],
+                "End": True,
+            },
+            "Failed": {"Type": "Fail"},
+        },
+    }
+
+    assert asl.validate(definition) == ["Failed: duplicate state name"]
@@ -0,0 +1,106 @@
+import datetime
+import io
+import json
+
+import pytest
+from botocore.response import StreamingBody
+from botocore.stub import ANY, Stubber
+
+from tests.lambdas import load_lambda
+
+SFN_ARN = "arn:aws:states:us-east-1:123456789012:stateMachine:ConfigEventProcessing"
+BUCKET = "config-events-raw-input"
+
+
+@pytest.fixture
+def invoked_by_config(monkeypatch):
+    monkeypatch.setenv("ConfigEventProcessingSfnArn", SFN_ARN)
+    monkeypatch.setenv("ConfigEventsRawInputBucket", BUCKET)
+    return load_lambda("invoked_by_config")
+
+
+@pytest.fixture
+def sign_apigw_request():
+    return load_lambda("sign_apigw_request")
+
+
+@pytest.fixture
+def oversized_config_event(config_event):
+    configuration_item = json.loads(config_event["invokingEvent"])["configurationItem"]
+    return {
+        **config_event,
+        "invokingEvent": json.dumps({
+            "configurationItemSummary": {k: v for k, v in configuration_item.items() if k != "configuration"},
+            "s3ObjectKey": "oversized.json",
+            "s3Bucket": "config-bucket",
+            "notificationCreationTime": "2022-06-01T17:22:43.213Z",
+            "messageType": "OversizedConfigurationItemChangeNotification",
+            "recordVersion": "1.0",
+        }),
+    }
+
+
+def started_input(invoked_by_config, config_event):
+    inputs = []
+    with Stubber(invoked_by_config.s3) as s3, Stubber(invoked_by_config.sfn) as sfn:
+        s3.add_response("put_object", {}, {"Bucket": BUCKET, "Key": ANY, "Body": json.dumps(config_event)})
+        sfn.add_response("start_execution", {"executionArn": f"{SFN_ARN}:1", "startDate": 0})
+        invoked_by_config.sfn.meta.events.register(
+            "provide-client-params.states.StartExecution",
+            lambda params, **kwargs: inputs.append(json.loads(params["input"])),
+        )
+        assert invoked_by_config.lambda_handler(config_event, None) is True
+        s3.assert_no_pending_responses()
+    return inputs[0]
+
+
+def test_claim_check_passes_a_pointer_and_routing_fields(invoked_by_config, config_event, monkeypatch):
+    monkeypatch.setenv("ConfigEventClaimCheck", "true")
+
+    slim = started_input(invoked_by_config, config_event)
+
+    assert slim["ClaimCheck"]["Bucket"] == BUCKET
+    assert slim["ClaimCheck"]["Key"].startswith(f"config-events/{config_event['configRuleName']}/")
+    assert slim["resultToken"] == config_event["resultToken"]
+    configuration_item = json.loads(slim["invokingEvent"])["configurationItem"]
+    assert configuration_item["resourceType"] == "AWS::SQS::Queue"
+    assert "configuration" not in configuration_item
+    assert len(json.dumps(slim)) < len(json.dumps(config_event))
+
+
+def test_oversized_configuration_item_is_always_claim_checked(invoked_by_config, oversized_config_event):
+    slim = started_input(invoked_by_config, oversized_config_event)
+
+    assert "ClaimCheck" in slim
+    assert json.loads(slim["invokingEvent"])["configurationItem"]["resourceType"] == "AWS::SQS::Queue"
+
+
+def test_sign_apigw_request_resolves_claim_check_and_oversized_item(sign_apigw_request, oversized_config_event):
+    body = json.dumps(oversized_config_event).encode()
+    claim_check = {"Bucket": BUCKET, "Key": "config-events/rule/digest.json"}
+    history_item = {
+        "version": "1.3",
+        "accountId": "123456789012",
+        "configurationItemCaptureTime": datetime.datetime(2022, 6, 1, 17, 22, 41),
+        "configurationItemStatus": "OK",
+        "resourceType": "AWS::SQS::Queue",
+        "resourceId": "queue",
+        "arn": "arn:aws:sqs:us-east-1:123456789012:queue",
+        "configuration": json.dumps({"ContentBasedDeduplication": True}),
+    }
+
+    with Stubber(sign_apigw_request.s3) as s3, Stubber(sign_apigw_request.config) as config:
+        s3.add_response("get_object", {"Body": StreamingBody(io.BytesIO(body), len(body))}, claim_check)
+        config.add_response("get_resource_config_history", {"configurationItems": [history_item]})
+
+        resolved = sign_apigw_request.config_events.resolve_config_event(
+            {"ClaimCheck": claim_check, "invokingEvent": "{}"},
+            s3=sign_apigw_request.s3,
+            config=sign_apigw_request.config,
+        )
+
+    invoking_event = json.loads(resolved["invokingEvent"])
+    assert resolved["resultToken"] == oversized_config_event["resultToken"]
+    assert invoking_event["messageType"] == "ConfigurationItemChangeNotification"
+    assert invoking_event["configurationItem"]["configuration"] == {"ContentBasedDeduplication": True}
+    assert invoking_event["configurationItem"]["ARN"] == history_item["arn"]
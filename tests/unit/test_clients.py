@@ -0,0 +1,26 @@
+from tests.lambdas import load_lambda
+from cb_runtime import clients
+
+
+def test_clients_are_created_on_first_use_and_memoized():
+    invoked_by_config = load_lambda("invoked_by_config")
+    assert clients.client.cache_info().currsize == 0
+
+    assert invoked_by_config.sfn.meta.service_model.service_name == "stepfunctions"
+    assert clients.client.cache_info().currsize == 1
+    assert clients.client("stepfunctions") is clients.client("stepfunctions")
+    assert clients.lazy("stepfunctions") is invoked_by_config.sfn
+
+
+def test_clients_are_tuned():
+    config = clients.client("config").meta.config
+    assert config.retries["mode"] == "adaptive"
+    assert config.tcp_keepalive is True
+    assert config.max_pool_connections == 32
+
+
+def test_sign_apigw_request_opens_its_session_on_first_use():
+    sign_apigw_request = load_lambda("sign_apigw_request")
+    sign_apigw_request.get_http.cache_clear()
+    assert sign_apigw_request.get_http.cache_info().currsize == 0
+    assert sign_apigw_request.http is sign_apigw_request.get_http()
@@ -0,0 +1,109 @@
+import boto3
+import pytest
+from botocore.stub import Stubber
+
+from tests.lambdas import load_lambda
+from cb_runtime import compliance_cache
+
+KEY = compliance_cache.cache_key(resource_type="AWS::SQS::Queue", resource_id="queue", config_rule_name="rule")
+
+
+class Clock:
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_entries_expire_after_ttl():
+    clock = Clock()
+    cache = compliance_cache.ComplianceCache(ttl_seconds=60, max_entries=10, clock=clock)
+
+    cache.put(KEY, None)
+    assert cache.get(KEY) is None
+
+    clock.now += 60
+    assert cache.get(KEY) is compliance_cache.MISS
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = compliance_cache.ComplianceCache(ttl_seconds=60, max_entries=2)
+
+    cache.put("a", True)
+    cache.put("b", True)
+    cache.get("a")
+    cache.put("c", False)
+
+    assert list(cache.entries) == ["a", "c"]
+
+
+def test_table_backs_memory_and_is_invalidated():
+    ddb = boto3.resource("dynamodb")
+    clock = Clock()
+    cache = compliance_cache.ComplianceCache(ttl_seconds=60, max_entries=10, table_name="ComplianceCache", ddb=ddb, clock=clock)
+
+    with Stubber(ddb.meta.client) as stubber:
+        stubber.add_response("get_item", {"Item": {"CacheKey": {"S": KEY}, "Compliance": {"BOOL": False}, "ExpiresAt": {"N": "1030"}}})
+        stubber.add_response("delete_item", {}, {"TableName": "ComplianceCache", "Key": {"CacheKey": KEY}})
+
+        assert cache.get(KEY) is False
+        # now answered from memory
+        assert cache.get(KEY) is False
+
+        cache.invalidate(KEY)
+        assert KEY not in cache.entries
+
+        stubber.assert_no_pending_responses()
+
+
+def test_invalidation_by_another_lambda_reaches_a_warm_reader():
+    ddb = boto3.resource("dynamodb")
+    clock = Clock()
+    reader = compliance_cache.ComplianceCache(ttl_seconds=60, max_entries=10, table_name="ComplianceCache", ddb=ddb, clock=clock)
+
+    with Stubber(ddb.meta.client) as stubber:
+        stubber.add_response("put_item", {})
+        # deleted by put_evaluations in the meantime
+        stubber.add_response("get_item", {})
+
+        reader.put(KEY, True)
+        assert reader.get(KEY) is True
+
+        clock.now += reader.memory_ttl_seconds
+        assert reader.get(KEY) is compliance_cache.MISS
+
+        stubber.assert_no_pending_responses()
+
+
+@pytest.fixture
+def get_resource_config_compliance(monkeypatch):
+    monkeypatch.setenv("ComplianceCacheTtlSeconds", "300")
+    return load_lambda("get_resource_config_compliance")
+
+
+def compliance_details(compliance_type):
+    return {
+        "EvaluationResults": [{
+            "EvaluationResultIdentifier": {"EvaluationResultQualifier": {"ConfigRuleName": "rule"}},
+            "ComplianceType": compliance_type,
+        }]
+    }
+
+
+def test_repeated_reads_skip_config_until_verified(get_resource_config_compliance):
+    lookup = dict(resource_type="AWS::SQS::Queue", resource_id="queue", config_rule_name="rule")
+
+    with Stubber(get_resource_config_compliance.config) as config:
+        config.add_response("get_compliance_details_by_resource", compliance_details("NON_COMPLIANT"))
+        config.add_response("get_compliance_details_by_resource", compliance_details("COMPLIANT"))
+
+        assert get_resource_config_compliance.get_resource_config_compliance_by_resource(**lookup) is False
+        assert get_resource_config_compliance.get_resource_config_compliance_by_resource(**lookup) is False
+
+        # a verifying read goes to Config and refreshes the cache
+        assert get_resource_config_compliance.get_resource_config_compliance_by_resource(**lookup, use_cache=False) is True
+        assert get_resource_config_compliance.get_resource_config_compliance_by_resource(**lookup) is True
+
+        config.assert_no_pending_responses()
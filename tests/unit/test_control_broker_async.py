@@ -0,0 +1,87 @@
+import json
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("aiohttp")
+
+from benchmarks.stubs import StubServer
+from cb_runtime import control_broker_async
+
+
+class ControlBroker:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.requests = []
+
+    def respond(self, path, body):
+        with self.lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            self.requests.append(json.loads(body))
+        time.sleep(0.01)
+        with self.lock:
+            self.in_flight -= 1
+        index = json.loads(body)["Input"]["Index"]
+        if index == 3:
+            return 500, {"Error": "internal"}
+        return 200, {"Index": index}
+
+
+def test_posts_signed_envelopes_concurrently_up_to_the_limit():
+    control_broker = ControlBroker()
+
+    with StubServer(control_broker.respond) as server:
+        responses = control_broker_async.post_config_events(
+            [{"Index": i} for i in range(20)],
+            full_invoke_url=f"{server.url}/ConfigEvent",
+            region="us-east-1",
+            concurrency=4,
+        )
+
+    assert responses[3] is False
+    assert [r["Index"] for i, r in enumerate(responses) if i != 3] == [i for i in range(20) if i != 3]
+    assert 1 < control_broker.max_in_flight <= 4
+    assert control_broker.requests[0]["Context"] == {"EnvironmentEvaluation": "Prod"}
+
+
+def test_signed_headers_match_the_blocking_client():
+    headers = control_broker_async.control_broker.signed_headers(
+        signer=control_broker_async.control_broker.get_signer(host="127.0.0.1:8080", region="us-east-1"),
+        url="http://127.0.0.1:8080/dev/ConfigEvent",
+        body=json.dumps({"Input": {}}),
+    )
+
+    assert headers["Authorization"].startswith("AWS4-HMAC-SHA256 Credential=")
+    assert "/us-east-1/execute-api/aws4_request" in headers["Authorization"]
+    assert headers["x-amz-date"]
+
+
+def test_reads_at_most_max_pending_events_ahead():
+    control_broker = ControlBroker()
+    read = []
+
+    def config_events():
+        for i in range(10):
+            read.append(i)
+            yield {"Index": i}
+
+    async def first_response(client):
+        async for index, response in client.map_config_events(config_events()):
+            return len(read)
+
+    with StubServer(control_broker.respond) as server:
+        async def run():
+            async with control_broker_async.AsyncControlBrokerClient(
+                full_invoke_url=f"{server.url}/ConfigEvent",
+                region="us-east-1",
+                concurrency=2,
+                max_pending=3,
+            ) as client:
+                return await first_response(client)
+
+        assert control_broker_async.asyncio.run(run()) == 3
@@ -1,15 +1,477 @@
+import collections
+import json
+
 import aws_cdk as core
 import aws_cdk.assertions as assertions
+import pytest
+
+from components.config_rules import load_config_rules
+from stacks.config_stack import ControlBrokerConsumerExampleConfigStack
+from utils import asl, paths
+
+CONTROL_BROKER_APIGW_URL = "https://MY_API_ID.execute-api.us-east-1.amazonaws.com/ConfigEvent"
+
+
+def synth(**kwargs):
+    # skip asset bundling, which needs docker for the PythonLayerVersion layers
+    app = core.App(context={"aws:cdk:bundling-stacks": []})
+    stack = ControlBrokerConsumerExampleConfigStack(app, "control-broker-consumer-example-config",
+        control_broker_apigw_url=CONTROL_BROKER_APIGW_URL,
+        **kwargs
+    )
+    return stack, assertions.Template.from_stack(stack)
 
-from control_broker_consumer_example_config.control_broker_consumer_example_config_stack import ControlBrokerConsumerExampleConfigStack
 
-# example tests. To run these tests, uncomment this file along with the example
-# resource in control_broker_consumer_example_config/control_broker_consumer_example_config_stack.py
 def test_sqs_queue_created():
-    app = core.App()
-    stack = ControlBrokerConsumerExampleConfigStack(app, "control-broker-consumer-example-config")
-    template = assertions.Template.from_stack(stack)
+    stack, template = synth()
+
+    template.resource_count_is("AWS::SQS::Queue", 2)
+    template.resource_count_is("AWS::Lambda::EventSourceMapping", 0)
+    assert stack.config_event_processing_definition["StartAt"] == "ParseInput"
+
+
+def test_batch_evaluation_buffers_config_events():
+    stack, template = synth(batch_evaluation=True, batch_size=100, batch_max_batching_window_seconds=20)
+
+    template.resource_count_is("AWS::SQS::Queue", 4)
+    template.has_resource_properties("AWS::Lambda::EventSourceMapping", {
+        "BatchSize": 100,
+        "MaximumBatchingWindowInSeconds": 20,
+        "FunctionResponseTypes": ["ReportBatchItemFailures"],
+    })
+    template.has_resource_properties("AWS::Lambda::Function", {
+        "Environment": {
+            "Variables": assertions.Match.object_like({
+                "ConfigEventBufferQueueUrl": assertions.Match.any_value(),
+            })
+        }
+    })
+
+    definition = stack.config_event_processing_definition
+    process_config_events = definition["States"]["ProcessConfigEvents"]
+    assert process_config_events["Type"] == "Map"
+    assert process_config_events["ItemsPath"] == "$.ConfigEvents"
+
+    item_states = process_config_events["Iterator"]["States"]
+    assert item_states["ComplianceStatusIsAsExpectedTrue"] == {"Type": "Pass", "Result": True, "End": True}
+    assert item_states["ComplianceStatusIsAsExpectedFalse"] == {"Type": "Pass", "Result": False, "End": True}
+
+
+def assert_valid_definition(definition):
+    assert asl.validate(definition) == []
+
+
+@pytest.mark.parametrize("state_machine_type", ["STANDARD", "EXPRESS"])
+@pytest.mark.parametrize("batch_evaluation", [False, True])
+def test_state_machine_variants_produce_valid_definitions(state_machine_type, batch_evaluation):
+    stack, template = synth(state_machine_type=state_machine_type, batch_evaluation=batch_evaluation)
+
+    template.has_resource_properties("AWS::StepFunctions::StateMachine", {
+        "StateMachineType": state_machine_type,
+    })
+    template.has_resource_properties("AWS::Lambda::Function", {
+        "Environment": {
+            "Variables": assertions.Match.object_like({
+                "ConfigEventProcessingSfnType": state_machine_type,
+            })
+        }
+    })
+
+    definition = stack.config_event_processing_definition
+    assert_valid_definition(definition)
+    assert json.loads(json.dumps(definition)) == definition
+
+    # GetIsCompliant keeps its polling retry regardless of the execution type
+    if batch_evaluation:
+        states = definition["States"]["ProcessConfigEvents"]["Iterator"]["States"]
+    else:
+        states = definition["States"]
+    assert states["GetIsCompliant"]["Retry"] == [{
+        "ErrorEquals": ["StatusCodeNot200Exception"],
+        "IntervalSeconds": 1,
+        "MaxAttempts": 8,
+        "BackoffRate": 2.0
+    }]
+
+
+def test_unknown_state_machine_type_is_rejected():
+    with pytest.raises(ValueError):
+        synth(state_machine_type="SYNC")
+
+
+def test_lambdalith_topology_replaces_state_machine():
+    stack, template = synth(evaluation_topology="Lambdalith")
+
+    template.resource_count_is("AWS::StepFunctions::StateMachine", 0)
+    template.has_resource_properties("AWS::Lambda::Function", {
+        "Handler": "evaluation_pipeline.lambda_function.lambda_handler",
+    })
+    template.has_resource_properties("AWS::Lambda::Function", {
+        "Environment": {
+            "Variables": assertions.Match.object_like({
+                "EvaluationPipelineFunctionName": assertions.Match.any_value(),
+            })
+        }
+    })
+
+
+def test_task_token_readiness_waits_before_polling():
+    stack, template = synth(results_report_readiness="TaskToken", results_bucket_name="control-broker-results")
+
+    template.resource_count_is("AWS::DynamoDB::Table", 1)
+    template.has_resource_properties("AWS::Events::Rule", {
+        "EventPattern": {
+            "source": ["aws.s3"],
+            "detail-type": ["Object Created"],
+            "detail": {"bucket": {"name": ["control-broker-results"]}},
+        }
+    })
+
+    definition = stack.config_event_processing_definition
+    assert_valid_definition(definition)
+
+    states = definition["States"]
+    assert states["GetResourceConfigComplianceInitial"]["Next"] == "WaitForResultsReport"
+    assert states["WaitForResultsReport"]["Resource"] == "arn:aws:states:::lambda:invoke.waitForTaskToken"
+    assert states["WaitForResultsReport"]["Next"] == "GetIsCompliant"
+    assert states["WaitForResultsReport"]["Catch"][0]["Next"] == "GetIsCompliant"
+    assert "Retry" in states["GetIsCompliant"]
+
+
+def test_task_token_readiness_requires_standard_state_machine():
+    with pytest.raises(ValueError):
+        synth(results_report_readiness="TaskToken", results_bucket_name="control-broker-results", state_machine_type="EXPRESS")
+
+
+def test_compliance_cache_table_is_shared_by_readers_and_writers():
+    stack, template = synth(compliance_cache_table=True)
+
+    template.resource_count_is("AWS::DynamoDB::Table", 1)
+    functions = template.find_resources("AWS::Lambda::Function", {
+        "Properties": {
+            "Environment": {
+                "Variables": assertions.Match.object_like({
+                    "ComplianceCacheTtlSeconds": "300",
+                    "ComplianceCacheTableName": assertions.Match.any_value(),
+                })
+            }
+        }
+    })
+    assert len(functions) == 2
+
+    put_evaluations = stack.config_event_processing_definition["States"]["PutEvaluations"]
+    assert put_evaluations["Parameters"]["Payload"]["ConfigRuleName.$"] == "$.ConfigEvent.configRuleName"
+
+
+@pytest.mark.parametrize("evaluation_topology", ["StepFunctions", "Lambdalith"])
+@pytest.mark.parametrize("compliance_cache_table, tables", [(False, 0), (True, 1)])
+def test_compliance_cache_table_is_opt_in(evaluation_topology, compliance_cache_table, tables):
+    stack, template = synth(evaluation_topology=evaluation_topology, compliance_cache_table=compliance_cache_table)
+
+    template.resource_count_is("AWS::DynamoDB::Table", tables)
+
+
+def test_fan_out_evaluates_every_endpoint_concurrently():
+    endpoints = [
+        {"Name": "OPA", "Url": CONTROL_BROKER_APIGW_URL},
+        {"Name": "Checkov", "Url": "https://CHECKOV_API_ID.execute-api.us-east-1.amazonaws.com/ConfigEvent", "OutputHandler": "Checkov"},
+    ]
+    stack, template = synth(control_broker_endpoints=endpoints, fan_out_max_concurrency=4)
+
+    assert_valid_definition(stack.config_event_processing_definition)
+
+    template.has_resource_properties("AWS::Lambda::Function", {
+        "Environment": {
+            "Variables": assertions.Match.object_like({
+                "ControlBrokerEndpoints": json.dumps({e["Name"]: e["Url"] for e in endpoints}),
+            })
+        }
+    })
+
+    states = stack.config_event_processing_definition["States"]
+    assert states["ParseInput"]["Parameters"]["ControlBrokerEndpoints"] == [
+        {"Name": "OPA", "OutputHandler": "OPA"},
+        {"Name": "Checkov", "OutputHandler": "Checkov"},
+    ]
+    assert states["EvaluateEndpoints"]["MaxConcurrency"] == 4
+    assert states["PutEvaluations"]["Parameters"]["Payload"]["Compliance.$"] == "$.IsCompliant"
+
+
+@pytest.mark.parametrize("kwargs", [
+    {"control_broker_endpoints": [{"Name": "OPA", "Url": CONTROL_BROKER_APIGW_URL}] * 2},
+    {"control_broker_endpoints": [{"Name": "OPA", "Url": CONTROL_BROKER_APIGW_URL}], "evaluation_topology": "Lambdalith"},
+    {"verdict_combiner": "Majority"},
+])
+def test_invalid_fan_out_is_rejected(kwargs):
+    with pytest.raises(ValueError):
+        synth(**kwargs)
+
+
+def test_config_rule_parameters_are_passed_as_strings():
+    stack, template = synth(config_rules=[{
+        "Name": "SQS-PoC",
+        "ResourceTypes": ["AWS::SQS::Queue"],
+        "Parameters": {
+            "ResourceTypes": "AWS::SQS::Queue",
+            "TagSelector": {"Environment": ["prod"]},
+        },
+    }])
+
+    template.has_resource_properties("AWS::Config::ConfigRule", {
+        "InputParameters": {
+            "ResourceTypes": "AWS::SQS::Queue",
+            "TagSelector": '{"Environment": ["prod"]}',
+        }
+    })
+
+
+def resource_counts(template):
+    return collections.Counter(resource["Type"] for resource in template.to_json()["Resources"].values())
+
+
+def test_config_rules_share_one_evaluation_pipeline():
+    def rules(n):
+        return [
+            {"Name": f"Rule{i}", "ResourceTypes": ["AWS::SQS::Queue", "AWS::SNS::Topic"], "Parameters": {"TagSelector": {"Rule": str(i)}}}
+            for i in range(n)
+        ]
+
+    _, one = synth(config_rules=rules(1))
+    _, fifty = synth(config_rules=rules(50))
+
+    one, fifty = resource_counts(one), resource_counts(fifty)
+    assert (one.pop("AWS::Config::ConfigRule"), fifty.pop("AWS::Config::ConfigRule")) == (1, 50)
+    assert one == fifty
+
+
+def test_config_rules_from_file():
+    config_rules = load_config_rules(paths.REPO_ROOT / "config_rules.json")
+
+    assert [rule["Name"] for rule in config_rules] == ["SQS-PoC"]
+
+
+@pytest.mark.parametrize("config_rules", [
+    [{"Name": "Rule", "ResourceTypes": ["AWS::SQS::Queue"]}] * 2,
+    [{"Name": "Rule", "ResourceTypes": []}],
+])
+def test_invalid_config_rules_are_rejected(config_rules):
+    with pytest.raises(ValueError):
+        synth(config_rules=config_rules)
+
+
+def test_claim_check_is_stored_by_invoked_by_config():
+    stack, template = synth(claim_check=True)
+
+    template.has_resource_properties("AWS::Lambda::Function", {
+        "Environment": {
+            "Variables": assertions.Match.object_like({
+                "ConfigEventClaimCheck": "true",
+                "ConfigEventsRawInputBucket": assertions.Match.any_value(),
+            })
+        }
+    })
+    template.has_resource_properties("AWS::S3::Bucket", {
+        "LifecycleConfiguration": {
+            "Rules": [assertions.Match.object_like({"Prefix": "config-events/", "ExpirationInDays": 7})]
+        }
+    })
+
+
+def test_evaluation_dedup_table_and_content_hash():
+    stack, template = synth(evaluation_dedup=True, policy_version="0.10.0")
+
+    template.has_resource_properties("AWS::DynamoDB::Table", {
+        "KeySchema": [{"AttributeName": "ContentHash", "KeyType": "HASH"}],
+    })
+    payload = stack.config_event_processing_definition["States"]["PutEvaluations"]["Parameters"]["Payload"]
+    assert payload["EvaluationContentHash.$"] == "$.ConfigEvent.EvaluationContentHash"
+
+
+@pytest.mark.parametrize("evaluation_topology", ["StepFunctions", "Lambdalith"])
+def test_verdict_store_is_written_by_every_evaluation_and_streams_transitions(evaluation_topology):
+    stack, template = synth(verdict_store=True, policy_version="0.10.0", evaluation_topology=evaluation_topology)
+
+    template.has_resource_properties("AWS::DynamoDB::Table", {
+        "KeySchema": [
+            {"AttributeName": "ConfigRuleName", "KeyType": "HASH"},
+            {"AttributeName": "ResourceKey", "KeyType": "RANGE"},
+        ],
+        "StreamSpecification": {"StreamViewType": "NEW_AND_OLD_IMAGES"},
+    })
+    template.has_resource_properties("AWS::Lambda::EventSourceMapping", {
+        "FilterCriteria": {"Filters": [{"Pattern": json.dumps({"dynamodb": {"NewImage": {"Transition": {"BOOL": [True]}}}}, separators=(",", ":"))}]},
+        "FunctionResponseTypes": ["ReportBatchItemFailures"],
+    })
+    writers = template.find_resources("AWS::Lambda::Function", {
+        "Properties": {
+            "Environment": {
+                "Variables": assertions.Match.object_like({
+                    "VerdictStoreTableName": assertions.Match.any_value(),
+                    "ControlBrokerPolicyVersion": "0.10.0",
+                })
+            }
+        }
+    })
+    # invoked_by_config, and put_evaluations or the evaluation pipeline
+    assert len(writers) == 2
+
+    if evaluation_topology == "StepFunctions":
+        payload = stack.config_event_processing_definition["States"]["PutEvaluations"]["Parameters"]["Payload"]
+        assert payload["NotificationCreationTime.$"] == "$.InvokingEvent.notificationCreationTime"
+
+
+def test_verdict_store_is_opt_in():
+    stack, template = synth()
+
+    template.resource_count_is("AWS::DynamoDB::Table", 0)
+    payload = stack.config_event_processing_definition["States"]["PutEvaluations"]["Parameters"]["Payload"]
+    assert "NotificationCreationTime.$" not in payload
+
+
+def test_evaluations_are_ordered_by_configuration_item_capture_time():
+    stack, _ = synth()
+
+    put_evaluations = stack.config_event_processing_definition["States"]["PutEvaluations"]
+    assert put_evaluations["Parameters"]["Payload"]["OrderingTimestamp.$"] == "$.InvokingEvent.configurationItem.configurationItemCaptureTime"
+    assert put_evaluations["Next"] == "GetResourceConfigComplianceFinal"
+
+
+@pytest.mark.parametrize("batch_evaluation", [False, True])
+def test_evaluation_order_guard_skips_verifying_superseded_evaluations(batch_evaluation):
+    stack, template = synth(evaluation_order_guard=True, batch_evaluation=batch_evaluation)
+
+    template.has_resource_properties("AWS::DynamoDB::Table", {
+        "KeySchema": [
+            {"AttributeName": "ConfigRuleName", "KeyType": "HASH"},
+            {"AttributeName": "ResourceKey", "KeyType": "RANGE"},
+        ],
+    })
+    guarded = template.find_resources("AWS::Lambda::Function", {
+        "Properties": {
+            "Environment": {
+                "Variables": assertions.Match.object_like({"EvaluationOrderTableName": assertions.Match.any_value()})
+            }
+        }
+    })
+    # invoked_by_config and put_evaluations
+    assert len(guarded) == 2
+
+    definition = stack.config_event_processing_definition
+    assert_valid_definition(definition)
+    states = definition["States"]["ProcessConfigEvents"]["Iterator"]["States"] if batch_evaluation else definition["States"]
+    assert states["PutEvaluations"]["Next"] == "ChoiceEvaluationSuperseded"
+    assert states["ChoiceEvaluationSuperseded"]["Choices"][0]["Next"] == "ComplianceStatusIsAsExpectedTrue"
+
+
+def test_logging_settings_reach_every_lambda_and_the_state_machine():
+    stack, template = synth(log_level="WARNING", log_sample_rate=0.01, state_machine_log_level="ALL")
+
+    functions = template.find_resources("AWS::Lambda::Function", {
+        "Properties": {"Handler": "lambda_function.lambda_handler"},
+    })
+    assert functions
+    for function in functions.values():
+        variables = function["Properties"]["Environment"]["Variables"]
+        assert variables["LogLevel"] == "WARNING"
+        assert variables["LogSampleRate"] == "0.01"
+        assert variables["LogPayloadMaxBytes"] == "2048"
+    template.has_resource_properties("AWS::StepFunctions::StateMachine", {
+        "LoggingConfiguration": assertions.Match.object_like({"Level": "ALL", "IncludeExecutionData": False}),
+    })
+
+
+def test_unknown_log_level_is_rejected():
+    with pytest.raises(ValueError):
+        synth(log_level="VERBOSE")
+
+
+def test_dashboard_and_p99_alarms_follow_the_metric_definitions():
+    stack, template = synth()
+
+    with open(paths.METRIC_DEFINITIONS) as f:
+        definitions = json.load(f)
+    alarmed = {name: d for name, d in definitions["Metrics"].items() if "AlarmP99" in d}
+
+    template.resource_count_is("AWS::CloudWatch::Dashboard", 1)
+    template.resource_count_is("AWS::CloudWatch::Alarm", len(alarmed))
+    for name, definition in alarmed.items():
+        template.has_resource_properties("AWS::CloudWatch::Alarm", {
+            "Namespace": definitions["Namespace"],
+            "MetricName": name,
+            "ExtendedStatistic": "p99",
+            "Threshold": definition["AlarmP99"],
+        })
+
+
+def test_dev_performance_profile_keeps_the_defaults():
+    _, template = synth(performance_profile="dev")
+
+    functions = template.find_resources("AWS::Lambda::Function", {
+        "Properties": {"Handler": "lambda_function.lambda_handler"},
+    })
+    assert functions
+    for function in functions.values():
+        assert function["Properties"]["MemorySize"] == 1024
+        assert "ReservedConcurrentExecutions" not in function["Properties"]
+    template.resource_count_is("AWS::Lambda::Alias", 0)
+    template.resource_count_is("AWS::ApplicationAutoScaling::ScalableTarget", 0)
+
+
+def test_provisioned_concurrency_is_invoked_through_the_live_alias():
+    stack, template = synth(performance_profile="prod-burst")
+
+    template.has_resource_properties("AWS::Lambda::Function", {
+        "Handler": "lambda_function.lambda_handler",
+        "MemorySize": 1769,
+        "ReservedConcurrentExecutions": 200,
+    })
+    template.resource_count_is("AWS::Lambda::Alias", 2)
+    template.has_resource_properties("AWS::Lambda::Alias", {
+        "Name": "live",
+        "ProvisionedConcurrencyConfig": {"ProvisionedConcurrentExecutions": 1},
+    })
+    template.has_resource_properties("AWS::ApplicationAutoScaling::ScalableTarget", {
+        "MinCapacity": 1,
+        "MaxCapacity": 100,
+        "ScalableDimension": "lambda:function:ProvisionedConcurrency",
+        "ScheduledActions": assertions.Match.array_with([
+            assertions.Match.object_like({
+                "ScheduledActionName": "BurstStart",
+                "Schedule": "cron(45 1 * * ? *)",
+                "ScalableTargetAction": {"MinCapacity": 50, "MaxCapacity": 100},
+            }),
+        ]),
+    })
+
+    sign_apigw_request = stack.invoke_target(stack.lambda_sign_apigw_request)
+    assert sign_apigw_request is not stack.lambda_sign_apigw_request
+    states = stack.config_event_processing_definition["States"]
+    assert states["SignApigwRequest"]["Parameters"]["FunctionName"] == sign_apigw_request.function_name
+    assert states["GetIsCompliant"]["Parameters"]["FunctionName"] == stack.lambda_requests_get.function_name
+
+
+@pytest.mark.parametrize("performance_profile", ["prod-steady", "prod-burst"])
+@pytest.mark.parametrize("evaluation_topology", ["StepFunctions", "Lambdalith"])
+def test_performance_profiles_synthesize(performance_profile, evaluation_topology):
+    stack, _ = synth(performance_profile=performance_profile, evaluation_topology=evaluation_topology)
+
+    if evaluation_topology == "StepFunctions":
+        assert_valid_definition(stack.config_event_processing_definition)
+
+
+@pytest.mark.parametrize("profiles", [
+    {"dev": {}},
+    {"prod-burst": {"Unknown": {"MemorySize": 512}}},
+    {"prod-burst": {"InvokedByConfig": {"ProvisionedConcurrency": {"Min": 0, "Max": 10}}}},
+    {"prod-burst": {"InvokedByConfig": {"ReservedConcurrency": 5, "ProvisionedConcurrency": {"Min": 1, "Max": 10}}}},
+    {"prod-burst": {"InvokedByConfig": {"ProvisionedConcurrency": {
+        "Min": 1, "Max": 10, "Schedules": [{"Name": "Burst", "Schedule": "rate(1 hour)", "Min": 20, "Max": 10}],
+    }}}},
+])
+def test_invalid_performance_profiles_are_rejected(profiles, tmp_path, monkeypatch):
+    performance_profiles = tmp_path / "performance_profiles.json"
+    performance_profiles.write_text(json.dumps(profiles))
+    monkeypatch.setattr(paths, "PERFORMANCE_PROFILES", performance_profiles)
 
-#     template.has_resource_properties("AWS::SQS::Queue", {
-#         "VisibilityTimeout": 300
-#     })
+    with pytest.raises(ValueError):
+        synth(performance_profile="prod-burst")
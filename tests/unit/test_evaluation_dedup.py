@@ -0,0 +1,98 @@
+import json
+
+import boto3
+import pytest
+from botocore.stub import ANY, Stubber
+
+from tests.lambdas import load_lambda
+from cb_runtime import evaluation_dedup, metrics
+
+SFN_ARN = "arn:aws:states:us-east-1:123456789012:stateMachine:ConfigEventProcessing"
+
+
+@pytest.fixture
+def ddb():
+    return boto3.resource("dynamodb")
+
+
+@pytest.fixture
+def invoked_by_config(monkeypatch, ddb):
+    monkeypatch.setenv("ConfigEventProcessingSfnArn", SFN_ARN)
+    invoked_by_config = load_lambda("invoked_by_config")
+    invoked_by_config.dedup = evaluation_dedup.EvaluationDedup(table_name="EvaluationDedup", ttl_seconds=60, policy_version="0.10.0", ddb=ddb)
+    return invoked_by_config
+
+
+def configuration_item(config_event):
+    return json.loads(config_event["invokingEvent"])["configurationItem"]
+
+
+def test_content_hash_ignores_key_order_and_embedded_json_layout(config_event):
+    item = configuration_item(config_event)
+    item["configuration"]["Policy"] = json.dumps({"Version": "2012-10-17", "Statement": []})
+    reordered = {**item, "configuration": dict(reversed(list(item["configuration"].items())))}
+    reordered["configuration"]["Policy"] = json.dumps({"Statement": [], "Version": "2012-10-17"}, indent=2)
+
+    def content_hash(configuration_item, policy_version="0.10.0"):
+        return evaluation_dedup.content_hash(configuration_item=configuration_item, config_rule_name="rule", policy_version=policy_version)
+
+    assert content_hash(item) == content_hash(reordered)
+    assert content_hash(item) != content_hash(item, policy_version="0.11.0")
+    assert content_hash(item) != content_hash({**item, "configuration": {**item["configuration"], "ContentBasedDeduplication": False}})
+
+
+def test_hit_replays_verdict_without_starting_an_evaluation(invoked_by_config, config_event, ddb):
+    with Stubber(ddb.meta.client) as table, Stubber(invoked_by_config.config) as config, Stubber(invoked_by_config.sfn), metrics.capture() as emitted:
+        table.add_response("get_item", {"Item": {"ContentHash": {"S": "h"}, "IsCompliant": {"BOOL": True}, "ExpiresAt": {"N": "99999999999"}}})
+        config.add_response(
+            "put_evaluations",
+            {"FailedEvaluations": []},
+            {"Evaluations": [{
+                "ComplianceResourceType": "AWS::SQS::Queue",
+                "ComplianceResourceId": configuration_item(config_event)["resourceId"],
+                "ComplianceType": "COMPLIANT",
+                "OrderingTimestamp": ANY,
+            }], "ResultToken": config_event["resultToken"]},
+        )
+
+        assert invoked_by_config.lambda_handler(config_event, None) is True
+
+        config.assert_no_pending_responses()
+
+    [hit] = [doc for doc in emitted if "EvaluationDedupHit" in doc]
+    assert hit["EvaluationDedupHit"] == 1
+    assert hit["_aws"]["CloudWatchMetrics"][0]["Namespace"] == metrics.NAMESPACE
+
+
+def test_miss_passes_the_content_hash_to_put_evaluations(invoked_by_config, config_event, ddb):
+    inputs = []
+    invoked_by_config.sfn.meta.events.register(
+        "provide-client-params.states.StartExecution",
+        lambda params, **kwargs: inputs.append(json.loads(params["input"])),
+    )
+    with Stubber(ddb.meta.client) as table, Stubber(invoked_by_config.sfn) as sfn:
+        table.add_response("get_item", {})
+        sfn.add_response("start_execution", {"executionArn": f"{SFN_ARN}:1", "startDate": 0})
+
+        assert invoked_by_config.lambda_handler(config_event, None) is True
+
+    assert inputs[0]["EvaluationContentHash"] == invoked_by_config.dedup.content_hash(
+        configuration_item=configuration_item(config_event),
+        config_rule_name=config_event["configRuleName"],
+    )
+
+
+def test_put_evaluations_records_the_verdict(ddb):
+    put_evaluations = load_lambda("put_evaluations")
+    put_evaluations.dedup = evaluation_dedup.EvaluationDedup(table_name="EvaluationDedup", ttl_seconds=60, ddb=ddb)
+
+    with Stubber(ddb.meta.client) as table, Stubber(put_evaluations.config) as config:
+        config.add_response("put_evaluations", {"FailedEvaluations": []})
+        table.add_response("put_item", {}, {"TableName": "EvaluationDedup", "Item": {"ContentHash": "h", "IsCompliant": False, "ExpiresAt": ANY}})
+
+        put_evaluations.lambda_handler(
+            {"ResourceType": "AWS::SQS::Queue", "ResourceId": "queue", "ConfigResultToken": "token", "Compliance": False, "EvaluationContentHash": "h"},
+            None,
+        )
+
+        table.assert_no_pending_responses()
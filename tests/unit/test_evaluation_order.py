@@ -0,0 +1,181 @@
+import json
+from datetime import datetime, timezone
+
+import boto3
+import pytest
+from botocore.stub import ANY, Stubber
+
+from tests.lambdas import load_lambda
+from cb_runtime import config_events, evaluation_order, metrics
+
+CAPTURE_TIME = datetime(2022, 6, 1, 17, 22, 41, 134000, tzinfo=timezone.utc)
+
+SFN_ARN = "arn:aws:states:us-east-1:123456789012:stateMachine:ConfigEventProcessing"
+
+
+@pytest.fixture
+def ddb():
+    return boto3.resource("dynamodb")
+
+
+@pytest.fixture
+def order(ddb):
+    return evaluation_order.EvaluationOrder(table_name="EvaluationOrder", ddb=ddb)
+
+
+def invoking_event(config_event):
+    return json.loads(config_event["invokingEvent"])
+
+
+def test_ordering_timestamp_is_the_capture_time_of_the_configuration_item(config_event):
+    event = invoking_event(config_event)
+
+    assert config_events.parse_time(config_events.ordering_timestamp(event)) == CAPTURE_TIME
+    summary = {**event, "configurationItemSummary": event.pop("configurationItem")}
+    assert config_events.ordering_timestamp(summary) == "2022-06-01T17:22:41.134Z"
+    periodic = {"notificationCreationTime": event["notificationCreationTime"], "messageType": "ScheduledNotification"}
+    assert config_events.ordering_timestamp(periodic) == "2022-06-01T17:22:43.213Z"
+
+
+def test_evaluation_is_ordered_by_capture_time_not_a_constant():
+    put_evaluations = load_lambda("put_evaluations")
+
+    def evaluation(**kwargs):
+        return put_evaluations.ConfigCompliance(
+            ResourceType="AWS::SQS::Queue", ResourceId="queue", ResultToken="token", Compliant=True, **kwargs
+        ).evaluation()
+
+    assert evaluation(OrderingTimestamp="2022-06-01T17:22:41.134Z")["OrderingTimestamp"] == CAPTURE_TIME
+    assert evaluation(NotificationCreationTime="2022-06-01T17:22:41.134Z")["OrderingTimestamp"] == CAPTURE_TIME
+    assert evaluation()["OrderingTimestamp"] > CAPTURE_TIME
+
+
+def claim(order, ordering_timestamp=CAPTURE_TIME):
+    return order.claim(
+        config_rule_name="rule",
+        resource_type="AWS::SQS::Queue",
+        resource_id="queue",
+        ordering_timestamp=ordering_timestamp,
+    )
+
+
+def test_claim_only_moves_the_timestamp_forward(order, ddb):
+    with Stubber(ddb.meta.client) as table:
+        table.add_response("update_item", {}, {
+            "TableName": "EvaluationOrder",
+            "Key": {"ConfigRuleName": "rule", "ResourceKey": "AWS::SQS::Queue/queue"},
+            "UpdateExpression": "SET OrderingTimestamp = :OrderingTimestamp",
+            "ConditionExpression": "attribute_not_exists(OrderingTimestamp) OR OrderingTimestamp <= :OrderingTimestamp",
+            "ExpressionAttributeValues": {":OrderingTimestamp": 1654104161134},
+            "ReturnValues": "UPDATED_OLD",
+        })
+
+        assert claim(order, "2022-06-01T17:22:41.134Z")
+
+
+def test_stale_evaluation_is_dropped(order, ddb):
+    with Stubber(ddb.meta.client) as table, metrics.capture() as emitted:
+        table.add_client_error("update_item", "ConditionalCheckFailedException")
+
+        assert claim(order) is False
+
+    assert emitted[0]["StaleEvaluationDropped"] == 1
+
+
+def test_errors_put_the_evaluation_unguarded(order, ddb):
+    with Stubber(ddb.meta.client) as table:
+        table.add_client_error("update_item", "ProvisionedThroughputExceededException")
+
+        assert claim(order)
+
+
+def test_failed_put_puts_the_previous_timestamp_back(order, ddb):
+    put_evaluations = load_lambda("put_evaluations")
+    put_evaluations.order = order
+    compliance = put_evaluations.ConfigCompliance(
+        ResourceType="AWS::SQS::Queue",
+        ResourceId="queue",
+        ResultToken="token",
+        Compliant=True,
+        ConfigRuleName="rule",
+        OrderingTimestamp="2022-06-01T17:22:41.134Z",
+    )
+
+    with Stubber(ddb.meta.client) as table, Stubber(put_evaluations.config) as config:
+        table.add_response("update_item", {"Attributes": {"OrderingTimestamp": {"N": "1654104100000"}}})
+        config.add_client_error("put_evaluations", "InternalFailure")
+        table.add_response("update_item", {}, {
+            "TableName": "EvaluationOrder",
+            "Key": {"ConfigRuleName": "rule", "ResourceKey": "AWS::SQS::Queue/queue"},
+            "UpdateExpression": "SET OrderingTimestamp = :PreviousOrderingTimestamp",
+            "ConditionExpression": "OrderingTimestamp = :OrderingTimestamp",
+            "ExpressionAttributeValues": {":OrderingTimestamp": 1654104161134, ":PreviousOrderingTimestamp": 1654104100000},
+        })
+
+        assert len(put_evaluations.put_evaluations_batch([compliance])) == 1
+
+        table.assert_no_pending_responses()
+
+
+def test_release_leaves_a_newer_claim_alone(order, ddb):
+    with Stubber(ddb.meta.client) as table:
+        table.add_response("update_item", {})
+        table.add_client_error("update_item", "ConditionalCheckFailedException", expected_params={
+            "TableName": "EvaluationOrder",
+            "Key": {"ConfigRuleName": "rule", "ResourceKey": "AWS::SQS::Queue/queue"},
+            "UpdateExpression": "REMOVE OrderingTimestamp",
+            "ConditionExpression": "OrderingTimestamp = :OrderingTimestamp",
+            "ExpressionAttributeValues": {":OrderingTimestamp": 1654104161134},
+        })
+
+        # the first evaluation of the resource, so its timestamp is removed rather than set back
+        order.release(claim(order))
+
+        table.assert_no_pending_responses()
+
+
+def test_superseded_evaluation_is_not_put_or_verified(order, ddb):
+    put_evaluations = load_lambda("put_evaluations")
+    put_evaluations.order = order
+    event = {
+        "ResourceType": "AWS::SQS::Queue",
+        "ResourceId": "queue",
+        "ConfigResultToken": "token",
+        "Compliance": True,
+        "ConfigRuleName": "rule",
+        "OrderingTimestamp": "2022-06-01T17:22:41.134Z",
+    }
+
+    # the Config stub answers no calls, so a PutEvaluations fails the test
+    with Stubber(ddb.meta.client) as table, Stubber(put_evaluations.config):
+        table.add_client_error("update_item", "ConditionalCheckFailedException")
+
+        assert put_evaluations.lambda_handler(event, None) == {"EvaluationCompletionStatus": True, "Superseded": True}
+
+
+def test_invoked_by_config_orders_its_own_evaluations(monkeypatch, config_event, order, ddb):
+    monkeypatch.setenv("ConfigEventProcessingSfnArn", SFN_ARN)
+    invoked_by_config = load_lambda("invoked_by_config")
+    invoked_by_config.order = order
+    event = {**config_event, "ruleParameters": json.dumps({"ResourceTypes": "AWS::SNS::Topic"})}
+
+    with Stubber(ddb.meta.client) as table, Stubber(invoked_by_config.config) as config:
+        table.add_response("update_item", {})
+        config.add_response(
+            "put_evaluations",
+            {"FailedEvaluations": []},
+            {
+                "Evaluations": [{
+                    "ComplianceResourceType": "AWS::SQS::Queue",
+                    "ComplianceResourceId": invoking_event(config_event)["configurationItem"]["resourceId"],
+                    "ComplianceType": "NOT_APPLICABLE",
+                    "Annotation": ANY,
+                    "OrderingTimestamp": CAPTURE_TIME,
+                }],
+                "ResultToken": config_event["resultToken"],
+            },
+        )
+
+        assert invoked_by_config.lambda_handler(event, None) is True
+
+        config.assert_no_pending_responses()
@@ -0,0 +1,136 @@
+import json
+import re
+
+import pytest
+from botocore.stub import Stubber
+
+from tests.lambdas import load_lambda
+
+PRESIGNED_URL = "https://results.s3.amazonaws.com/report.json?X-Amz-Signature=abc"
+
+
+@pytest.fixture
+def evaluation_pipeline(monkeypatch):
+    monkeypatch.setenv("ControlBrokerInvokeUrl", "https://MY_API_ID.execute-api.us-east-1.amazonaws.com/ConfigEvent")
+    evaluation_pipeline = load_lambda("evaluation_pipeline")
+    monkeypatch.setattr(evaluation_pipeline.time, "sleep", lambda seconds: None)
+    monkeypatch.setattr(
+        evaluation_pipeline.sign_apigw_request,
+        "post_config_event",
+        lambda **kwargs: {"Response": {"ControlBrokerEvaluation": {"OutputHandlers": {"OPA": {"PresignedUrl": PRESIGNED_URL}}}}},
+    )
+    return evaluation_pipeline
+
+
+def compliance_details(config_rule_name, compliance_type):
+    return {
+        "EvaluationResults": [{
+            "EvaluationResultIdentifier": {
+                "EvaluationResultQualifier": {"ConfigRuleName": config_rule_name}
+            },
+            "ComplianceType": compliance_type,
+        }]
+    }
+
+
+def test_process_config_event_in_one_process(evaluation_pipeline, config_event, monkeypatch):
+    reports = iter([False, False, {"EvalEngineLambdalith": {"Evaluation": {"IsCompliant": True}}}])
+    urls = []
+
+    def requests_get(url, http, projection):
+        assert http is evaluation_pipeline.http
+        urls.append(url)
+        return next(reports)
+
+    monkeypatch.setattr(evaluation_pipeline.requests_get, "requests_get", requests_get)
+
+    # Config reads and writes go through the one shared client
+    assert evaluation_pipeline.get_resource_config_compliance.config is evaluation_pipeline.config
+    assert evaluation_pipeline.put_evaluations.config is evaluation_pipeline.config
+
+    config_rule_name = config_event["configRuleName"]
+    with Stubber(evaluation_pipeline.config) as config:
+        config.add_response("get_compliance_details_by_resource", compliance_details(config_rule_name, "NON_COMPLIANT"))
+        config.add_response("put_evaluations", {"FailedEvaluations": []})
+        config.add_response("get_compliance_details_by_resource", compliance_details(config_rule_name, "COMPLIANT"))
+
+        processed = evaluation_pipeline.lambda_handler(config_event, None)
+
+    assert urls == [PRESIGNED_URL] * 3
+    assert processed["InitialCompliance"] is False
+    assert processed["IsCompliant"] is True
+    assert processed["FinalCompliance"] is True
+
+
+def test_results_report_retries_are_bounded(evaluation_pipeline, monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(evaluation_pipeline.time, "sleep", sleeps.append)
+    monkeypatch.setattr(evaluation_pipeline.requests_get, "requests_get", lambda url, http, projection: False)
+
+    with pytest.raises(evaluation_pipeline.ResultsReportDoesNotYetExist):
+        evaluation_pipeline.get_is_compliant(url=PRESIGNED_URL)
+
+    assert sleeps == [1, 2, 4, 8, 16, 32, 64, 128]
+
+
+def test_report_without_is_compliant_fails_without_polling(evaluation_pipeline, monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(evaluation_pipeline.time, "sleep", sleeps.append)
+
+    def requests_get(url, http, projection):
+        raise evaluation_pipeline.requests_get.ProjectionNotFound(projection[0])
+
+    monkeypatch.setattr(evaluation_pipeline.requests_get, "requests_get", requests_get)
+
+    with pytest.raises(evaluation_pipeline.requests_get.ProjectionNotFound):
+        evaluation_pipeline.get_is_compliant(url=PRESIGNED_URL)
+
+    assert sleeps == []
+
+
+def test_batch_fails_after_evaluating_every_config_event(evaluation_pipeline, config_event, monkeypatch):
+    evaluated, verified = [], []
+
+    def evaluate_config_event(config_event, cb_endpoint_response):
+        assert cb_endpoint_response == {"Posted": len(evaluated)}
+        evaluated.append(config_event)
+        if len(evaluated) == 1:
+            raise evaluation_pipeline.ControlBrokerRequestFailedException()
+        return {
+            "ResourceType": "AWS::SQS::Queue",
+            "ResourceId": f"queue-{len(evaluated)}",
+            "Compliance": evaluation_pipeline.put_evaluations.ConfigCompliance(
+                ResourceType="AWS::SQS::Queue",
+                ResourceId=f"queue-{len(evaluated)}",
+                ResultToken=config_event["resultToken"],
+                Compliant=True,
+            ),
+        }
+
+    monkeypatch.setattr(evaluation_pipeline, "evaluate_config_event", evaluate_config_event)
+    # the whole batch is posted to Control Broker up front
+    monkeypatch.setattr(evaluation_pipeline, "control_broker_async", object())
+    monkeypatch.setattr(
+        evaluation_pipeline,
+        "post_config_events_concurrently",
+        lambda batch: [{"Posted": i} for i in range(len(batch))],
+    )
+    monkeypatch.setattr(
+        evaluation_pipeline,
+        "verify_config_event",
+        lambda evaluated, evaluation_completion_status: verified.append(evaluated["ResourceId"]),
+    )
+
+    # the evaluations share the event's result token, so they go out in one call
+    with Stubber(evaluation_pipeline.config) as config:
+        config.add_response("put_evaluations", {"FailedEvaluations": []})
+
+        # failures are named by resource id, whichever stage they failed in
+        resource_id = json.loads(config_event["invokingEvent"])["configurationItem"]["resourceId"]
+        with pytest.raises(evaluation_pipeline.ConfigEventsFailedException, match=f"1 of 3 config events failed: {re.escape(resource_id)}$"):
+            evaluation_pipeline.lambda_handler({"ConfigEvents": [config_event] * 3}, None)
+
+        config.assert_no_pending_responses()
+
+    assert len(evaluated) == 3
+    assert verified == ["queue-2", "queue-3"]
@@ -0,0 +1,68 @@
+import pytest
+from botocore.stub import Stubber
+
+from tests.lambdas import load_lambda
+
+
+@pytest.fixture
+def get_resource_config_compliance():
+    return load_lambda("get_resource_config_compliance")
+
+
+def evaluation_result(config_rule_name, resource_id, compliance_type):
+    return {
+        "EvaluationResultIdentifier": {
+            "EvaluationResultQualifier": {"ConfigRuleName": config_rule_name, "ResourceId": resource_id}
+        },
+        "ComplianceType": compliance_type,
+    }
+
+
+def test_by_resource_follows_next_token_and_stops_at_the_rule(get_resource_config_compliance):
+    with Stubber(get_resource_config_compliance.config) as config:
+        config.add_response(
+            "get_compliance_details_by_resource",
+            {"EvaluationResults": [evaluation_result(f"other-{i}", "queue", "COMPLIANT") for i in range(3)], "NextToken": "page-2"},
+        )
+        config.add_response(
+            "get_compliance_details_by_resource",
+            {"EvaluationResults": [evaluation_result("rule", "queue", "NON_COMPLIANT")], "NextToken": "page-3"},
+            {"ResourceType": "AWS::SQS::Queue", "ResourceId": "queue", "ComplianceTypes": ["COMPLIANT", "NON_COMPLIANT"], "NextToken": "page-2"},
+        )
+
+        compliance = get_resource_config_compliance.fetch_resource_config_compliance_by_resource(
+            resource_type="AWS::SQS::Queue", resource_id="queue", config_rule_name="rule",
+        )
+
+        config.assert_no_pending_responses()
+
+    assert compliance is False
+
+
+def test_by_resource_without_the_rule_is_none(get_resource_config_compliance):
+    with Stubber(get_resource_config_compliance.config) as config:
+        config.add_response("get_compliance_details_by_resource", {"EvaluationResults": [], "NextToken": "page-2"})
+        config.add_response("get_compliance_details_by_resource", {"EvaluationResults": []})
+
+        assert get_resource_config_compliance.fetch_resource_config_compliance_by_resource(
+            resource_type="AWS::SQS::Queue", resource_id="queue", config_rule_name="rule",
+        ) is None
+
+
+def test_by_rule_indexes_every_page_by_resource_id(get_resource_config_compliance):
+    with Stubber(get_resource_config_compliance.config) as config:
+        config.add_response(
+            "get_compliance_details_by_config_rule",
+            {"EvaluationResults": [evaluation_result("rule", f"queue-{i}", "COMPLIANT") for i in range(100)], "NextToken": "page-2"},
+        )
+        config.add_response(
+            "get_compliance_details_by_config_rule",
+            {"EvaluationResults": [evaluation_result("rule", "queue-100", "NON_COMPLIANT")]},
+            {"ConfigRuleName": "rule", "ComplianceTypes": ["COMPLIANT", "NON_COMPLIANT"], "Limit": 100, "NextToken": "page-2"},
+        )
+
+        index = get_resource_config_compliance.lambda_handler({"ConfigRuleName": "rule"}, None)
+
+    assert len(index) == 101
+    assert index["queue-0"] is True
+    assert index["queue-100"] is False
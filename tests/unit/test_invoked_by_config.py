@@ -0,0 +1,125 @@
+import json
+
+import pytest
+from botocore.stub import Stubber
+
+from tests.lambdas import load_lambda
+
+SFN_ARN = "arn:aws:states:us-east-1:123456789012:stateMachine:ConfigEventProcessing"
+QUEUE_URL = "https://sqs.us-east-1.amazonaws.com/123456789012/ConfigEventBuffer"
+
+
+@pytest.fixture
+def invoked_by_config(monkeypatch):
+    monkeypatch.setenv("ConfigEventProcessingSfnArn", SFN_ARN)
+    return load_lambda("invoked_by_config")
+
+
+def test_starts_one_execution_per_config_event(invoked_by_config, config_event):
+    with Stubber(invoked_by_config.sfn) as sfn:
+        sfn.add_response(
+            "start_execution",
+            {"executionArn": f"{SFN_ARN}:1", "startDate": 0},
+            {"stateMachineArn": SFN_ARN, "input": json.dumps(config_event)},
+        )
+        assert invoked_by_config.lambda_handler(config_event, None) is True
+
+
+def test_buffers_config_event_in_batch_mode(invoked_by_config, config_event, monkeypatch):
+    monkeypatch.setenv("ConfigEventBufferQueueUrl", QUEUE_URL)
+    with Stubber(invoked_by_config.sqs) as sqs, Stubber(invoked_by_config.sfn):
+        sqs.add_response(
+            "send_message",
+            {"MessageId": "1"},
+            {"QueueUrl": QUEUE_URL, "MessageBody": json.dumps(config_event)},
+        )
+        assert invoked_by_config.lambda_handler(config_event, None) is True
+
+
+def test_scheduled_notification_is_skipped(invoked_by_config, config_event, monkeypatch):
+    monkeypatch.setenv("ConfigEventBufferQueueUrl", QUEUE_URL)
+    invoking_event = {"notificationCreationTime": "2022-06-01T17:22:43.213Z", "messageType": "ScheduledNotification"}
+    event = {**config_event, "invokingEvent": json.dumps(invoking_event)}
+
+    # neither buffered nor evaluated
+    with Stubber(invoked_by_config.sqs), Stubber(invoked_by_config.sfn):
+        assert invoked_by_config.lambda_handler(event, None) is True
+
+
+def test_drains_batch_into_one_execution(invoked_by_config, config_event):
+    records = [{"messageId": str(i), "body": json.dumps(config_event)} for i in range(3)]
+    with Stubber(invoked_by_config.sfn) as sfn:
+        sfn.add_response(
+            "start_execution",
+            {"executionArn": f"{SFN_ARN}:1", "startDate": 0},
+            {"stateMachineArn": SFN_ARN, "input": json.dumps({"ConfigEvents": [config_event] * 3})},
+        )
+        assert invoked_by_config.lambda_handler({"Records": records}, None) == {"batchItemFailures": []}
+
+
+def test_oversized_batch_is_chunked_under_execution_input_limit(invoked_by_config, config_event):
+    event_bytes = len(json.dumps(config_event))
+    chunks = list(invoked_by_config.chunk_config_events([config_event] * 5, max_input_bytes=event_bytes * 2 + 64))
+
+    assert [len(chunk) for chunk in chunks] == [2, 2, 1]
+    for chunk in chunks:
+        assert len(json.dumps({"ConfigEvents": chunk})) <= event_bytes * 2 + 64
+
+
+def test_express_waits_on_sync_execution(invoked_by_config, config_event, monkeypatch):
+    monkeypatch.setenv("ConfigEventProcessingSfnType", "EXPRESS")
+    with Stubber(invoked_by_config.sfn) as sfn:
+        sfn.add_response(
+            "start_sync_execution",
+            {"executionArn": f"{SFN_ARN}:1", "startDate": 0, "stopDate": 0, "status": "SUCCEEDED"},
+            {"stateMachineArn": SFN_ARN, "input": json.dumps(config_event)},
+        )
+        assert invoked_by_config.lambda_handler(config_event, None) is True
+
+
+@pytest.mark.parametrize("status", ["FAILED", "TIMED_OUT"])
+def test_failed_sync_execution_fails_the_invocation(invoked_by_config, config_event, monkeypatch, status):
+    monkeypatch.setenv("ConfigEventProcessingSfnType", "EXPRESS")
+    with Stubber(invoked_by_config.sfn) as sfn:
+        sfn.add_response(
+            "start_sync_execution",
+            {
+                "executionArn": f"{SFN_ARN}:1",
+                "startDate": 0,
+                "stopDate": 0,
+                "status": status,
+                "error": "ControlBrokerRequestFailed",
+                "cause": "status code 500",
+            },
+        )
+        with pytest.raises(invoked_by_config.SyncExecutionFailedException, match=f"{status}: ControlBrokerRequestFailed: status code 500"):
+            invoked_by_config.lambda_handler(config_event, None)
+
+
+@pytest.mark.parametrize("status, cause, failed", [
+    ("FAILED", "[true,false,true]", ["1"]),
+    ("TIMED_OUT", None, ["0", "1", "2"]),
+])
+def test_failed_sync_batch_redelivers_only_the_failed_messages(invoked_by_config, config_event, monkeypatch, status, cause, failed):
+    monkeypatch.setenv("ConfigEventProcessingSfnType", "EXPRESS")
+    records = [{"messageId": str(i), "body": json.dumps(config_event)} for i in range(3)]
+    response = {"executionArn": f"{SFN_ARN}:1", "startDate": 0, "stopDate": 0, "status": status, "error": "ConfigEventsFailed"}
+    if cause:
+        response["cause"] = cause
+    with Stubber(invoked_by_config.sfn) as sfn:
+        sfn.add_response("start_sync_execution", response)
+
+        assert invoked_by_config.lambda_handler({"Records": records}, None) == {
+            "batchItemFailures": [{"itemIdentifier": message_id} for message_id in failed],
+        }
+
+
+def test_lambdalith_invokes_evaluation_pipeline(invoked_by_config, config_event, monkeypatch):
+    monkeypatch.setenv("EvaluationPipelineFunctionName", "EvaluationPipeline")
+    with Stubber(invoked_by_config.awslambda) as awslambda, Stubber(invoked_by_config.sfn):
+        awslambda.add_response(
+            "invoke",
+            {"StatusCode": 202},
+            {"FunctionName": "EvaluationPipeline", "InvocationType": "Event", "Payload": json.dumps(config_event)},
+        )
+        assert invoked_by_config.lambda_handler(config_event, None) is True
@@ -0,0 +1,123 @@
+"""Layers built by utils.lambda_layers from the packages installed here, and each function's size and import time."""
+import importlib.util
+import pathlib
+import subprocess
+import sys
+
+import pytest
+
+from tests.unit.test_control_broker_consumer_example_config_stack import synth
+from utils import lambda_layers, paths
+
+FUNCTION_LAYERS = {
+    "invoked_by_config": ["cb_runtime"],
+    "put_evaluations": ["cb_runtime"],
+    "get_resource_config_compliance": ["cb_runtime"],
+    "results_report_written": ["cb_runtime"],
+    "sign_apigw_request": ["cb_runtime", "http"],
+    "requests_get": ["cb_runtime", "http"],
+    "wait_for_results_report": ["cb_runtime", "http"],
+    "evaluation_pipeline": ["cb_runtime", "http", "aiohttp"],
+    "verdict_changes": ["cb_runtime"],
+}
+
+# ceilings on the cold start of each handler: layer bytes as built from the packages installed here, modules its
+# import loads beyond boto3, and its import time with nothing but the precompiled layers
+BUDGETS = {
+    "invoked_by_config": {"LayerBytes": 256 * 1024, "ImportedModules": 15, "ImportSeconds": 0.1},
+    "put_evaluations": {"LayerBytes": 256 * 1024, "ImportedModules": 15, "ImportSeconds": 0.1},
+    "get_resource_config_compliance": {"LayerBytes": 256 * 1024, "ImportedModules": 15, "ImportSeconds": 0.1},
+    "results_report_written": {"LayerBytes": 256 * 1024, "ImportedModules": 15, "ImportSeconds": 0.1},
+    # requests is imported by the first Control Broker request or report fetch, not by the handler
+    "sign_apigw_request": {"LayerBytes": 6 * 1024 * 1024, "ImportedModules": 15, "ImportSeconds": 0.1},
+    "requests_get": {"LayerBytes": 6 * 1024 * 1024, "ImportedModules": 15, "ImportSeconds": 0.1},
+    "wait_for_results_report": {"LayerBytes": 6 * 1024 * 1024, "ImportedModules": 200, "ImportSeconds": 0.5},
+    "evaluation_pipeline": {"LayerBytes": 32 * 1024 * 1024, "ImportedModules": 400, "ImportSeconds": 2.0},
+    "verdict_changes": {"LayerBytes": 256 * 1024, "ImportedModules": 15, "ImportSeconds": 0.1},
+}
+
+
+@pytest.fixture(scope="module")
+def built(tmp_path_factory):
+    output = tmp_path_factory.mktemp("layers")
+    rows = lambda_layers.report(
+        FUNCTION_LAYERS,
+        lambda_functions=paths.LAMBDA_FUNCTIONS,
+        lambda_layers=paths.LAMBDA_LAYERS,
+        output=output,
+    )
+    return output, rows
+
+
+@pytest.mark.parametrize("function, layers", FUNCTION_LAYERS.items())
+def test_functions_get_only_the_layers_they_import(function, layers):
+    assert lambda_layers.function_layers(
+        function,
+        lambda_functions=paths.LAMBDA_FUNCTIONS,
+        lambda_layers=paths.LAMBDA_LAYERS,
+    ) == layers
+
+
+def test_stack_attaches_only_the_imported_layers():
+    stack, template = synth()
+
+    resources = template.to_json()["Resources"]
+    layer_ids = {stack.get_logical_id(layer.node.default_child): name for name, layer in stack.layers.items()}
+    for function, attribute in [
+        ("invoked_by_config", "lambda_invoked_by_config"),
+        ("sign_apigw_request", "lambda_sign_apigw_request"),
+        ("requests_get", "lambda_requests_get"),
+        ("put_evaluations", "lambda_put_evaluations"),
+    ]:
+        properties = resources[stack.get_logical_id(getattr(stack, attribute).node.default_child)]["Properties"]
+        assert [layer_ids[layer["Ref"]] for layer in properties["Layers"]] == FUNCTION_LAYERS[function]
+
+
+def test_requirements_are_pinned_by_hash():
+    for layer in lambda_layers.LAYERS:
+        requirements = paths.LAMBDA_LAYERS / layer / "requirements.txt"
+        pinned = lambda_layers.pinned_requirements(requirements)
+        assert requirements.read_text().count("--hash=sha256:") >= len(pinned)
+
+
+def test_layers_are_pruned(built):
+    output, _ = built
+
+    for layer in lambda_layers.LAYERS:
+        python = output / layer / "python"
+        assert not list(python.glob("*.dist-info"))
+        assert not list(python.glob("**/tests"))
+        assert not list(python.glob("**/*.pyi"))
+    assert (output / "http/python/requests/__init__.py").exists()
+    assert not (output / "http/python/urllib3/contrib/socks.py").exists()
+    assert not (output / "http/python/charset_normalizer/cli").exists()
+
+
+def test_every_module_is_precompiled(built):
+    output, _ = built
+
+    for source in output.rglob("*.py"):
+        assert pathlib.Path(importlib.util.cache_from_source(str(source))).exists(), source
+
+
+def test_pruned_layers_still_import(built):
+    output, _ = built
+    code = "; ".join([
+        "import sys",
+        "sys.dont_write_bytecode = True",
+        f"sys.path[:0] = {[str(output / layer / 'python') for layer in lambda_layers.LAYERS]!r}",
+        "import requests, aws_requests_auth.boto_utils, aiohttp, cb_runtime.control_broker_async",
+        "assert requests.__file__.startswith(sys.path[1])",
+    ])
+
+    subprocess.run([sys.executable, "-c", code], check=True)
+
+
+@pytest.mark.parametrize("function", FUNCTION_LAYERS)
+def test_cold_start_within_budget(built, function):
+    _, rows = built
+    row, budget = rows[function], BUDGETS[function]
+
+    assert row["Layers"] == FUNCTION_LAYERS[function]
+    for measure, ceiling in budget.items():
+        assert row[measure] <= ceiling, f"{function} {measure} {row[measure]} over {ceiling}"
@@ -0,0 +1,69 @@
+import io
+import json
+
+from cb_runtime import logs
+
+
+class Context:
+    aws_request_id = "c6af9ac6-7b61-11e6-9a41-93e812345678"
+
+
+def records(stream):
+    return [json.loads(line) for line in stream.getvalue().splitlines()]
+
+
+def test_records_below_the_level_are_dropped():
+    stream = io.StringIO()
+    log = logs.Logger(level="INFO", stream=stream)
+    log.start_invocation(Context())
+
+    log.debug("event", event={"big": "payload"})
+    log.info("config event", resource_id="queue")
+
+    [record] = records(stream)
+    assert record["level"] == "INFO"
+    assert record["message"] == "config event"
+    assert record["resource_id"] == "queue"
+    assert record["request_id"] == Context.aws_request_id
+
+
+def test_sampled_invocations_are_logged_at_debug():
+    stream = io.StringIO()
+    draws = iter([0.005, 0.5])
+    log = logs.Logger(level="ERROR", sample_rate=0.01, stream=stream, random=lambda: next(draws))
+
+    log.start_invocation(Context())
+    log.debug("sampled")
+    log.start_invocation(Context())
+    log.debug("not sampled")
+
+    assert [(r["message"], r["sampled"]) for r in records(stream)] == [("sampled", True)]
+
+
+def test_signed_headers_and_presigned_urls_are_redacted():
+    stream = io.StringIO()
+    log = logs.Logger(level="DEBUG", stream=stream)
+
+    log.debug(
+        "request",
+        headers={"Authorization": "AWS4-HMAC-SHA256 Credential=AKIA/...", "X-Amz-Security-Token": "token", "X-Amz-Date": "20220101T000000Z"},
+        url="https://results.s3.amazonaws.com/report.json?X-Amz-Credential=AKIA%2F&X-Amz-Signature=abc&versionId=1",
+        event={"TaskToken": "AAAA", "Url": "u"},
+    )
+
+    [record] = records(stream)
+    assert record["headers"] == {"Authorization": "[REDACTED]", "X-Amz-Security-Token": "[REDACTED]", "X-Amz-Date": "20220101T000000Z"}
+    assert record["url"] == "https://results.s3.amazonaws.com/report.json?X-Amz-Credential=[REDACTED]&X-Amz-Signature=[REDACTED]&versionId=1"
+    assert record["event"] == {"TaskToken": "[REDACTED]", "Url": "u"}
+
+
+def test_long_payloads_are_truncated():
+    stream = io.StringIO()
+    log = logs.Logger(level="DEBUG", max_payload_bytes=32, stream=stream)
+
+    log.debug("event", event={"configuration": "x" * 100}, resource_id="queue")
+
+    [record] = records(stream)
+    assert record["event"].startswith('{"configuration": "xxxxxxxxxxxxx')
+    assert record["event"].endswith("...[truncated 89 bytes]")
+    assert record["resource_id"] == "queue"
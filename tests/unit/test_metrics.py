@@ -0,0 +1,80 @@
+import pytest
+from botocore.stub import Stubber
+
+from benchmarks.stubs import StubServer
+from tests.lambdas import load_lambda
+from cb_runtime import metrics
+
+
+def emitted_values(emitted):
+    return [
+        (doc["_aws"]["CloudWatchMetrics"][0]["Metrics"][0]["Name"], doc)
+        for doc in emitted
+    ]
+
+
+def test_documents_are_embedded_metric_format():
+    with metrics.capture() as emitted:
+        metrics.emit("ControlBrokerErrors", 1, StatusCode=502)
+
+    [doc] = emitted
+    assert doc["_aws"]["CloudWatchMetrics"] == [{
+        "Namespace": "ControlBroker/ConfigConsumer",
+        "Dimensions": [[]],
+        "Metrics": [{"Name": "ControlBrokerErrors", "Unit": "Count"}],
+    }]
+    assert doc["ControlBrokerErrors"] == 1
+    assert doc["StatusCode"] == 502
+
+
+def test_undefined_metrics_are_rejected():
+    with pytest.raises(KeyError):
+        metrics.emit("Undefined", 1)
+
+
+def test_control_broker_request_is_timed_apart_from_signing(monkeypatch, config_event):
+    with StubServer(lambda path, body: (503, {"Error": "unavailable"})) as server:
+        monkeypatch.setenv("ControlBrokerInvokeUrl", f"{server.url}/ConfigEvent")
+        sign_apigw_request = load_lambda("sign_apigw_request")
+
+        with metrics.capture() as emitted:
+            assert sign_apigw_request.post_config_event(config_event=config_event) is False
+
+    names = emitted_values(emitted)
+    assert [name for name, _ in names] == ["SignLatency", "ControlBrokerLatency", "ControlBrokerErrors"]
+    assert names[1][1]["StatusCode"] == 503
+    assert names[2][1]["ControlBrokerErrors"] == 1
+
+
+def test_put_evaluations_latency(monkeypatch):
+    put_evaluations = load_lambda("put_evaluations")
+    compliance = put_evaluations.ConfigCompliance(
+        ResourceType="AWS::SQS::Queue",
+        ResourceId="queue",
+        ResultToken="token",
+        Compliant=True,
+    )
+
+    with Stubber(put_evaluations.config) as config, metrics.capture() as emitted:
+        config.add_response("put_evaluations", {"FailedEvaluations": []})
+        put_evaluations.put_evaluations_batch([compliance])
+
+    [(name, doc)] = emitted_values(emitted)
+    assert name == "PutEvaluationsLatency"
+    assert doc["Evaluations"] == 1
+
+
+def test_report_poll_attempts():
+    requests_get = load_lambda("requests_get")
+
+    class Http:
+        def get(self, url):
+            return type("Response", (), {"status_code": 404})()
+
+    with metrics.capture() as emitted:
+        assert requests_get.requests_get("https://results.s3.amazonaws.com/report.json", http=Http()) is False
+
+    values = {name: doc[name] for name, doc in emitted_values(emitted)}
+    assert values["ReportPollAttempts"] == 1
+    assert values["ReportNotReady"] == 1
+    assert "ReportFetchLatency" in values
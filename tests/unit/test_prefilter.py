@@ -0,0 +1,122 @@
+import json
+
+import pytest
+from botocore.stub import ANY, Stubber
+
+from tests.lambdas import load_lambda
+from cb_runtime import metrics, prefilter
+
+SFN_ARN = "arn:aws:states:us-east-1:123456789012:stateMachine:ConfigEventProcessing"
+
+
+def invoking_event(config_event):
+    return json.loads(config_event["invokingEvent"])
+
+
+def with_rule_parameters(config_event, **rule_parameters):
+    return {**config_event, "ruleParameters": json.dumps(rule_parameters)}
+
+
+def decide(config_event, **rule_parameters):
+    return prefilter.decide(rule_parameters=rule_parameters, invoking_event=invoking_event(config_event))[0]
+
+
+def test_no_parameters_evaluates(config_event):
+    assert decide(config_event) == prefilter.EVALUATE
+
+
+@pytest.mark.parametrize("resource_types, decision", [
+    ("AWS::SQS::Queue,AWS::SNS::Topic", prefilter.EVALUATE),
+    ('["AWS::SQS::Queue"]', prefilter.EVALUATE),
+    ("AWS::SNS::Topic", prefilter.NOT_APPLICABLE),
+])
+def test_resource_type_allowlist(config_event, resource_types, decision):
+    assert decide(config_event, ResourceTypes=resource_types) == decision
+
+
+@pytest.mark.parametrize("selector, decision", [
+    ({"aws:cloudformation:stack-name": "CBConsumerConfig"}, prefilter.EVALUATE),
+    ({"aws:cloudformation:stack-name": ["Other", "CBConsumerConfig"]}, prefilter.EVALUATE),
+    ({"aws:cloudformation:stack-name": "*"}, prefilter.EVALUATE),
+    ({"aws:cloudformation:stack-name": "Other"}, prefilter.NOT_APPLICABLE),
+    ({"Owner": "*"}, prefilter.NOT_APPLICABLE),
+])
+def test_tag_selector(config_event, selector, decision):
+    assert decide(config_event, TagSelector=json.dumps(selector)) == decision
+
+
+@pytest.mark.parametrize("predicate, decision", [
+    ({"Path": "$.configuration.FifoQueue", "Equals": True}, prefilter.EVALUATE),
+    ({"Path": "$.configuration.VisibilityTimeout", "In": [30, 60]}, prefilter.EVALUATE),
+    ({"Path": "$.configuration.KmsMasterKeyId", "Exists": False}, prefilter.EVALUATE),
+    ({"Path": "$.configuration.FifoQueue", "Equals": False}, prefilter.NOT_APPLICABLE),
+    ({"Path": "$.configuration.KmsMasterKeyId", "Exists": True}, prefilter.NOT_APPLICABLE),
+])
+def test_configuration_predicates(config_event, predicate, decision):
+    assert decide(config_event, ConfigurationPredicates=json.dumps([predicate])) == decision
+
+
+@pytest.mark.parametrize("fields, decision", [
+    ("Configuration.ContentBasedDeduplication", prefilter.EVALUATE),
+    ("configuration", prefilter.EVALUATE),
+    ("Configuration.Policy,Tags", prefilter.SKIP),
+    ("Configuration.Content", prefilter.SKIP),
+])
+def test_changed_fields_of_interest(config_event, fields, decision):
+    assert decide(config_event, ChangedFieldsOfInterest=fields) == decision
+
+
+def test_changed_fields_of_a_new_resource_are_evaluated(config_event):
+    event = invoking_event(config_event)
+    event["configurationItemDiff"] = {"changedProperties": {}, "changeType": "CREATE"}
+
+    decision, _ = prefilter.decide(rule_parameters={"ChangedFieldsOfInterest": "Tags"}, invoking_event=event)
+
+    assert decision == prefilter.EVALUATE
+
+
+def test_oversized_notification_is_decided_on_its_summary(config_event):
+    configuration_item = invoking_event(config_event)["configurationItem"]
+    event = {"messageType": "OversizedConfigurationItemChangeNotification", "configurationItemSummary": configuration_item}
+
+    assert prefilter.decide(rule_parameters={"ResourceTypes": "AWS::SNS::Topic"}, invoking_event=event)[0] == prefilter.NOT_APPLICABLE
+    assert prefilter.decide(rule_parameters={"TagSelector": '{"Owner": "*"}'}, invoking_event=event)[0] == prefilter.EVALUATE
+
+
+@pytest.fixture
+def invoked_by_config(monkeypatch):
+    monkeypatch.setenv("ConfigEventProcessingSfnArn", SFN_ARN)
+    return load_lambda("invoked_by_config")
+
+
+def test_not_applicable_is_put_without_an_execution(invoked_by_config, config_event):
+    event = with_rule_parameters(config_event, ResourceTypes="AWS::SNS::Topic")
+    configuration_item = invoking_event(config_event)["configurationItem"]
+
+    with Stubber(invoked_by_config.config) as config, Stubber(invoked_by_config.sfn), metrics.capture() as emitted:
+        config.add_response(
+            "put_evaluations",
+            {"FailedEvaluations": []},
+            {
+                "Evaluations": [{
+                    "ComplianceResourceType": "AWS::SQS::Queue",
+                    "ComplianceResourceId": configuration_item["resourceId"],
+                    "ComplianceType": "NOT_APPLICABLE",
+                    "Annotation": ANY,
+                    "OrderingTimestamp": ANY,
+                }],
+                "ResultToken": config_event["resultToken"],
+            },
+        )
+        assert invoked_by_config.lambda_handler(event, None) is True
+
+    names = [doc["_aws"]["CloudWatchMetrics"][0]["Metrics"][0]["Name"] for doc in emitted]
+    assert {name: doc[name] for name, doc in zip(names, emitted)} == {"PrefilterNotApplicable": 1, "PrefilterSkipped": 0}
+
+
+def test_change_to_unread_fields_never_reaches_control_broker(invoked_by_config, config_event):
+    event = with_rule_parameters(config_event, ChangedFieldsOfInterest="Configuration.Policy")
+
+    # the stubs answer no calls at all, so any AWS request fails the test
+    with Stubber(invoked_by_config.config), Stubber(invoked_by_config.sfn):
+        assert invoked_by_config.lambda_handler(event, None) is True
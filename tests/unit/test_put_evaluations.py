@@ -0,0 +1,68 @@
+import pytest
+from botocore.stub import Stubber
+
+from tests.lambdas import load_lambda
+
+
+@pytest.fixture
+def put_evaluations(monkeypatch):
+    put_evaluations = load_lambda("put_evaluations")
+    monkeypatch.setattr(put_evaluations.time, "sleep", lambda seconds: None)
+    return put_evaluations
+
+
+def compliance(put_evaluations, i, result_token="token", compliant=True):
+    return put_evaluations.ConfigCompliance(
+        ResourceType="AWS::SQS::Queue",
+        ResourceId=f"queue-{i}",
+        ResultToken=result_token,
+        Compliant=compliant,
+    )
+
+
+def test_evaluations_are_grouped_by_result_token_in_chunks_of_100(put_evaluations):
+    compliances = [compliance(put_evaluations, i, "periodic") for i in range(250)]
+    compliances.append(compliance(put_evaluations, 250, "change-triggered", compliant=False))
+
+    with Stubber(put_evaluations.config) as config:
+        for result_token, start, stop in [("periodic", 0, 100), ("periodic", 100, 200), ("periodic", 200, 250), ("change-triggered", 250, 251)]:
+            config.add_response(
+                "put_evaluations",
+                {"FailedEvaluations": []},
+                {
+                    "ResultToken": result_token,
+                    "Evaluations": [i.evaluation() for i in compliances[start:stop]],
+                },
+            )
+
+        assert put_evaluations.put_evaluations_batch(compliances) == []
+
+        config.assert_no_pending_responses()
+
+
+def test_throttling_is_retried_and_failures_are_returned_per_item(put_evaluations, monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(put_evaluations.time, "sleep", sleeps.append)
+    compliances = [compliance(put_evaluations, i) for i in range(3)]
+    failed_evaluation = compliances[1].evaluation()
+
+    with Stubber(put_evaluations.config) as config:
+        config.add_client_error("put_evaluations", "ThrottlingException")
+        config.add_client_error("put_evaluations", "ThrottlingException")
+        config.add_response("put_evaluations", {"FailedEvaluations": [failed_evaluation]})
+
+        failed = put_evaluations.put_evaluations_batch(compliances)
+
+    assert len(sleeps) == 2
+    assert failed == [{"ResultToken": "token", "Evaluation": failed_evaluation, "ErrorCode": "FailedEvaluation"}]
+
+
+def test_single_evaluation_raises_on_client_error(put_evaluations):
+    with Stubber(put_evaluations.config) as config:
+        config.add_client_error("put_evaluations", "InvalidResultTokenException")
+
+        with pytest.raises(put_evaluations.PutEvaluationsFailedException):
+            put_evaluations.lambda_handler(
+                {"ResourceType": "AWS::SQS::Queue", "ResourceId": "queue", "ConfigResultToken": "token", "Compliance": True},
+                None,
+            )
@@ -0,0 +1,116 @@
+import json
+import threading
+
+from utils import paths
+from tools import reevaluate_resources
+
+FIXTURES = paths.REPO_ROOT / "tests/fixtures/reevaluation"
+
+
+def sweep(evaluate, checkpoint, repeat=1, config=None):
+    return reevaluate_resources.sweep(
+        config=config or reevaluate_resources.RecordedConfig(FIXTURES, repeat=repeat),
+        config_rule_name="CBConsumerConfig-SQSPoC11A84690-ABC123",
+        evaluate=evaluate,
+        workers=4,
+        bucket=reevaluate_resources.TokenBucket(rate=1000),
+        checkpoint=checkpoint,
+        result_token="TESTMODE",
+    )
+
+
+def test_sweeps_every_resource_in_scope_as_a_config_event():
+    events = []
+    lock = threading.Lock()
+
+    def evaluate(config_event):
+        with lock:
+            events.append(config_event)
+        return True
+
+    results = sweep(evaluate, reevaluate_resources.Checkpoint(None), repeat=2)
+
+    assert len(results) == 6
+    assert all(succeeded for _, succeeded, _ in results)
+
+    invoking_events = [json.loads(e["invokingEvent"]) for e in events]
+    assert sorted(i["configurationItem"]["resourceId"] for i in invoking_events) == sorted(
+        f"https://sqs.us-east-1.amazonaws.com/123456789012/CBConsumerConfig-TrackedByConfig0{n}.fifo{suffix}"
+        for n in (1, 2, 3)
+        for suffix in ("", "#1")
+    )
+    assert {i["messageType"] for i in invoking_events} == {"ConfigurationItemChangeNotification"}
+    # configuration arrives as a JSON string from BatchGetResourceConfig, and as an object in a notification
+    assert all(isinstance(i["configurationItem"]["configuration"], dict) for i in invoking_events)
+    assert {e["resultToken"] for e in events} == {"TESTMODE"}
+    assert {e["configRuleName"] for e in events} == {"CBConsumerConfig-SQSPoC11A84690-ABC123"}
+
+
+def test_resumes_from_the_checkpoint(tmp_path):
+    checkpoint = tmp_path / "checkpoint.jsonl"
+    failing = "CBConsumerConfig-TrackedByConfig02.fifo"
+
+    def evaluate(config_event):
+        return failing not in config_event["invokingEvent"]
+
+    first = sweep(evaluate, reevaluate_resources.Checkpoint(checkpoint))
+    assert sorted(succeeded for _, succeeded, _ in first) == [False, True, True]
+
+    resumed = []
+    second = sweep(
+        lambda config_event: resumed.append(config_event) or True,
+        reevaluate_resources.Checkpoint(checkpoint),
+    )
+    assert len(second) == 1
+    assert failing in resumed[0]["invokingEvent"]
+
+    assert sweep(lambda config_event: True, reevaluate_resources.Checkpoint(checkpoint)) == []
+
+
+class ThrottledConfig(reevaluate_resources.RecordedConfig):
+    """Never returns the configuration item of one resource."""
+
+    def __init__(self, fixtures, *, throttled):
+        super().__init__(fixtures)
+        self.throttled = throttled
+
+    def batch_get_resource_config(self, resourceKeys):
+        r = super().batch_get_resource_config([k for k in resourceKeys if self.throttled not in k["resourceId"]])
+        return {**r, "unprocessedResourceKeys": [k for k in resourceKeys if self.throttled in k["resourceId"]]}
+
+
+def test_resources_still_unprocessed_are_failed_and_resumed(tmp_path, monkeypatch):
+    monkeypatch.setattr(reevaluate_resources.time, "sleep", lambda seconds: None)
+    checkpoint = tmp_path / "checkpoint.jsonl"
+    throttled = "CBConsumerConfig-TrackedByConfig02.fifo"
+
+    first = sweep(
+        lambda config_event: True,
+        reevaluate_resources.Checkpoint(checkpoint),
+        config=ThrottledConfig(FIXTURES, throttled=throttled),
+    )
+    assert sorted(succeeded for _, succeeded, _ in first) == [False, True, True]
+    assert [latency for key, _, latency in first if throttled in key] == [None]
+
+    resumed = []
+    second = sweep(
+        lambda config_event: resumed.append(config_event) or True,
+        reevaluate_resources.Checkpoint(checkpoint),
+    )
+    assert len(second) == 1
+    assert throttled in resumed[0]["invokingEvent"]
+
+
+def test_token_bucket_waits_for_tokens_beyond_the_burst():
+    now = [0.0]
+    slept = []
+
+    def sleep(seconds):
+        slept.append(seconds)
+        now[0] += seconds
+
+    bucket = reevaluate_resources.TokenBucket(rate=10, burst=2, clock=lambda: now[0], sleep=sleep)
+    for _ in range(4):
+        bucket.acquire()
+
+    assert slept == [0.1, 0.1]
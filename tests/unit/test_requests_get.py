@@ -0,0 +1,124 @@
+import json
+import random
+
+import pytest
+
+from tests.lambdas import load_lambda
+
+REPORT = {
+    "EvalEngineLambdalith": {
+        "Evaluation": {"IsCompliant": False, "Reasons": ["dedup \"disabled\"", "\\escaped\\"]},
+        "Input": {"Resources": {f"Queue{i}": {"Properties": {"FifoQueue": True, "Tags": [1, 2.5e3, None]}} for i in range(200)}},
+    },
+    "Ünïcode": "✓",
+}
+
+
+@pytest.fixture(scope="module")
+def requests_get():
+    return load_lambda("requests_get")
+
+
+def chunked(document, size):
+    content = json.dumps(document, indent=1).encode()
+    return [content[i:i + size] for i in range(0, len(content), size)]
+
+
+@pytest.mark.parametrize("size", [1, 3, 7, 64, 1 << 20])
+def test_projection_matches_full_parse_across_chunk_boundaries(requests_get, size):
+    projection = requests_get.JsonProjection(
+        chunks=chunked(REPORT, size),
+        paths=["EvalEngineLambdalith.Evaluation.IsCompliant", "EvalEngineLambdalith.Evaluation.Reasons", "Ünïcode"],
+        max_bytes=1 << 30,
+    ).project()
+
+    assert projection == {
+        "EvalEngineLambdalith": {"Evaluation": {"IsCompliant": False, "Reasons": REPORT["EvalEngineLambdalith"]["Evaluation"]["Reasons"]}},
+        "Ünïcode": "✓",
+    }
+
+
+def test_projection_stops_reading_once_found(requests_get):
+    chunks = iter(chunked(REPORT, 16))
+    projection = requests_get.JsonProjection(
+        chunks=chunks,
+        paths=["EvalEngineLambdalith.Evaluation.IsCompliant"],
+        max_bytes=1 << 30,
+    ).project()
+
+    assert projection == {"EvalEngineLambdalith": {"Evaluation": {"IsCompliant": False}}}
+    assert next(chunks, None) is not None
+
+
+def test_projection_skips_unrequested_values(requests_get):
+    rng = random.Random(0)
+    document = {f"k{i}": rng.choice([[], {}, "", "a,}]", -1.5e-3, True, None, [{"x": "}"}]]) for i in range(500)}
+    document["target"] = {"value": [1, {"a": "b"}]}
+
+    projection = requests_get.JsonProjection(chunks=chunked(document, 5), paths=["target.value"], max_bytes=1 << 30).project()
+
+    assert projection == {"target": {"value": [1, {"a": "b"}]}}
+
+
+def test_missing_path_is_left_out(requests_get):
+    projection = requests_get.JsonProjection(chunks=chunked(REPORT, 64), paths=["EvalEngineLambdalith.Missing"], max_bytes=1 << 30).project()
+
+    assert projection == {}
+
+
+def test_response_size_is_capped(requests_get):
+    with pytest.raises(requests_get.ResponseTooLargeException):
+        requests_get.JsonProjection(chunks=chunked(REPORT, 1024), paths=["Ünïcode"], max_bytes=4096).project()
+
+
+class StreamedResponse:
+
+    def __init__(self, status_code, document):
+        self.status_code = status_code
+        self.document = document
+        self.closed = False
+
+    def iter_content(self, chunk_size):
+        return iter(chunked(self.document, chunk_size))
+
+    def close(self):
+        self.closed = True
+
+
+class Http:
+
+    def __init__(self, response):
+        self.response = response
+
+    def get(self, url, stream):
+        assert stream
+        return self.response
+
+
+def test_requests_get_returns_only_the_projection(requests_get):
+    response = StreamedResponse(200, REPORT)
+
+    assert requests_get.requests_get(
+        "https://results/report.json",
+        http=Http(response),
+        projection=["EvalEngineLambdalith.Evaluation.IsCompliant"],
+    ) == {"EvalEngineLambdalith": {"Evaluation": {"IsCompliant": False}}}
+    assert response.closed
+
+
+def test_report_without_the_projected_field_is_not_retried(requests_get, monkeypatch):
+    report = {"EvalEngineLambdalith": {"Evaluation": {"Reasons": []}}}
+    monkeypatch.setattr("requests.get", lambda url, stream: StreamedResponse(200, report))
+
+    with pytest.raises(requests_get.ProjectionNotFound, match="EvalEngineLambdalith.Evaluation.IsCompliant"):
+        requests_get.lambda_handler(
+            {"Url": "https://results/report.json", "Projection": ["EvalEngineLambdalith.Evaluation.IsCompliant"]},
+            None,
+        )
+
+
+def test_requests_get_streaming_not_200(requests_get):
+    response = StreamedResponse(404, {"Error": "NoSuchKey"})
+
+    assert requests_get.requests_get("https://results/report.json", http=Http(response), projection=["Error"]) is False
+    assert response.closed
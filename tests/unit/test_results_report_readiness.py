@@ -0,0 +1,77 @@
+import pytest
+from botocore.stub import Stubber
+
+from tests.lambdas import load_lambda
+from cb_runtime import results_report_waiters
+
+TABLE = "ResultsReportWaiters"
+URL = "https://control-broker-results.s3.us-east-1.amazonaws.com/ConfigEvent/abc%20def.json?X-Amz-Signature=abc"
+REPORT_KEY = "control-broker-results/ConfigEvent/abc def.json"
+
+
+class Response:
+    def __init__(self, status_code):
+        self.status_code = status_code
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def wait_for_results_report(monkeypatch):
+    monkeypatch.setenv("ResultsReportWaitersTable", TABLE)
+    return load_lambda("wait_for_results_report")
+
+
+@pytest.fixture
+def results_report_written(monkeypatch):
+    monkeypatch.setenv("ResultsReportWaitersTable", TABLE)
+    return load_lambda("results_report_written")
+
+
+@pytest.mark.parametrize("url, bucket_key", [
+    (URL, ("control-broker-results", "ConfigEvent/abc def.json")),
+    ("https://control-broker-results.s3.amazonaws.com/report.json?x=1", ("control-broker-results", "report.json")),
+    ("https://s3.us-east-1.amazonaws.com/control-broker-results/a/report.json", ("control-broker-results", "a/report.json")),
+])
+def test_presigned_url_to_bucket_key(wait_for_results_report, url, bucket_key):
+    assert wait_for_results_report.presigned_url_to_bucket_key(url=url) == bucket_key
+
+
+def test_waiter_registers_and_leaves_resume_to_notification(wait_for_results_report, monkeypatch):
+    monkeypatch.setattr(wait_for_results_report.http, "get", lambda url, stream: Response(404))
+    with Stubber(results_report_waiters.ddb) as ddb, Stubber(results_report_waiters.sfn):
+        ddb.add_response("put_item", {})
+        assert wait_for_results_report.lambda_handler({"Url": URL, "TaskToken": "token"}, None) is True
+
+
+def test_waiter_resumes_itself_when_report_already_exists(wait_for_results_report, monkeypatch):
+    monkeypatch.setattr(wait_for_results_report.http, "get", lambda url, stream: Response(200))
+    with Stubber(results_report_waiters.ddb) as ddb, Stubber(results_report_waiters.sfn) as sfn:
+        ddb.add_response("put_item", {})
+        ddb.add_response(
+            "delete_item",
+            {"Attributes": {"TaskToken": {"S": "token"}}},
+            {"TableName": TABLE, "Key": {"ReportKey": {"S": REPORT_KEY}}, "ReturnValues": "ALL_OLD"},
+        )
+        sfn.add_response("send_task_success", {})
+        assert wait_for_results_report.lambda_handler({"Url": URL, "TaskToken": "token"}, None) is True
+
+
+def test_notification_resumes_waiting_execution(results_report_written):
+    event = {"detail": {"bucket": {"name": "control-broker-results"}, "object": {"key": "ConfigEvent/abc def.json"}}}
+    with Stubber(results_report_waiters.ddb) as ddb, Stubber(results_report_waiters.sfn) as sfn:
+        ddb.add_response("delete_item", {"Attributes": {"TaskToken": {"S": "token"}}})
+        sfn.add_response("send_task_success", {}, {"taskToken": "token", "output": '{"ReportKey": "%s"}' % REPORT_KEY})
+        assert results_report_written.lambda_handler(event, None) is True
+
+
+def test_notification_without_waiter_or_after_timeout(results_report_written):
+    event = {"detail": {"bucket": {"name": "control-broker-results"}, "object": {"key": "report.json"}}}
+    with Stubber(results_report_waiters.ddb) as ddb, Stubber(results_report_waiters.sfn) as sfn:
+        ddb.add_response("delete_item", {})
+        assert results_report_written.lambda_handler(event, None) is False
+
+        ddb.add_response("delete_item", {"Attributes": {"TaskToken": {"S": "token"}}})
+        sfn.add_client_error("send_task_success", "TaskTimedOut")
+        assert results_report_written.lambda_handler(event, None) is False
@@ -0,0 +1,70 @@
+import json
+
+import pytest
+
+from benchmarks.stubs import StubServer
+from tests.lambdas import load_lambda
+
+
+@pytest.fixture
+def sign_apigw_request(monkeypatch):
+    monkeypatch.setenv("ControlBrokerInvokeUrl", "https://MY_API_ID.execute-api.us-east-1.amazonaws.com/ConfigEvent")
+    return load_lambda("sign_apigw_request")
+
+
+def test_host_is_resolved_at_import(sign_apigw_request):
+    assert sign_apigw_request.get_host.cache_info().currsize == 1
+    assert sign_apigw_request.get_host(
+        full_invoke_url="https://MY_API_ID.execute-api.us-east-1.amazonaws.com/ConfigEvent"
+    ) == "MY_API_ID.execute-api.us-east-1.amazonaws.com"
+    assert sign_apigw_request.get_host(full_invoke_url="http://127.0.0.1:8080/dev/ConfigEvent") == "127.0.0.1:8080"
+
+
+def test_signer_is_reused_until_credentials_rotate(sign_apigw_request, monkeypatch):
+    host = "MY_API_ID.execute-api.us-east-1.amazonaws.com"
+    signer = sign_apigw_request.get_signer(host=host)
+
+    assert sign_apigw_request.get_signer(host=host) is signer
+
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "rotated")
+    assert sign_apigw_request.get_signer(host=host) is not signer
+
+
+def test_http_session_pools_connections(sign_apigw_request):
+    adapter = sign_apigw_request.http.get_adapter("https://MY_API_ID.execute-api.us-east-1.amazonaws.com/ConfigEvent")
+    assert adapter._pool_maxsize == 16
+
+
+def test_fanned_out_event_posts_to_the_named_endpoint(monkeypatch, config_event):
+    requested = []
+
+    def respond(path, body):
+        requested.append(path)
+        if path.startswith("/unavailable"):
+            return 503, {"Error": "unavailable"}
+        return 200, {"Response": {"ControlBrokerEvaluation": {"OutputHandlers": {
+            "OPA": {"PresignedUrl": "https://results.s3.amazonaws.com/opa.json"},
+            "Checkov": {"PresignedUrl": "https://results.s3.amazonaws.com/checkov.json"},
+        }}}}
+
+    with StubServer(respond) as server:
+        monkeypatch.setenv("ControlBrokerEndpoints", json.dumps({
+            "Checkov": f"{server.url}/checkov/ConfigEvent",
+            "Unavailable": f"{server.url}/unavailable/ConfigEvent",
+        }))
+        sign_apigw_request = load_lambda("sign_apigw_request")
+
+        verdict = sign_apigw_request.lambda_handler(
+            {"ConfigEvent": config_event, "Endpoint": "Checkov", "OutputHandler": "Checkov"}, None
+        )
+        with pytest.raises(sign_apigw_request.ControlBrokerRequestFailed):
+            sign_apigw_request.lambda_handler(
+                {"ConfigEvent": config_event, "Endpoint": "Unavailable", "OutputHandler": "OPA"}, None
+            )
+
+    assert requested == ["/checkov/ConfigEvent", "/unavailable/ConfigEvent"]
+    assert verdict == {
+        "Endpoint": "Checkov",
+        "OutputHandler": "Checkov",
+        "PresignedUrl": "https://results.s3.amazonaws.com/checkov.json",
+    }
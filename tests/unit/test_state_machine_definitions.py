@@ -0,0 +1,261 @@
+"""Every synthesized ConfigEventProcessing definition, run in process by utils.asl against stand-in handlers."""
+import copy
+import functools
+import json
+
+import pytest
+
+from tests.unit.test_control_broker_consumer_example_config_stack import synth
+from utils import asl
+
+PRESIGNED_URL = "https://results.s3.amazonaws.com/report.json?X-Amz-Signature=abc"
+
+ENDPOINTS = [
+    {"Name": "OPA", "Url": "https://OPA_API_ID.execute-api.us-east-1.amazonaws.com/ConfigEvent"},
+    {"Name": "Checkov", "Url": "https://CHECKOV_API_ID.execute-api.us-east-1.amazonaws.com/ConfigEvent", "OutputHandler": "Checkov"},
+]
+
+VARIANTS = {
+    "default": {},
+    "express": {"state_machine_type": "EXPRESS"},
+    "batch": {"batch_evaluation": True},
+    "task_token": {"results_report_readiness": "TaskToken", "results_bucket_name": "control-broker-results"},
+    "evaluation_dedup": {"evaluation_dedup": True, "policy_version": "0.10.0"},
+    "fan_out": {"control_broker_endpoints": ENDPOINTS},
+    "fan_out_any_must_pass": {"control_broker_endpoints": ENDPOINTS, "verdict_combiner": "AnyMustPass"},
+    "fan_out_batch_task_token": {
+        "control_broker_endpoints": ENDPOINTS,
+        "batch_evaluation": True,
+        "results_report_readiness": "TaskToken",
+        "results_bucket_name": "control-broker-results",
+    },
+}
+
+
+class StatusCodeNot200Exception(Exception):
+    pass
+
+
+class ProjectionNotFound(Exception):
+    pass
+
+
+@functools.lru_cache(maxsize=None)
+def definition_and_functions(variant):
+    stack, _ = synth(**VARIANTS[variant])
+    functions = {
+        "sign_apigw_request": stack.lambda_sign_apigw_request.function_name,
+        "get_resource_config_compliance": stack.lambda_get_resource_config_compliance.function_name,
+        "requests_get": stack.lambda_requests_get.function_name,
+        "put_evaluations": stack.lambda_put_evaluations.function_name,
+    }
+    if VARIANTS[variant].get("results_report_readiness") == "TaskToken":
+        functions["wait_for_results_report"] = stack.lambda_wait_for_results_report.function_name
+    return stack.config_event_processing_definition, functions
+
+
+class Handlers:
+    """Stand-ins returning what the deployed lambdas return, recording their payloads."""
+
+    def __init__(self, *, report_delay=0, is_compliant=True, endpoint_verdicts=None, recorded_compliance=None,
+                 send_task_token=True, report_lacks_verdict=False):
+        self.report_delay = report_delay
+        self.report_lacks_verdict = report_lacks_verdict
+        self.is_compliant = is_compliant
+        self.endpoint_verdicts = endpoint_verdicts or {}
+        self.recorded_compliance = recorded_compliance
+        self.send_task_token = send_task_token
+        self.payloads = {}
+        self.execution = None
+
+    def record(self, name, event):
+        self.payloads.setdefault(name, []).append(event)
+
+    def sign_apigw_request(self, event, context):
+        self.record("sign_apigw_request", event)
+        if "Endpoint" in event:
+            return {
+                "Endpoint": event["Endpoint"],
+                "OutputHandler": event["OutputHandler"],
+                "PresignedUrl": f"https://results.s3.amazonaws.com/{event['Endpoint']}.json?X-Amz-Signature=abc",
+            }
+        return {"Response": {"ControlBrokerEvaluation": {"OutputHandlers": {"OPA": {"PresignedUrl": PRESIGNED_URL}}}}}
+
+    def get_resource_config_compliance(self, event, context):
+        self.record("get_resource_config_compliance", event)
+        if event["ExpectedComplianceStatus"] is None:
+            return None
+        recorded = self.is_compliant if self.recorded_compliance is None else self.recorded_compliance
+        return {"ComplianceIsAsExpected": event["ExpectedComplianceStatus"] == recorded}
+
+    def requests_get(self, event, context):
+        self.record("requests_get", event)
+        if len(self.payloads["requests_get"]) <= self.report_delay:
+            raise StatusCodeNot200Exception
+        if self.report_lacks_verdict:
+            raise ProjectionNotFound("EvalEngineLambdalith.Evaluation.IsCompliant")
+        endpoint = event["Url"].split("/")[-1].split(".")[0]
+        is_compliant = self.endpoint_verdicts.get(endpoint, self.is_compliant)
+        return {"EvalEngineLambdalith": {"Evaluation": {"IsCompliant": is_compliant}}}
+
+    def put_evaluations(self, event, context):
+        self.record("put_evaluations", event)
+        return {"EvaluationCompletionStatus": True}
+
+    def wait_for_results_report(self, event, context):
+        self.record("wait_for_results_report", event)
+        if self.send_task_token:
+            self.execution.send_task_success(event["TaskToken"], json.dumps(True))
+        return True
+
+
+def run(variant, input, handlers):
+    definition, functions = definition_and_functions(variant)
+    tasks = {function_name: getattr(handlers, name) for name, function_name in functions.items()}
+    handlers.execution = asl.Execution(definition, tasks=tasks, sleep=lambda seconds: None)
+    return handlers.execution.run(input)
+
+
+def visited(execution):
+    return [entry["State"] for entry in execution.history]
+
+
+@pytest.fixture
+def workflow_input(config_event):
+    def workflow_input(variant):
+        event = dict(config_event, EvaluationContentHash="0" * 64)
+        if VARIANTS[variant].get("batch_evaluation"):
+            return {"ConfigEvents": [event, dict(event, resultToken="second")]}
+        return event
+    return workflow_input
+
+
+@pytest.mark.parametrize("variant", VARIANTS)
+def test_definition_is_valid(variant):
+    definition, _ = definition_and_functions(variant)
+    assert asl.validate(definition) == []
+
+
+@pytest.mark.parametrize("variant", VARIANTS)
+def test_compliant_resource_succeeds(variant, workflow_input, config_event):
+    handlers = Handlers(report_delay=1)
+
+    execution = run(variant, workflow_input(variant), handlers)
+
+    assert execution.status == "SUCCEEDED", (execution.error, execution.cause)
+    assert "GetResourceConfigComplianceFinal" in visited(execution)
+
+    # the events of a batch are evaluated concurrently, so put in either order
+    evaluations = {evaluation["ConfigResultToken"]: evaluation for evaluation in handlers.payloads["put_evaluations"]}
+    assert set(evaluations) == {event["resultToken"] for event in workflow_input(variant).get("ConfigEvents", [config_event])}
+    evaluation = evaluations[config_event["resultToken"]]
+    invoking_event = json.loads(config_event["invokingEvent"])
+    assert evaluation["Compliance"] is True
+    assert evaluation["ConfigResultToken"] == config_event["resultToken"]
+    assert evaluation["ResourceId"] == invoking_event["configurationItem"]["resourceId"]
+    assert evaluation["ResourceType"] == invoking_event["configurationItem"]["resourceType"]
+    assert evaluation["ConfigRuleName"] == config_event["configRuleName"]
+    if variant == "evaluation_dedup":
+        assert evaluation["EvaluationContentHash"] == "0" * 64
+    else:
+        assert "EvaluationContentHash" not in evaluation
+
+
+def test_results_report_polled_until_retries_run_out(workflow_input):
+    handlers = Handlers(report_delay=100)
+
+    execution = run("default", workflow_input("default"), handlers)
+
+    assert execution.status == "FAILED"
+    assert visited(execution)[-1] == "ResultsReportDoesNotYetExist"
+    assert len(handlers.payloads["requests_get"]) == 9
+    assert {event["Url"] for event in handlers.payloads["requests_get"]} == {PRESIGNED_URL}
+
+
+@pytest.mark.parametrize("variant", ["default", "fan_out"])
+def test_report_without_the_verdict_fails_without_polling(variant, workflow_input):
+    handlers = Handlers(report_lacks_verdict=True)
+
+    execution = run(variant, workflow_input(variant), handlers)
+
+    assert execution.status == "FAILED"
+    # each report is fetched once, not polled
+    urls = [event["Url"] for event in handlers.payloads["requests_get"]]
+    assert len(urls) == len(set(urls))
+    assert "put_evaluations" not in handlers.payloads
+    if variant == "default":
+        assert visited(execution)[-1] == "ResultsReportProjectionNotFound"
+        assert execution.error == "ProjectionNotFound"
+
+
+@pytest.mark.parametrize("variant, verdicts, combined", [
+    ("fan_out", {"OPA": True, "Checkov": True}, True),
+    ("fan_out", {"OPA": True, "Checkov": False}, False),
+    ("fan_out_any_must_pass", {"OPA": True, "Checkov": False}, True),
+    ("fan_out_any_must_pass", {"OPA": False, "Checkov": False}, False),
+])
+def test_fanned_out_verdicts_are_combined(variant, verdicts, combined, workflow_input):
+    handlers = Handlers(endpoint_verdicts=verdicts, recorded_compliance=combined)
+
+    execution = run(variant, workflow_input(variant), handlers)
+
+    assert execution.status == "SUCCEEDED", (execution.error, execution.cause)
+    assert sorted((e["Endpoint"], e["OutputHandler"]) for e in handlers.payloads["sign_apigw_request"]) == [
+        ("Checkov", "Checkov"),
+        ("OPA", "OPA"),
+    ]
+    [evaluation] = handlers.payloads["put_evaluations"]
+    assert evaluation["Compliance"] is combined
+
+
+def test_fanned_out_branch_failure_fails_the_evaluation(workflow_input):
+    handlers = Handlers(report_delay=100)
+
+    execution = run("fan_out", workflow_input("fan_out"), handlers)
+
+    assert execution.status == "FAILED"
+    assert visited(execution)[-1] == "ResultsReportDoesNotYetExist"
+    assert "put_evaluations" not in handlers.payloads
+
+
+@pytest.mark.parametrize("variant, last_state", [
+    ("default", "ComplianceStatusIsAsExpectedFalse"),
+    ("batch", "ConfigEventsSucceededFalse"),
+])
+def test_compliance_not_recorded_as_evaluated_fails(variant, last_state, workflow_input):
+    handlers = Handlers(recorded_compliance=False)
+
+    execution = run(variant, workflow_input(variant), handlers)
+
+    assert execution.status == "FAILED"
+    assert visited(execution)[-1] == last_state
+    if variant == "batch":
+        # whether each event succeeded, for invoked_by_config to redeliver the failed ones
+        assert execution.error == "ConfigEventsFailed"
+        assert json.loads(execution.cause) == [False, False]
+
+
+def test_task_token_timeout_falls_back_to_polling(workflow_input):
+    handlers = Handlers(send_task_token=False, report_delay=2)
+
+    execution = run("task_token", workflow_input("task_token"), handlers)
+
+    assert execution.status == "SUCCEEDED"
+    [wait] = handlers.payloads["wait_for_results_report"]
+    assert wait["Url"] == PRESIGNED_URL
+    assert wait["TaskToken"]
+    assert len(handlers.payloads["requests_get"]) == 3
+
+
+def test_misspelled_path_fails_before_deploy(workflow_input):
+    definition, functions = definition_and_functions("default")
+    definition = copy.deepcopy(definition)
+    definition["States"]["GetResourceConfigComplianceFinal"]["ResultPath"] = "$.GetResourceConfigCompliancee"
+    handlers = Handlers()
+    tasks = {function_name: getattr(handlers, name) for name, function_name in functions.items()}
+
+    execution = asl.Execution(definition, tasks=tasks).run(workflow_input("default"))
+
+    assert execution.status == "FAILED"
+    assert execution.error == "States.Runtime"
+    assert "GetResourceConfigComplianceFinal" in execution.cause
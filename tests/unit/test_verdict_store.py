@@ -0,0 +1,177 @@
+import json
+
+import boto3
+import pytest
+from botocore.stub import ANY, Stubber
+
+from tests.lambdas import load_lambda
+from cb_runtime import metrics, verdict_store
+
+NOTIFICATION_CREATION_TIME = "2022-06-01T17:22:43.213Z"
+
+KEY = {"ConfigRuleName": "rule", "ResourceKey": "AWS::SQS::Queue/queue"}
+
+
+@pytest.fixture
+def ddb():
+    return boto3.resource("dynamodb")
+
+
+@pytest.fixture
+def store(ddb):
+    clock = lambda: verdict_store.timestamp(NOTIFICATION_CREATION_TIME) + 1.5
+    return verdict_store.VerdictStore(table_name="ComplianceVerdicts", policy_version="0.10.0", ddb=ddb, clock=clock)
+
+
+def record(store, compliance_type="COMPLIANT"):
+    return store.record(
+        config_rule_name="rule",
+        resource_type="AWS::SQS::Queue",
+        resource_id="queue",
+        compliance_type=compliance_type,
+        notification_creation_time=NOTIFICATION_CREATION_TIME,
+    )
+
+
+def test_same_verdict_is_refreshed_without_a_transition(store, ddb):
+    with Stubber(ddb.meta.client) as table, metrics.capture() as emitted:
+        table.add_response("update_item", {}, {
+            "TableName": "ComplianceVerdicts",
+            "Key": KEY,
+            "UpdateExpression": ANY,
+            "ConditionExpression": "#ComplianceType = :ComplianceType",
+            "ExpressionAttributeNames": ANY,
+            "ExpressionAttributeValues": {
+                ":ResourceType": "AWS::SQS::Queue",
+                ":ResourceId": "queue",
+                ":ComplianceType": "COMPLIANT",
+                ":EvaluatedAt": "2022-06-01T17:22:44.713Z",
+                ":PolicyVersion": "0.10.0",
+                ":LatencyMs": 1500,
+                ":Transition": False,
+            },
+        })
+
+        assert record(store) is False
+
+        table.assert_no_pending_responses()
+
+    assert emitted[0]["VerdictLatency"] == 1500
+
+
+def test_changed_verdict_is_a_transition_from_the_previous_one(store, ddb):
+    updates = []
+    ddb.meta.client.meta.events.register("provide-client-params.dynamodb.UpdateItem", lambda params, **kwargs: updates.append(params))
+
+    with Stubber(ddb.meta.client) as table:
+        table.add_client_error("update_item", "ConditionalCheckFailedException")
+        table.add_response("update_item", {})
+
+        assert record(store, "NON_COMPLIANT") is True
+
+    transition = updates[1]
+    assert "#PreviousComplianceType = if_not_exists(#ComplianceType, :NoVerdict)" in transition["UpdateExpression"]
+    assert transition["ConditionExpression"] == "attribute_not_exists(#ComplianceType) OR #ComplianceType <> :ComplianceType"
+    assert transition["ExpressionAttributeValues"][":Transition"] is True
+    assert transition["ExpressionAttributeValues"][":ChangedAt"] == "2022-06-01T17:22:44.713Z"
+
+
+def test_concurrent_write_of_the_same_verdict_is_no_transition(store, ddb):
+    with Stubber(ddb.meta.client) as table:
+        table.add_client_error("update_item", "ConditionalCheckFailedException")
+        table.add_client_error("update_item", "ConditionalCheckFailedException")
+
+        assert record(store, "NON_COMPLIANT") is False
+
+
+def test_errors_are_logged_not_raised(store, ddb):
+    with Stubber(ddb.meta.client) as table:
+        table.add_client_error("update_item", "ProvisionedThroughputExceededException")
+
+        assert record(store) is None
+
+
+def test_put_evaluations_records_only_what_config_accepted(ddb):
+    put_evaluations = load_lambda("put_evaluations")
+    put_evaluations.verdicts = verdict_store.VerdictStore(table_name="ComplianceVerdicts", ddb=ddb)
+    compliances = [
+        put_evaluations.ConfigCompliance(
+            ResourceType="AWS::SQS::Queue",
+            ResourceId=f"queue-{i}",
+            ResultToken="token",
+            Compliant=True,
+            ConfigRuleName="rule",
+            NotificationCreationTime=NOTIFICATION_CREATION_TIME,
+        )
+        for i in range(2)
+    ]
+
+    with Stubber(put_evaluations.config) as config, Stubber(ddb.meta.client) as table:
+        config.add_response("put_evaluations", {"FailedEvaluations": [compliances[1].evaluation()]})
+        table.add_response("update_item", {}, {
+            "TableName": "ComplianceVerdicts",
+            "Key": {"ConfigRuleName": "rule", "ResourceKey": "AWS::SQS::Queue/queue-0"},
+            "UpdateExpression": ANY,
+            "ConditionExpression": ANY,
+            "ExpressionAttributeNames": ANY,
+            "ExpressionAttributeValues": ANY,
+        })
+
+        assert len(put_evaluations.put_evaluations_batch(compliances)) == 1
+
+        table.assert_no_pending_responses()
+
+
+def stream_record(sequence_number, transition, compliance_type="NON_COMPLIANT"):
+    return {
+        "eventName": "MODIFY",
+        "dynamodb": {
+            "SequenceNumber": sequence_number,
+            "NewImage": {
+                "ConfigRuleName": {"S": "rule"},
+                "ResourceKey": {"S": "AWS::SQS::Queue/queue"},
+                "ResourceType": {"S": "AWS::SQS::Queue"},
+                "ResourceId": {"S": "queue"},
+                "ComplianceType": {"S": compliance_type},
+                "PreviousComplianceType": {"S": "COMPLIANT"},
+                "ChangedAt": {"S": "2022-06-01T17:22:44.713Z"},
+                "LatencyMs": {"N": "1500"},
+                "Transition": {"BOOL": transition},
+            },
+        },
+    }
+
+
+def test_change_feed_publishes_only_transitions():
+    verdict_changes = load_lambda("verdict_changes")
+    records = [stream_record(str(i), transition=i % 2 == 0) for i in range(24)]
+
+    with Stubber(verdict_changes.events) as events, metrics.capture() as emitted:
+        events.add_response("put_events", {"FailedEntryCount": 0, "Entries": [{"EventId": "e"}] * 10})
+        events.add_response("put_events", {"FailedEntryCount": 1, "Entries": [{"EventId": "e"}, {"ErrorCode": "InternalFailure"}]})
+
+        assert verdict_changes.lambda_handler({"Records": records}, None) == {
+            "batchItemFailures": [{"itemIdentifier": "22"}],
+        }
+
+        events.assert_no_pending_responses()
+
+    assert emitted[0]["VerdictTransitions"] == 11
+
+
+def test_change_event_detail():
+    verdict_changes = load_lambda("verdict_changes")
+
+    entry = verdict_changes.change_entry(verdict_changes.new_verdict(stream_record("1", transition=True)))
+
+    assert entry["Source"] == "control-broker.config-consumer"
+    assert entry["DetailType"] == "Compliance Verdict Changed"
+    assert json.loads(entry["Detail"]) == {
+        "ConfigRuleName": "rule",
+        "ResourceType": "AWS::SQS::Queue",
+        "ResourceId": "queue",
+        "ComplianceType": "NON_COMPLIANT",
+        "PreviousComplianceType": "COMPLIANT",
+        "ChangedAt": "2022-06-01T17:22:44.713Z",
+        "LatencyMs": 1500,
+    }
@@ -0,0 +1,362 @@
+"""Re-evaluate every resource in the scope of a Config rule, without waiting for a configuration change.
+
+Lists the resources of the rule's ComplianceResourceTypes, reads their current configuration items, synthesizes
+the Config event the rule's lambda would receive for each, and pushes the events through the evaluation path on a
+thread pool:
+
+control-broker: sign and POST to Control Broker only, the evaluation itself
+state-machine:  StartExecution of the ConfigEventProcessing state machine
+pipeline:       synchronous Invoke of the Lambdalith EvaluationPipeline lambda
+simulated:      sleep for --simulated-latency, for load tests of the sweep itself
+
+Submissions are rate limited by a token bucket. Every finished resource is appended to the --checkpoint file, and a
+rerun with the same file skips them. A throughput and latency report is printed at the end.
+
+Config records evaluations only for the result token of an event it delivered itself. Synthesized events carry
+--result-token, TESTMODE by default, which PutEvaluations accepts without recording anything. To record the
+verdicts of a sweep, have Config deliver the events with StartConfigRulesEvaluation instead.
+
+    python -m tools.reevaluate_resources --config-rule-name CBConsumerConfig-SQSPoC... \\
+        --target control-broker --invoke-url https://MY_API_ID.execute-api.us-east-1.amazonaws.com/ConfigEvent \\
+        --workers 16 --rate 10 --checkpoint reevaluation.jsonl
+
+Offline, against recorded Config responses and a simulated evaluation:
+
+    python -m tools.reevaluate_resources --fixtures tests/fixtures/reevaluation --repeat 1000 \\
+        --target simulated --workers 64 --rate 500
+"""
+import argparse
+import json
+import os
+import pathlib
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import boto3
+
+from utils import paths
+from utils.stats import percentile
+
+sys.path.append(str(paths.LAMBDA_LAYERS / "cb_runtime"))
+
+from cb_runtime import config_events  # noqa: E402
+
+# BatchGetResourceConfig accepts at most 100 resource keys
+MAX_RESOURCE_KEYS = 100
+
+
+class TokenBucket:
+    """At most `rate` acquisitions per second on average, `burst` at once."""
+
+    def __init__(self, *, rate, burst=None, clock=time.monotonic, sleep=time.sleep):
+        self.rate = rate
+        self.capacity = burst or max(1, rate)
+        self.tokens = self.capacity
+        self.clock = clock
+        self.sleep = sleep
+        self.updated = clock()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = self.clock()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            self.sleep(wait)
+
+
+class Checkpoint:
+    """Append-only JSON lines of finished resources, read back on resume."""
+
+    def __init__(self, path):
+        self.path = pathlib.Path(path) if path else None
+        self.done = set()
+        self.lock = threading.Lock()
+        if self.path and self.path.exists():
+            with open(self.path) as f:
+                for line in f:
+                    if line.strip():
+                        record = json.loads(line)
+                        if record["Succeeded"]:
+                            self.done.add(record["ResourceKey"])
+
+    def record(self, resource_key, *, succeeded, latency):
+        if not self.path:
+            return
+        latency = None if latency is None else round(latency, 6)
+        line = json.dumps({"ResourceKey": resource_key, "Succeeded": succeeded, "LatencySeconds": latency})
+        with self.lock, open(self.path, "a") as f:
+            f.write(line + "\n")
+
+
+def resource_key(resource_type, resource_id):
+    return f"{resource_type}|{resource_id}"
+
+
+def describe_config_rule(config, config_rule_name):
+    return config.describe_config_rules(ConfigRuleNames=[config_rule_name])["ConfigRules"][0]
+
+
+def list_scoped_resources(config, config_rule):
+    for resource_type in config_rule["Scope"]["ComplianceResourceTypes"]:
+        kwargs = {}
+        while True:
+            r = config.list_discovered_resources(resourceType=resource_type, **kwargs)
+            for i in r["resourceIdentifiers"]:
+                yield {"resourceType": i["resourceType"], "resourceId": i["resourceId"]}
+            if not r.get("nextToken"):
+                break
+            kwargs["nextToken"] = r["nextToken"]
+
+
+def configuration_items(config, resource_keys, *, max_attempts=5, unprocessed=None):
+    # unprocessed keys are throttled ones, retried in the next call, and appended to unprocessed after max_attempts
+    for i in range(0, len(resource_keys), MAX_RESOURCE_KEYS):
+        keys = resource_keys[i:i + MAX_RESOURCE_KEYS]
+        for attempt in range(max_attempts):
+            r = config.batch_get_resource_config(resourceKeys=keys)
+            for item in r["baseConfigurationItems"]:
+                yield config_events.configuration_item_from_history(item)
+            keys = r.get("unprocessedResourceKeys") or []
+            if not keys or attempt == max_attempts - 1:
+                break
+            time.sleep(0.1 * 2 ** attempt)
+        if unprocessed is not None:
+            unprocessed.extend(keys)
+
+
+def synthesize_config_event(*, config_rule, configuration_item, result_token, account_id=None):
+    # shaped like a ConfigurationItemChangeNotification for a custom lambda rule
+    return {
+        "version": "1.0",
+        "invokingEvent": json.dumps({
+            "configurationItemDiff": None,
+            "configurationItem": configuration_item,
+            "notificationCreationTime": datetime.now(timezone.utc).isoformat(),
+            "messageType": "ConfigurationItemChangeNotification",
+            "recordVersion": "1.3",
+        }),
+        "ruleParameters": config_rule.get("InputParameters", "{}"),
+        "resultToken": result_token,
+        "eventLeftScope": False,
+        "configRuleArn": config_rule["ConfigRuleArn"],
+        "configRuleName": config_rule["ConfigRuleName"],
+        "configRuleId": config_rule["ConfigRuleId"],
+        "accountId": account_id or configuration_item.get("awsAccountId"),
+    }
+
+
+class RecordedConfig:
+    """The Config reads of a sweep answered from recorded responses, --repeat times over with distinct ids."""
+
+    def __init__(self, fixtures, *, repeat=1):
+        fixtures = pathlib.Path(fixtures)
+        self.config_rules = json.loads((fixtures / "describe_config_rules.json").read_text())
+        self.pages = json.loads((fixtures / "list_discovered_resources.json").read_text())
+        self.repeat = repeat
+        items = json.loads((fixtures / "batch_get_resource_config.json").read_text())["baseConfigurationItems"]
+        self.items = {}
+        for copy in range(repeat):
+            for item in items:
+                item = {**item, "resourceId": self.repeated(item["resourceId"], copy)}
+                self.items[resource_key(item["resourceType"], item["resourceId"])] = item
+
+    def repeated(self, resource_id, copy):
+        return resource_id if copy == 0 else f"{resource_id}#{copy}"
+
+    def describe_config_rules(self, ConfigRuleNames):
+        return self.config_rules
+
+    def list_discovered_resources(self, resourceType, nextToken=None):
+        pages = self.pages.get(resourceType, [])
+        index = int(nextToken) if nextToken else 0
+        copy, page = divmod(index, len(pages))
+        r = {
+            "resourceIdentifiers": [
+                {**i, "resourceId": self.repeated(i["resourceId"], copy)}
+                for i in pages[page]["resourceIdentifiers"]
+            ]
+        }
+        if index + 1 < len(pages) * self.repeat:
+            r["nextToken"] = str(index + 1)
+        return r
+
+    def batch_get_resource_config(self, resourceKeys):
+        return {
+            "baseConfigurationItems": [self.items[resource_key(k["resourceType"], k["resourceId"])] for k in resourceKeys],
+            "unprocessedResourceKeys": [],
+        }
+
+
+def control_broker_target(invoke_url):
+    import requests
+    from cb_runtime import control_broker
+
+    host = invoke_url.split("/")[2]
+    region = boto3.session.Session().region_name
+    local = threading.local()
+
+    def evaluate(config_event):
+        if not hasattr(local, "http"):
+            local.http = requests.Session()
+        r = local.http.post(
+            invoke_url,
+            auth=control_broker.get_signer(host=host, region=region),
+            json=control_broker.cb_input_object(config_event),
+        )
+        return r.status_code == 200
+
+    return evaluate
+
+
+def state_machine_target(state_machine_arn):
+    sfn = boto3.client("stepfunctions")
+
+    def evaluate(config_event):
+        sfn.start_execution(stateMachineArn=state_machine_arn, input=json.dumps(config_event))
+        return True
+
+    return evaluate
+
+
+def pipeline_target(function_name):
+    awslambda = boto3.client("lambda")
+
+    def evaluate(config_event):
+        r = awslambda.invoke(FunctionName=function_name, Payload=json.dumps(config_event))
+        return "FunctionError" not in r
+
+    return evaluate
+
+
+def simulated_target(latency):
+
+    def evaluate(config_event):
+        time.sleep(latency)
+        return True
+
+    return evaluate
+
+
+def sweep(*, config, config_rule_name, evaluate, workers, bucket, checkpoint, result_token, limit=None):
+    """Evaluate every resource in scope not yet in the checkpoint, returning (key, succeeded, latency) per resource.
+
+    Resources whose configuration item could not be read are failed with a latency of None.
+    """
+
+    config_rule = describe_config_rule(config, config_rule_name)
+
+    resource_keys = [
+        k for k in list_scoped_resources(config, config_rule)
+        if resource_key(k["resourceType"], k["resourceId"]) not in checkpoint.done
+    ][:limit]
+
+    print(f"{len(resource_keys)} resources to evaluate, {len(checkpoint.done)} already done", file=sys.stderr)
+
+    def evaluate_one(configuration_item):
+        key = resource_key(configuration_item["resourceType"], configuration_item["resourceId"])
+        config_event = synthesize_config_event(
+            config_rule=config_rule,
+            configuration_item=configuration_item,
+            result_token=result_token,
+        )
+        start = time.perf_counter()
+        try:
+            succeeded = bool(evaluate(config_event))
+        except Exception as e:
+            print(f"{key}\n{type(e).__name__}\n{e}", file=sys.stderr)
+            succeeded = False
+        latency = time.perf_counter() - start
+        checkpoint.record(key, succeeded=succeeded, latency=latency)
+        return key, succeeded, latency
+
+    unprocessed = []
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = []
+        for configuration_item in configuration_items(config, resource_keys, unprocessed=unprocessed):
+            # submission is rate limited, the pool bounds concurrency
+            bucket.acquire()
+            futures.append(pool.submit(evaluate_one, configuration_item))
+        results = [f.result() for f in futures]
+
+    # still throttled after the retries, so failed without a latency, and evaluated again on resume
+    for k in unprocessed:
+        key = resource_key(k["resourceType"], k["resourceId"])
+        print(f"{key}\nconfiguration item not read", file=sys.stderr)
+        checkpoint.record(key, succeeded=False, latency=None)
+        results.append((key, False, None))
+    return results
+
+
+def report(results, seconds):
+    latencies = [latency * 1000 for _, _, latency in results if latency is not None]
+    succeeded = sum(1 for _, ok, _ in results if ok)
+    print(f"evaluated {len(results)} resources in {seconds:.2f} s, {len(results) / seconds if seconds else 0:.1f} resources/s")
+    print(f"succeeded {succeeded}  failed {len(results) - succeeded}")
+    if latencies:
+        print(
+            f"latency p50 {percentile(latencies, 50):.1f} ms  p90 {percentile(latencies, 90):.1f} ms  "
+            f"p99 {percentile(latencies, 99):.1f} ms  mean {statistics.mean(latencies):.1f} ms"
+        )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--config-rule-name", help="defaults to the rule of the --fixtures")
+    parser.add_argument("--target", choices=["control-broker", "state-machine", "pipeline", "simulated"], default="control-broker")
+    parser.add_argument("--invoke-url", default=os.environ.get("ControlBrokerInvokeUrl"))
+    parser.add_argument("--state-machine-arn")
+    parser.add_argument("--function-name")
+    parser.add_argument("--simulated-latency", type=float, default=0.05)
+    parser.add_argument("--workers", type=int, default=16)
+    parser.add_argument("--rate", type=float, default=10, help="evaluations started per second")
+    parser.add_argument("--burst", type=int)
+    parser.add_argument("--checkpoint", help="JSON lines of finished resources, skipped when resuming")
+    parser.add_argument("--result-token", default="TESTMODE")
+    parser.add_argument("--limit", type=int)
+    parser.add_argument("--fixtures", help="directory of recorded Config responses, instead of calling Config")
+    parser.add_argument("--repeat", type=int, default=1, help="copies of the recorded resources")
+    args = parser.parse_args(argv)
+
+    if args.fixtures:
+        config = RecordedConfig(args.fixtures, repeat=args.repeat)
+        config_rule_name = args.config_rule_name or config.config_rules["ConfigRules"][0]["ConfigRuleName"]
+    else:
+        config = boto3.client("config")
+        config_rule_name = args.config_rule_name
+        if not config_rule_name:
+            parser.error("--config-rule-name is required without --fixtures")
+
+    evaluate = {
+        "control-broker": lambda: control_broker_target(args.invoke_url),
+        "state-machine": lambda: state_machine_target(args.state_machine_arn),
+        "pipeline": lambda: pipeline_target(args.function_name),
+        "simulated": lambda: simulated_target(args.simulated_latency),
+    }[args.target]()
+
+    start = time.perf_counter()
+    results = sweep(
+        config=config,
+        config_rule_name=config_rule_name,
+        evaluate=evaluate,
+        workers=args.workers,
+        bucket=TokenBucket(rate=args.rate, burst=args.burst),
+        checkpoint=Checkpoint(args.checkpoint),
+        result_token=args.result_token,
+        limit=args.limit,
+    )
+    report(results, time.perf_counter() - start)
+    return results
+
+
+if __name__ == "__main__":
+    main()
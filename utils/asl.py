@@ -0,0 +1,623 @@
+"""A local, in-process interpreter of the Amazon States Language subset used by the ConfigEventProcessing definitions.
+
+States run the Python handlers the Task resources stand for instead of invoking Lambda. InputPath, Parameters,
+ResultSelector, ResultPath and OutputPath are applied as Step Functions applies them, Retry and Catch match errors
+by the class name of the exception raised, the way Lambda reports errorType, and every state entered is recorded
+with its duration in the execution's history:
+
+    execution = asl.Execution(
+        definition,
+        tasks={sign_apigw_request_function_name: sign_apigw_request.lambda_handler, ...},
+    ).run(config_event)
+    execution.status, execution.output, execution.history
+
+Supported: Pass, Task (lambda:invoke and lambda:invoke.waitForTaskToken), Choice, Map, Succeed and Fail (with a Cause
+or a CausePath);
+JSONPaths of dotted fields and list indexes on the input ($) and the context object ($$); and the intrinsic
+functions States.StringToJson, States.JsonToString, States.Format, States.Array and States.ArrayContains.
+
+validate(definition) checks a definition without running it, returning one message per problem: transitions to
+missing or from unreachable states, states that neither end nor move on, malformed JSONPaths and unsupported
+intrinsic functions, resources or state types.
+"""
+import json
+import re
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+LAMBDA_INVOKE = "arn:aws:states:::lambda:invoke"
+LAMBDA_INVOKE_WAIT_FOR_TASK_TOKEN = "arn:aws:states:::lambda:invoke.waitForTaskToken"
+
+TERMINAL_ERRORS = ("States.Runtime", "States.DataLimitExceeded")
+
+
+class StatesError(Exception):
+    """An error raised inside the execution, matched by Retry and Catch on its name."""
+
+    def __init__(self, error, cause=None):
+        super().__init__(f"{error}: {cause}" if cause else error)
+        self.error = error
+        self.cause = cause
+
+
+def error_name(e):
+    return e.error if isinstance(e, StatesError) else type(e).__name__
+
+
+def matches(error_equals, error):
+    # runtime errors, such as a path missing from the input, end the execution whatever the Catch
+    if error in TERMINAL_ERRORS:
+        return False
+    if "States.ALL" in error_equals:
+        return True
+    if "States.TaskFailed" in error_equals and error != "States.Timeout":
+        return True
+    return error in error_equals
+
+
+# JSONPath
+
+
+PATH_TOKEN = re.compile(r"\.([^.\[\]]+)|\[(\d+)\]")
+
+
+def path_segments(path):
+    if not path.startswith("$"):
+        raise StatesError("States.Runtime", f"invalid path {path}")
+    if path in ("$", "$$"):
+        return []
+    root = "$$" if path.startswith("$$") else "$"
+    rest = path[len(root):]
+    segments, position = [], 0
+    for m in PATH_TOKEN.finditer(rest):
+        if m.start() != position:
+            raise StatesError("States.Runtime", f"invalid path {path}")
+        segments.append(m.group(1) if m.group(1) is not None else int(m.group(2)))
+        position = m.end()
+    if position != len(rest):
+        raise StatesError("States.Runtime", f"invalid path {path}")
+    return segments
+
+
+def get_path(document, path, context=None):
+    value = context if path.startswith("$$") else document
+    for segment in path_segments(path):
+        try:
+            value = value[segment]
+        except (KeyError, IndexError, TypeError):
+            raise StatesError("States.Runtime", f"path {path} not found in the input") from None
+    return value
+
+
+def set_path(document, path, value):
+    """A copy of document with value at path, ResultPath style."""
+    if path is None:
+        return document
+    segments = path_segments(path)
+    if not segments:
+        return value
+    document = dict(document) if isinstance(document, dict) else {}
+    parent = document
+    for segment in segments[:-1]:
+        child = parent.get(segment)
+        parent[segment] = dict(child) if isinstance(child, dict) else {}
+        parent = parent[segment]
+    parent[segments[-1]] = value
+    return document
+
+
+# intrinsic functions
+
+
+INTRINSIC = re.compile(r"^(States\.\w+)\((.*)\)$", re.DOTALL)
+
+
+def split_arguments(arguments):
+    # commas inside quotes or nested calls do not separate arguments
+    parts, depth, quoted, current = [], 0, False, ""
+    i = 0
+    while i < len(arguments):
+        c = arguments[i]
+        if c == "\\" and quoted:
+            current += arguments[i:i + 2]
+            i += 2
+            continue
+        if c == "'":
+            quoted = not quoted
+        elif not quoted and c == "(":
+            depth += 1
+        elif not quoted and c == ")":
+            depth -= 1
+        elif not quoted and depth == 0 and c == ",":
+            parts.append(current.strip())
+            current = ""
+            i += 1
+            continue
+        current += c
+        i += 1
+    if current.strip():
+        parts.append(current.strip())
+    return parts
+
+
+def evaluate_argument(argument, document, context):
+    if argument.startswith("$"):
+        return get_path(document, argument, context)
+    if argument.startswith("States."):
+        return evaluate_intrinsic(argument, document, context)
+    if argument.startswith("'") and argument.endswith("'"):
+        return re.sub(r"\\(.)", r"\1", argument[1:-1])
+    return json.loads(argument)
+
+
+def evaluate_intrinsic(expression, document, context):
+    m = INTRINSIC.match(expression.strip())
+    if not m:
+        raise StatesError("States.Runtime", f"invalid intrinsic function {expression}")
+    name = m.group(1)
+    if name not in INTRINSICS:
+        raise StatesError("States.Runtime", f"unsupported intrinsic function {name}")
+    arguments = [evaluate_argument(a, document, context) for a in split_arguments(m.group(2))]
+    try:
+        return INTRINSICS[name](*arguments)
+    except StatesError:
+        raise
+    except Exception as e:
+        raise StatesError("States.Runtime", f"{name}: {e}") from None
+
+
+def states_format(template, *arguments):
+    parts = re.split(r"(?<!\\)\{\}", template)
+    if len(parts) - 1 != len(arguments):
+        raise StatesError("States.Runtime", "States.Format argument count does not match the template")
+    formatted = parts[0]
+    for argument, part in zip(arguments, parts[1:]):
+        formatted += (argument if isinstance(argument, str) else json.dumps(argument)) + part
+    return formatted
+
+
+INTRINSICS = {
+    "States.StringToJson": json.loads,
+    "States.JsonToString": lambda value: json.dumps(value, separators=(",", ":")),
+    "States.Format": states_format,
+    "States.Array": lambda *values: list(values),
+    "States.ArrayContains": lambda array, value: value in array,
+}
+
+
+def apply_parameters(template, document, context):
+    """Parameters and ResultSelector: keys ending in .$ take a path or an intrinsic function."""
+    if isinstance(template, dict):
+        resolved = {}
+        for key, value in template.items():
+            if key.endswith(".$"):
+                if not isinstance(value, str):
+                    raise StatesError("States.Runtime", f"{key} must be a path or an intrinsic function")
+                if value.startswith("States."):
+                    resolved[key[:-2]] = evaluate_intrinsic(value, document, context)
+                else:
+                    resolved[key[:-2]] = get_path(document, value, context)
+            else:
+                resolved[key] = apply_parameters(value, document, context)
+        return resolved
+    if isinstance(template, list):
+        return [apply_parameters(value, document, context) for value in template]
+    return template
+
+
+# Choice rules
+
+
+COMPARISONS = {
+    "StringEquals": lambda a, b: isinstance(a, str) and a == b,
+    "StringLessThan": lambda a, b: isinstance(a, str) and a < b,
+    "StringGreaterThan": lambda a, b: isinstance(a, str) and a > b,
+    "NumericEquals": lambda a, b: isinstance(a, (int, float)) and not isinstance(a, bool) and a == b,
+    "NumericLessThan": lambda a, b: isinstance(a, (int, float)) and not isinstance(a, bool) and a < b,
+    "NumericLessThanEquals": lambda a, b: isinstance(a, (int, float)) and not isinstance(a, bool) and a <= b,
+    "NumericGreaterThan": lambda a, b: isinstance(a, (int, float)) and not isinstance(a, bool) and a > b,
+    "NumericGreaterThanEquals": lambda a, b: isinstance(a, (int, float)) and not isinstance(a, bool) and a >= b,
+    "BooleanEquals": lambda a, b: isinstance(a, bool) and a == b,
+}
+
+TYPE_TESTS = {
+    "IsNull": lambda a: a is None,
+    "IsBoolean": lambda a: isinstance(a, bool),
+    "IsString": lambda a: isinstance(a, str),
+    "IsNumeric": lambda a: isinstance(a, (int, float)) and not isinstance(a, bool),
+}
+
+MISSING = object()
+
+
+def choice_matches(rule, document, context):
+    if "And" in rule:
+        return all(choice_matches(r, document, context) for r in rule["And"])
+    if "Or" in rule:
+        return any(choice_matches(r, document, context) for r in rule["Or"])
+    if "Not" in rule:
+        return not choice_matches(rule["Not"], document, context)
+
+    try:
+        value = get_path(document, rule["Variable"], context)
+    except StatesError:
+        value = MISSING
+
+    if "IsPresent" in rule:
+        return (value is not MISSING) == rule["IsPresent"]
+    if value is MISSING:
+        raise StatesError("States.Runtime", f'Invalid path {rule["Variable"]}: the choice state could not find it')
+
+    for operator, test in TYPE_TESTS.items():
+        if operator in rule:
+            return test(value) == rule[operator]
+    for operator, compare in COMPARISONS.items():
+        if operator in rule:
+            return compare(value, rule[operator])
+        if f"{operator}Path" in rule:
+            return compare(value, get_path(document, rule[f"{operator}Path"], context))
+    raise StatesError("States.Runtime", f"unsupported choice rule {sorted(rule)}")
+
+
+# validation
+
+
+STATE_TYPES = ("Pass", "Task", "Choice", "Map", "Succeed", "Fail")
+
+PATH_FIELDS = ("InputPath", "OutputPath", "ResultPath", "ItemsPath")
+
+
+def validate_path(path):
+    try:
+        path_segments(path)
+    except StatesError as e:
+        return [e.cause]
+    return []
+
+
+def validate_intrinsic(expression):
+    m = INTRINSIC.match(expression.strip())
+    if not m:
+        return [f"invalid intrinsic function {expression}"]
+    if m.group(1) not in INTRINSICS:
+        return [f"unsupported intrinsic function {m.group(1)}"]
+    problems = []
+    for argument in split_arguments(m.group(2)):
+        if argument.startswith("$"):
+            problems += validate_path(argument)
+        elif argument.startswith("States."):
+            problems += validate_intrinsic(argument)
+    return problems
+
+
+def validate_template(template):
+    problems = []
+    if isinstance(template, dict):
+        for key, value in template.items():
+            if key.endswith(".$"):
+                if not isinstance(value, str):
+                    problems.append(f"{key} must be a path or an intrinsic function")
+                elif value.startswith("States."):
+                    problems += validate_intrinsic(value)
+                else:
+                    problems += validate_path(value)
+            else:
+                problems += validate_template(value)
+    elif isinstance(template, list):
+        for value in template:
+            problems += validate_template(value)
+    return problems
+
+
+def validate_rule(rule):
+    if "And" in rule or "Or" in rule:
+        return [p for r in rule.get("And", rule.get("Or")) for p in validate_rule(r)]
+    if "Not" in rule:
+        return validate_rule(rule["Not"])
+    if "Variable" not in rule:
+        return ["choice rule without a Variable"]
+    problems = validate_path(rule["Variable"])
+    operators = [o for o in (*COMPARISONS, *TYPE_TESTS, "IsPresent") if o in rule]
+    operators += [f"{o}Path" for o in COMPARISONS if f"{o}Path" in rule]
+    if len(operators) != 1:
+        problems.append(f'choice rule on {rule["Variable"]} needs exactly one supported comparison')
+    for operator in operators:
+        if operator.endswith("Path"):
+            problems += validate_path(rule[operator])
+    return problems
+
+
+def validate_errors(name, field, handlers):
+    problems = []
+    for i, handler in enumerate(handlers):
+        errors = handler.get("ErrorEquals")
+        if not errors:
+            problems.append(f"{name}: {field} without ErrorEquals")
+        elif "States.ALL" in errors and (len(errors) > 1 or i != len(handlers) - 1):
+            problems.append(f"{name}: States.ALL must be alone in the last {field}")
+    return problems
+
+
+def state_names(definition):
+    """Names of the states of definition and of its Map iterators, which share one namespace."""
+    for name, state in definition.get("States", {}).items():
+        yield name
+        iterator = state.get("Iterator") or state.get("ItemProcessor")
+        if state.get("Type") == "Map" and iterator:
+            yield from state_names(iterator)
+
+
+def validate(definition, prefix=""):
+    """Problems of definition, empty when it is fit to run."""
+    states = definition.get("States", {})
+    if definition.get("StartAt") not in states:
+        return [f'{prefix}StartAt {definition.get("StartAt")} is not a state']
+
+    problems = []
+
+    if not prefix:
+        # Step Functions rejects a name used twice anywhere in the machine with DUPLICATE_STATE_NAME
+        seen = set()
+        for name in state_names(definition):
+            if name in seen:
+                problems.append(f"{name}: duplicate state name")
+            seen.add(name)
+    transitions = {}
+
+    for name, state in states.items():
+        where = f"{prefix}{name}"
+        kind = state.get("Type")
+        if kind not in STATE_TYPES:
+            problems.append(f"{where}: unsupported state type {kind}")
+            continue
+
+        targets = [state.get("Next"), state.get("Default")]
+        targets += [rule.get("Next") for rule in state.get("Choices", [])]
+        targets += [catcher.get("Next") for catcher in state.get("Catch", [])]
+        transitions[name] = [t for t in targets if t]
+        for target in transitions[name]:
+            if target not in states:
+                problems.append(f"{where}: transitions to missing state {target}")
+
+        if kind == "Choice":
+            if not state.get("Choices"):
+                problems.append(f"{where}: Choice without Choices")
+            for rule in state.get("Choices", []):
+                if "Next" not in rule:
+                    problems.append(f"{where}: choice rule without Next")
+                problems += [f"{where}: {p}" for p in validate_rule(rule)]
+        elif kind not in ("Succeed", "Fail"):
+            if bool(state.get("End")) == bool(state.get("Next")):
+                problems.append(f"{where}: needs either End or Next")
+
+        if kind == "Task" and state.get("Resource") not in (LAMBDA_INVOKE, LAMBDA_INVOKE_WAIT_FOR_TASK_TOKEN):
+            problems.append(f'{where}: unsupported resource {state.get("Resource")}')
+        if kind == "Task" and "FunctionName" not in state.get("Parameters", {}):
+            problems.append(f"{where}: Task without a FunctionName")
+
+        for field in PATH_FIELDS:
+            if state.get(field) is not None:
+                problems += [f"{where}: {p}" for p in validate_path(state[field])]
+        if kind == "Fail" and state.get("CausePath") is not None:
+            cause_path = state["CausePath"]
+            validate_cause = validate_intrinsic if cause_path.startswith("States.") else validate_path
+            problems += [f"{where}: {p}" for p in validate_cause(cause_path)]
+        for field in ("Parameters", "ResultSelector", "ItemSelector"):
+            problems += [f"{where}: {p}" for p in validate_template(state.get(field))]
+        problems += validate_errors(where, "Retry", state.get("Retry", []))
+        problems += validate_errors(where, "Catch", state.get("Catch", []))
+
+        if kind == "Map":
+            iterator = state.get("Iterator") or state.get("ItemProcessor")
+            if not iterator:
+                problems.append(f"{where}: Map without an Iterator")
+            else:
+                problems += validate(iterator, prefix=f"{where}.")
+
+    reachable, pending = set(), [definition["StartAt"]]
+    while pending:
+        name = pending.pop()
+        if name in reachable or name not in states:
+            continue
+        reachable.add(name)
+        pending += transitions.get(name, [])
+    for name in states:
+        if name not in reachable:
+            problems.append(f"{prefix}{name}: unreachable from {definition['StartAt']}")
+
+    return problems
+
+
+# execution
+
+
+class Execution:
+    """One execution of definition, with tasks mapping each Task's FunctionName to a handler(event, context)."""
+
+    def __init__(self, definition, *, tasks, sleep=time.sleep, time_scale=1.0, name=None):
+        self.definition = definition
+        self.tasks = tasks
+        self.sleep = sleep
+        self.time_scale = time_scale
+        self.name = name or str(uuid.uuid4())
+        self.history = []
+        self.lock = threading.Lock()
+        self.task_tokens = {}
+        self.status = None
+        self.output = None
+        self.error = None
+        self.cause = None
+
+    def send_task_success(self, task_token, output):
+        with self.lock:
+            self.task_tokens[task_token] = ("SUCCESS", output)
+
+    def send_task_failure(self, task_token, error, cause=None):
+        with self.lock:
+            self.task_tokens[task_token] = ("FAILURE", (error, cause))
+
+    def run(self, input):
+        context = {
+            "Execution": {"Id": self.name, "Input": input, "StartTime": time.time()},
+            "StateMachine": {"Id": "local"},
+        }
+        start = time.perf_counter()
+        try:
+            self.output = self.run_states(self.definition, input, context)
+        except StatesError as e:
+            self.status, self.error, self.cause = "FAILED", e.error, e.cause
+        else:
+            self.status = "SUCCEEDED"
+        self.seconds = time.perf_counter() - start
+        return self
+
+    def run_states(self, definition, document, context):
+        name = definition["StartAt"]
+        while True:
+            state = definition["States"][name]
+            start = time.perf_counter()
+            attempts = [0]
+            try:
+                document, next_name = self.run_state(name, state, document, {**context, "State": {"Name": name}}, attempts)
+            finally:
+                with self.lock:
+                    self.history.append({
+                        "State": name,
+                        "Type": state["Type"],
+                        "Seconds": time.perf_counter() - start,
+                        "Attempts": attempts[0],
+                    })
+            if next_name is None:
+                return document
+            name = next_name
+
+    def run_state(self, name, state, document, context, attempts):
+        kind = state["Type"]
+
+        if kind == "Succeed":
+            return self.filter_output(state, self.filter_input(state, document, context), context), None
+        if kind == "Fail":
+            cause = state.get("Cause")
+            if "CausePath" in state:
+                cause = evaluate_argument(state["CausePath"], document, context)
+            raise StatesError(state.get("Error", "States.Fail"), cause)
+        if kind == "Choice":
+            effective = self.filter_input(state, document, context)
+            for rule in state["Choices"]:
+                if choice_matches(rule, effective, context):
+                    return self.filter_output(state, effective, context), rule["Next"]
+            if "Default" not in state:
+                raise StatesError("States.NoChoiceMatched", f"no choice of {name} matched")
+            return self.filter_output(state, effective, context), state["Default"]
+
+        if state.get("Resource") == LAMBDA_INVOKE_WAIT_FOR_TASK_TOKEN:
+            context = {**context, "Task": {"Token": str(uuid.uuid4())}}
+
+        try:
+            effective = self.filter_input(state, document, context)
+            if kind == "Pass":
+                result = state["Result"] if "Result" in state else effective
+            elif kind == "Task":
+                result = self.run_task_with_retry(state, effective, context, attempts)
+            elif kind == "Map":
+                result = self.run_map(state, effective, context)
+            else:
+                raise StatesError("States.Runtime", f"unsupported state type {kind}")
+            if "ResultSelector" in state:
+                result = apply_parameters(state["ResultSelector"], result, context)
+            output = set_path(document, state.get("ResultPath", "$"), result)
+            output = self.filter_output(state, output, context)
+        except StatesError as e:
+            catcher = self.catcher(state, e.error)
+            if not catcher:
+                raise
+            error_output = {"Error": e.error, "Cause": e.cause}
+            return set_path(document, catcher.get("ResultPath", "$"), error_output), catcher["Next"]
+        except Exception as e:
+            catcher = self.catcher(state, error_name(e))
+            if not catcher:
+                raise StatesError(error_name(e), str(e)) from e
+            error_output = {"Error": error_name(e), "Cause": str(e)}
+            return set_path(document, catcher.get("ResultPath", "$"), error_output), catcher["Next"]
+
+        return output, (None if state.get("End") else state["Next"])
+
+    def filter_input(self, state, document, context):
+        if "InputPath" in state:
+            document = {} if state["InputPath"] is None else get_path(document, state["InputPath"], context)
+        # the Parameters of a Map state select each item, in run_map
+        if "Parameters" in state and state["Type"] != "Map":
+            document = apply_parameters(state["Parameters"], document, context)
+        return document
+
+    def filter_output(self, state, document, context):
+        if "OutputPath" in state:
+            return {} if state["OutputPath"] is None else get_path(document, state["OutputPath"], context)
+        return document
+
+    def catcher(self, state, error):
+        for catcher in state.get("Catch", []):
+            if matches(catcher["ErrorEquals"], error):
+                return catcher
+        return None
+
+    def run_task_with_retry(self, state, effective, context, attempts):
+        retries = [0] * len(state.get("Retry", []))
+        while True:
+            attempts[0] += 1
+            try:
+                return self.run_task(state, effective, context)
+            except Exception as e:
+                error = error_name(e)
+                for i, retrier in enumerate(state.get("Retry", [])):
+                    if matches(retrier["ErrorEquals"], error):
+                        break
+                else:
+                    raise
+                if retries[i] >= retrier.get("MaxAttempts", 3):
+                    raise
+                interval = retrier.get("IntervalSeconds", 1) * retrier.get("BackoffRate", 2.0) ** retries[i]
+                retries[i] += 1
+                self.sleep(interval * self.time_scale)
+
+    def run_task(self, state, effective, context):
+        resource = state["Resource"]
+        if resource not in (LAMBDA_INVOKE, LAMBDA_INVOKE_WAIT_FOR_TASK_TOKEN):
+            raise StatesError("States.Runtime", f"unsupported resource {resource}")
+
+        function_name = effective["FunctionName"]
+        if function_name not in self.tasks:
+            raise StatesError("States.Runtime", f"no handler for function {function_name}")
+        payload = json.loads(json.dumps(effective.get("Payload", {}), default=str))
+        result = self.tasks[function_name](payload, None)
+        # as returned through the Lambda invoke API
+        result = json.loads(json.dumps(result, default=str))
+
+        if resource == LAMBDA_INVOKE:
+            return {"ExecutedVersion": "$LATEST", "Payload": result, "StatusCode": 200}
+
+        # the token was sent back while the task ran, otherwise the wait would time out
+        with self.lock:
+            outcome = self.task_tokens.pop(context["Task"]["Token"], None)
+        if outcome is None:
+            raise StatesError("States.Timeout", f"no task token response within {state.get('TimeoutSeconds')} seconds")
+        status, value = outcome
+        if status == "FAILURE":
+            raise StatesError(*value)
+        return value if not isinstance(value, str) else json.loads(value)
+
+    def run_map(self, state, effective, context):
+        items = get_path(effective, state.get("ItemsPath", "$"), context)
+        iterator = state.get("Iterator") or state["ItemProcessor"]
+
+        def run_item(index, item):
+            item_context = {**context, "Map": {"Item": {"Index": index, "Value": item}}}
+            selector = state.get("ItemSelector", state.get("Parameters"))
+            document = apply_parameters(selector, effective, item_context) if selector is not None else item
+            return self.run_states(iterator, document, item_context)
+
+        max_concurrency = state.get("MaxConcurrency", 0) or len(items) or 1
+        with ThreadPoolExecutor(max_workers=max_concurrency) as pool:
+            return list(pool.map(run_item, range(len(items)), items))
@@ -0,0 +1,324 @@
+"""Build the Lambda layers of supplementary_files/lambda_layers, and find which of them each handler imports.
+
+A layer directory holds the packages it ships as source, such as cb_runtime, and a requirements.txt pinned by
+hash. Building it installs the requirements, strips what no handler imports (tests, dist-info, type stubs,
+extension sources, the CLI and optional backends of urllib3 and charset_normalizer), then precompiles every module.
+Lambda mounts layers read-only under /opt, so a module without a precompiled .pyc is compiled again on every cold
+start. The .pyc files use unchecked hashes, so they stay valid whatever timestamps the asset zip gives the sources.
+
+The stack runs the build in the Lambda Python bundling image, with this file mounted and nothing else imported:
+
+    python lambda_layers.py build /asset-input /asset-output
+
+function_layers() reads a handler's imports, following the cb_runtime modules and sibling handlers it loads, so each
+function gets only the layers whose packages it imports. report() builds the layers from the packages installed
+locally and prints each function's size, code and layers together, and the time its handler takes to import:
+
+    python -m utils.lambda_layers report
+"""
+import argparse
+import ast
+import compileall
+import hashlib
+import importlib.metadata
+import json
+import pathlib
+import py_compile
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+
+# the layer providing each package the handlers import, in the order functions list them;
+# any other import is the standard library or the runtime's boto3
+LAYER_PACKAGES = {
+    "cb_runtime": ["cb_runtime"],
+    "http": ["requests", "aws_requests_auth"],
+    "aiohttp": ["aiohttp"],
+}
+
+LAYERS = list(LAYER_PACKAGES)
+
+# removed from every built layer
+PRUNED = [
+    "*.dist-info",
+    "*.egg-info",
+    "bin",
+    "**/tests",
+    "**/test",
+    "**/__pycache__",
+    "**/*.pyi",
+    "**/py.typed",
+    "**/*.pyx",
+    "**/*.pxd",
+    "**/*.c",
+    "**/*.h",
+    # urllib3 backends requests only imports when they are asked for
+    "urllib3/contrib/socks.py",
+    "urllib3/contrib/pyopenssl.py",
+    "urllib3/contrib/securetransport.py",
+    "urllib3/contrib/_securetransport",
+    "urllib3/contrib/appengine.py",
+    "urllib3/contrib/ntlmpool.py",
+    "urllib3/contrib/emscripten",
+    # command line entry points
+    "charset_normalizer/cli",
+    "charset_normalizer/__main__.py",
+    "requests/help.py",
+]
+
+REQUIREMENT = re.compile(r"^([A-Za-z0-9_.\-]+)==([^\s;\\]+)")
+
+REQUIREMENT_NAME = re.compile(r"[A-Za-z0-9_.\-]+")
+
+# a sibling handler the evaluation pipeline imports from its own directory
+HANDLER_LOADER = "load_handler_module"
+
+
+def pinned_requirements(requirements):
+    """(name, version) of each requirement pinned in a requirements.txt"""
+    if not requirements.exists():
+        return []
+    return [m.groups() for m in map(REQUIREMENT.match, requirements.read_text().splitlines()) if m]
+
+
+def install(requirements, target):
+    subprocess.run(
+        [
+            sys.executable, "-m", "pip", "install",
+            "--require-hashes", "--no-deps", "--no-compile", "--no-cache-dir",
+            "--target", str(target),
+            "-r", str(requirements),
+        ],
+        check=True,
+    )
+
+
+def installed_distributions(names):
+    """The installed distributions of names and their dependencies, skipping extras and what is not installed"""
+    pending, found = list(names), {}
+    while pending:
+        name = REQUIREMENT_NAME.match(pending.pop()).group(0).lower().replace("_", "-")
+        if name in found:
+            continue
+        try:
+            found[name] = importlib.metadata.distribution(name)
+        except importlib.metadata.PackageNotFoundError:
+            continue
+        pending += [r for r in found[name].requires or [] if "extra ==" not in r]
+    return list(found.values())
+
+
+def copy_installed(requirements, target):
+    """Copy the distributions requirements pin from this interpreter's site-packages, at whatever version is there"""
+    for distribution in installed_distributions(name for name, _ in pinned_requirements(requirements)):
+        for file in distribution.files or []:
+            if file.parts[0] == "..":
+                continue
+            destination = target / file
+            destination.parent.mkdir(parents=True, exist_ok=True)
+            shutil.copyfile(distribution.locate_file(file), destination)
+
+
+def prune(python):
+    for pattern in PRUNED:
+        for path in sorted(python.glob(pattern), reverse=True):
+            if path.is_dir():
+                shutil.rmtree(path)
+            elif path.exists():
+                path.unlink()
+
+
+def precompile(python):
+    return compileall.compile_dir(
+        str(python),
+        quiet=1,
+        invalidation_mode=py_compile.PycInvalidationMode.UNCHECKED_HASH,
+    )
+
+
+def build(source, output, *, installed=False):
+    """Build the layer in directory source into output/python, returning its size in bytes.
+
+    installed copies the requirements from the local site-packages instead of installing them, for the report.
+    """
+    source, python = pathlib.Path(source), pathlib.Path(output) / "python"
+    python.mkdir(parents=True, exist_ok=True)
+
+    for package in source.iterdir():
+        if (package / "__init__.py").exists():
+            shutil.copytree(package, python / package.name, dirs_exist_ok=True)
+
+    requirements = source / "requirements.txt"
+    if pinned_requirements(requirements):
+        if installed:
+            copy_installed(requirements, python)
+        else:
+            install(requirements, python)
+
+    prune(python)
+    if not precompile(python):
+        raise RuntimeError(f"layer {source.name} does not compile")
+    return size(output)
+
+
+def size(directory):
+    return sum(path.stat().st_size for path in pathlib.Path(directory).rglob("*") if path.is_file())
+
+
+def source_hash(source):
+    """Asset hash of a layer: its sources, and this build"""
+    source = pathlib.Path(source)
+    digest = hashlib.sha256(pathlib.Path(__file__).read_bytes())
+    for path in sorted(source.rglob("*")):
+        if path.is_file() and "__pycache__" not in path.parts:
+            digest.update(str(path.relative_to(source)).encode())
+            digest.update(path.read_bytes())
+    return digest.hexdigest()
+
+
+def imports(path):
+    """Modules a source file imports, anywhere in it, and the sibling handlers it loads"""
+    for node in ast.walk(ast.parse(path.read_text(), str(path))):
+        if isinstance(node, ast.Import):
+            yield from (alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.level == 0:
+            yield node.module
+            yield from (f"{node.module}.{alias.name}" for alias in node.names)
+        elif (
+            isinstance(node, ast.Call)
+            and getattr(node.func, "id", None) == HANDLER_LOADER
+            and node.args
+            and isinstance(node.args[0], ast.Constant)
+        ):
+            yield f"{HANDLER_LOADER}:{node.args[0].value}"
+
+
+def module_source(module, lambda_layers):
+    """The layer source file of a module, if a layer ships it as source"""
+    for layer in LAYERS:
+        base = lambda_layers / layer / pathlib.Path(*module.split("."))
+        for path in (base.with_suffix(".py"), base / "__init__.py"):
+            if path.exists():
+                return path
+    return None
+
+
+def function_layers(function, *, lambda_functions, lambda_layers):
+    """Layers whose packages the handler in lambda_functions/function imports"""
+    lambda_functions, lambda_layers = pathlib.Path(lambda_functions), pathlib.Path(lambda_layers)
+
+    pending = [lambda_functions / function / "lambda_function.py"]
+    read, packages = set(), set()
+
+    while pending:
+        path = pending.pop()
+        if path in read:
+            continue
+        read.add(path)
+        for module in imports(path):
+            if module.startswith(f"{HANDLER_LOADER}:"):
+                pending.append(lambda_functions / module.split(":")[1] / "lambda_function.py")
+                continue
+            packages.add(module.split(".")[0])
+            source = module_source(module, lambda_layers)
+            if source:
+                pending.append(source)
+
+    return [layer for layer, provided in LAYER_PACKAGES.items() if packages & set(provided)]
+
+
+# runs in a fresh interpreter, with boto3 imported first as the runtime provides it, printing one JSON line;
+# bytecode is not written, as on Lambda's read-only file system
+PROBE = """
+import importlib.util, json, sys, time
+sys.dont_write_bytecode = True
+sys.path[:0] = {paths!r}
+import boto3
+modules = len(sys.modules)
+start = time.perf_counter()
+spec = importlib.util.spec_from_file_location("lambda_function", {handler!r})
+module = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(module)
+print(json.dumps({{"import": time.perf_counter() - start, "modules": len(sys.modules) - modules}}))
+"""
+
+
+def import_time(handler, layer_directories, *, trials):
+    """Median seconds to import a handler in a fresh interpreter with the built layers, and the modules it loads"""
+    code = PROBE.format(paths=[str(d / "python") for d in layer_directories], handler=str(handler))
+    runs = [
+        json.loads(subprocess.run(
+            [sys.executable, "-c", code], capture_output=True, text=True, check=True,
+        ).stdout.strip().splitlines()[-1])
+        for _ in range(trials)
+    ]
+    return sorted(r["import"] for r in runs)[len(runs) // 2], runs[0]["modules"]
+
+
+def report(functions, *, lambda_functions, lambda_layers, output, trials=3):
+    """Per function: its layers, code and layer bytes, and handler import time, with the layers built locally"""
+    lambda_functions, lambda_layers, output = map(pathlib.Path, (lambda_functions, lambda_layers, output))
+
+    built = {}
+    for layer in LAYERS:
+        built[layer] = build(lambda_layers / layer, output / layer, installed=True)
+
+    rows = {}
+    for function in functions:
+        layers = function_layers(function, lambda_functions=lambda_functions, lambda_layers=lambda_layers)
+        seconds, modules = import_time(
+            lambda_functions / function / "lambda_function.py",
+            [output / layer for layer in layers],
+            trials=trials,
+        )
+        rows[function] = {
+            "Layers": layers,
+            "CodeBytes": size(lambda_functions / function),
+            "LayerBytes": sum(built[layer] for layer in layers),
+            "ImportSeconds": seconds,
+            "ImportedModules": modules,
+        }
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    build_command = commands.add_parser("build", help="build one layer directory")
+    build_command.add_argument("source")
+    build_command.add_argument("output")
+    report_command = commands.add_parser("report", help="size and import time per function")
+    report_command.add_argument("functions", nargs="*")
+    report_command.add_argument("--trials", type=int, default=3)
+    args = parser.parse_args()
+
+    if args.command == "build":
+        print(f"{pathlib.Path(args.source).name}: {build(args.source, args.output)} bytes")
+        return
+
+    from utils import paths
+
+    functions = args.functions or sorted(
+        d.name for d in paths.LAMBDA_FUNCTIONS.iterdir()
+        if (d / "lambda_function.py").exists() and "cb_runtime" in set(imports(d / "lambda_function.py"))
+    )
+    with tempfile.TemporaryDirectory() as output:
+        rows = report(
+            functions,
+            lambda_functions=paths.LAMBDA_FUNCTIONS,
+            lambda_layers=paths.LAMBDA_LAYERS,
+            output=output,
+            trials=args.trials,
+        )
+    for function, row in rows.items():
+        print(
+            f"{function:<32}layers {','.join(row['Layers']):<24}"
+            f"code {row['CodeBytes'] / 1024:8.1f} KiB  layers {row['LayerBytes'] / 1024:8.1f} KiB  "
+            f"import {row['ImportSeconds'] * 1000:7.1f} ms  modules {row['ImportedModules']:4d}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -5,3 +5,9 @@ __THIS_FILE_DIR = pathlib.Path(__file__).parent
 REPO_ROOT = __THIS_FILE_DIR.parent
 
 LAMBDA_FUNCTIONS = REPO_ROOT / "supplementary_files/lambdas"
+
+LAMBDA_LAYERS = REPO_ROOT / "supplementary_files/lambda_layers"
+
+METRIC_DEFINITIONS = LAMBDA_LAYERS / "cb_runtime/cb_runtime/metric_definitions.json"
+
+PERFORMANCE_PROFILES = REPO_ROOT / "performance_profiles.json"
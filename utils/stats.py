@@ -0,0 +1,9 @@
+import math
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    if not ordered:
+        return float("nan")
+    index = max(0, math.ceil(p / 100 * len(ordered)) - 1)
+    return ordered[index]